@@ -0,0 +1,327 @@
+"""
+
+benchmarks for flim
+
+measures the throughput (items per second) and peak memory of the transform
+chain and LUT compilation, using the shipped presets as fixtures. results are
+printed as a table and saved as JSON, so that they can be compared across
+commits:
+
+python benchmark.py
+python benchmark.py --sizes 17 33 --backends batch parallel
+python benchmark.py --compare bench_results/<older run>.json
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import colour
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import flim
+from presets import all_presets
+from utils import *
+
+
+script_dir = os.path.realpath(os.path.dirname(__file__))
+
+
+# RGB triplets spread over the range that a LUT covers (with some blacks)
+def sample_triplets(count, seed=0):
+    rng = np.random.default_rng(seed)
+    out = 2. ** rng.uniform(-10., 10., (count, 3))
+    out[rng.uniform(size=(count, 3)) < .05] = 0.
+    return out
+
+
+# run fn repeat times and return the best wall time and the peak memory
+# allocated through Python/NumPy (not counting other processes). tracemalloc
+# slows down Python code a lot, so the timed runs are untraced and the peak
+# memory comes from one extra untimed run.
+def measure(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t_start = time.perf_counter()
+            fn()
+            t_end = time.perf_counter()
+        best = min(best, t_end - t_start)
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+# (name, preset name, parameters, items per run, function) for every
+# micro benchmark
+def micro_benchmarks(quick):
+    scalar_count = 200 if quick else 2000
+    array_count = 100_000 if quick else 1_000_000
+
+    triplets = sample_triplets(scalar_count)
+    big_triplets = sample_triplets(array_count)
+    unit_triplets = np.clip(big_triplets / 1024., 0., 1.)
+    hsv = rgb_to_hsv_batch(unit_triplets)
+    sigmoid_inputs = np.linspace(0., 1., array_count)
+
+    out = []
+    for preset in all_presets:
+        compiled = flim.compile_preset(preset)
+        name = preset['name']
+
+        out.append((
+            'transform_rgb',
+            name,
+            {},
+            scalar_count,
+            lambda c=compiled: [flim.transform_rgb(v, c) for v in triplets]
+        ))
+        out.append((
+            'transform_rgb_batch',
+            name,
+            {},
+            array_count,
+            lambda c=compiled: flim.transform_rgb_batch(big_triplets, c)
+        ))
+        out.append((
+            'negative_and_print',
+            name,
+            {},
+            scalar_count,
+            lambda c=compiled: [
+                flim.negative_and_print(v.copy(), c) for v in triplets
+            ]
+        ))
+        out.append((
+            'negative_and_print_batch',
+            name,
+            {},
+            array_count,
+            lambda c=compiled: flim.negative_and_print_batch(big_triplets, c)
+        ))
+        out.append((
+            'super_sigmoid',
+            name,
+            {},
+            array_count,
+            lambda c=compiled: super_sigmoid_from_params(
+                sigmoid_inputs,
+                c.sigmoid_params
+            )
+        ))
+
+    out += [
+        (
+            'rgb_to_hsv',
+            None,
+            {},
+            scalar_count,
+            lambda: [rgb_to_hsv(v) for v in unit_triplets[:scalar_count]]
+        ),
+        (
+            'rgb_to_hsv_batch',
+            None,
+            {},
+            array_count,
+            lambda: rgb_to_hsv_batch(unit_triplets)
+        ),
+        (
+            'hsv_to_rgb',
+            None,
+            {},
+            scalar_count,
+            lambda: [hsv_to_rgb(v) for v in hsv[:scalar_count]]
+        ),
+        (
+            'hsv_to_rgb_batch',
+            None,
+            {},
+            array_count,
+            lambda: hsv_to_rgb_batch(hsv)
+        ),
+        (
+            'rgb_adjust_hsv',
+            None,
+            {},
+            scalar_count,
+            lambda: [
+                rgb_adjust_hsv(v, .5, 1.1, 1.)
+                for v in unit_triplets[:scalar_count]
+            ]
+        ),
+        (
+            'rgb_adjust_hsv_batch',
+            None,
+            {},
+            array_count,
+            lambda: rgb_adjust_hsv_batch(unit_triplets, .5, 1.1, 1.)
+        )
+    ]
+
+    return out
+
+
+# (name, preset name, parameters, items per run, function) for compiling
+# LUTs with apply_transform
+def lut_benchmarks(sizes, backends, serial_max_size):
+    out = []
+    for preset in all_presets:
+        compiled = flim.compile_preset(preset)
+        for size in sizes:
+            table = colour.LUT3D.linear_table(size)
+            for backend in backends:
+                if backend == 'serial' and size > serial_max_size:
+                    continue
+
+                # the backend is restored afterwards
+                def run(c=compiled, t=table, b=backend):
+                    previous_backend = flim.backend
+                    flim.backend = b
+                    try:
+                        flim.apply_transform(t, c)
+                    finally:
+                        flim.backend = previous_backend
+
+                out.append((
+                    'apply_transform',
+                    preset['name'],
+                    {'size': size, 'backend': backend},
+                    size**3,
+                    run
+                ))
+
+    return out
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=script_dir,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# identifies a benchmark across runs
+def result_id(result):
+    params = ' '.join(f'{k}={v}' for k, v in sorted(result['params'].items()))
+    return f'{result["name"]} {result["preset"] or "-"} {params}'.strip()
+
+
+def print_results(results, baseline=None):
+    baseline_rates = {}
+    if baseline is not None:
+        baseline_rates = {
+            result_id(r): r['items_per_second'] for r in baseline['results']
+        }
+
+    print(f'{"benchmark":<52} {"items/s":>12} {"time (s)":>10} '
+          f'{"peak (MB)":>10}' + (f' {"vs base":>8}' if baseline else ''))
+    for r in results:
+        line = f'{result_id(r):<52} {r["items_per_second"]:>12.0f} ' \
+            f'{r["seconds"]:>10.4f} {r["peak_memory_bytes"] / 1e6:>10.1f}'
+        if baseline is not None:
+            base = baseline_rates.get(result_id(r))
+            line += f' {r["items_per_second"] / base:>7.2f}x' \
+                if base else f' {"-":>8}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks for flim')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[17, 33, 65, 80],
+                        help='LUT sizes for apply_transform')
+    parser.add_argument('--backends', nargs='+',
+                        default=['serial', 'batch', 'parallel'],
+                        help='apply_transform backends (serial, batch, '
+                        'parallel, jit)')
+    parser.add_argument('--serial-max-size', type=int, default=33,
+                        help='largest LUT size to run the serial backend on')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per benchmark (the best time is kept)')
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller inputs for the micro benchmarks')
+    parser.add_argument('--skip-micro', action='store_true',
+                        help='only run the apply_transform benchmarks')
+    parser.add_argument('--output', default=f'{script_dir}/bench_results',
+                        help='directory for the JSON results')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of an earlier run to compare to')
+    args = parser.parse_args()
+
+    benchmarks = [] if args.skip_micro else micro_benchmarks(args.quick)
+    benchmarks += lut_benchmarks(
+        args.sizes,
+        args.backends,
+        args.serial_max_size
+    )
+
+    results = []
+    for name, preset_name, params, items, fn in benchmarks:
+        seconds, peak = measure(fn, args.repeat)
+        results.append({
+            'name': name,
+            'preset': preset_name,
+            'params': params,
+            'items': items,
+            'seconds': seconds,
+            'items_per_second': items / seconds,
+            'peak_memory_bytes': peak
+        })
+        print(f'{result_id(results[-1])}: {items / seconds:.0f} items/s')
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__
+        },
+        'results': results
+    }
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    print()
+    print_results(results, baseline)
+
+    os.makedirs(args.output, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.output, f'{stamp}_{commit or "unknown"}.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nresults saved to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,505 @@
+"""
+
+builds the 3D LUTs of several flim presets at once
+
+the tables of all presets that aren't cached are transformed at the same
+time: with the parallel backend, they're split into slabs that share one pool
+of worker processes, and with the batch backend, every preset runs in its own
+thread in this process (NumPy releases the GIL in the array operations). the
+serial and JIT backends transform the tables one after another (the JIT
+kernel already uses every core). every finished table is written by
+a background thread while the other presets are still being transformed.
+LUTs whose files are up to date are skipped. a summary of the timings of
+every preset is printed at the end.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+# colour and joblib are imported where they're used, since they're slow to
+# import
+import numpy as np
+import concurrent.futures
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+import flim
+from lut_cache import cache_key
+from lut_io import lut_formats, write_lut
+from profiling import Profiler, ThreadProfilers, profiling
+from progress import ConsoleProgress
+
+
+# the comment lines written with a LUT (including a guide for OCIO)
+def lut_comments(preset: dict, lut_name: str, version: str):
+    ocio_view_name = f"flim ({preset['name']})"
+    ocio_allocation_vars = f'vars: [{preset["lut_compress_log2_min"]}, {preset["lut_compress_log2_max"]}, {2**preset["lut_compress_log2_min"]}]'
+    ocio_guide_comments = \
+        f"Here's how you can add this to an OpenColorIO config:\n" \
+        f"```yaml\n" \
+        f"colorspaces:\n" \
+        f"  - !<ColorSpace>\n" \
+        f"    name: {ocio_view_name}\n" \
+        f"    family: Image Formation\n" \
+        f"    equalitygroup: \"\"\n" \
+        f"    bitdepth: unknown\n" \
+        f"    description: flim v{version} - https://github.com/bean-mhm/flim\n" \
+        f"    isdata: false\n" \
+        f"    allocation: uniform\n" \
+        f"    from_scene_reference: !<GroupTransform>\n" \
+        f"      children:\n" \
+        f"        - !<ColorSpaceTransform> {{src: reference, dst: Linear BT.709 I-D65}}\n" \
+        f"        - !<RangeTransform> {{min_in_value: 0., min_out_value: 0.}}\n" \
+        f"        - !<AllocationTransform> {{allocation: lg2, {ocio_allocation_vars}}}\n" \
+        f"        - !<FileTransform> {{src: {lut_name}.spi3d, interpolation: linear}}\n" \
+        f"```\n" \
+        f"Explanation:\n" \
+        f"  1. ColorSpaceTransform converts the input from the scene reference to Linear BT.709 I-D65. If this is named\n" \
+        f"     differently in your config (for example Linear Rec.709), change the name manually.\n" \
+        f"  2. RangeTransform clips negative values. You might want to use a gamut compression algorithm before this step.\n" \
+        f"  3. AllocationTransform is for LUT compression, it takes the log2 of the RGB values and maps them from a\n" \
+        f"     specified range (the first two values after 'vars') to [0, 1]. The third value is the offset applied to the\n" \
+        f"     values before log2. This is done to keep the blacks.\n" \
+        f"  4. Lastly, the FileTransform references the 3D LUT and defines a trilinear interpolation method.\n" \
+        f"\n" \
+        f"Adding this as a view transform is pretty straightforward:\n" \
+        f"```yaml\n" \
+        f"displays:\n" \
+        f"  sRGB:\n" \
+        f"    - !<View> {{name: {ocio_view_name}, colorspace: {ocio_view_name}}}\n" \
+        f"    ... (other view transforms here)\n" \
+        f"```"
+
+    return [
+        '-------------------------------------------------',
+        '',
+        f'flim v{version} - Filmic Color Transform',
+        '',
+        f'Preset: {preset["name"]}',
+        f'URL: {preset["info_url"]}',
+        '',
+        'LUT input is expected to be in Linear BT.709 I-D65 and gone through an AllocationTransform like the following:',
+        f'!<AllocationTransform> {{allocation: lg2, {ocio_allocation_vars}}}',
+        '',
+        'Output will be in sRGB.',
+        ''] + \
+        ocio_guide_comments.splitlines() + [
+        '',
+        'Repo:',
+        'https://github.com/bean-mhm/flim',
+        '',
+        'Read more:',
+        'https://opencolorio.readthedocs.io/en/latest/guides/authoring/authoring.html#how-to-configure-colorspace-allocation',
+        '',
+        '-------------------------------------------------'
+    ]
+
+
+# metadata stored in the LUT files that support it (.flut)
+def lut_info(preset: dict, version: str):
+    return {
+        'name': preset['name'],
+        'version': version,
+        'lut_compress_log2_min': preset['lut_compress_log2_min'],
+        'lut_compress_log2_max': preset['lut_compress_log2_max']
+    }
+
+
+# identifies the content of the files of a LUT. it's saved next to them after
+# they're written, so that unchanged LUTs aren't rewritten.
+def lut_stamp(key: str, formats, comments):
+    return flim.hash_params({
+        'key': key,
+        'formats': list(formats),
+        'comments': comments
+    })
+
+
+# are the files of a LUT there and written with the given stamp?
+def lut_up_to_date(job, formats):
+    paths = [
+        f'{job["path"]}{lut_formats[name][0]}' for name in formats
+        if name in lut_formats
+    ]
+    if len(paths) < len(formats) \
+            or not all(os.path.isfile(path) for path in paths):
+        return False
+
+    try:
+        with open(job['stamp_path'], 'r') as f:
+            return f.read().strip() == job['stamp']
+    except OSError:
+        return False
+
+
+# transforms a slab of a memory-mapped table with flim.run_parallel (runs in
+# a worker process) and returns the index of its preset along with the result
+def run_slab(index: int, *args):
+    count, stats = flim.run_parallel(*args)
+    return index, count, stats
+
+
+# build the LUTs of presets into output_dir in the given formats (see
+# lut_io.py). size overrides the presets' lut_quantize. tables are looked up
+# in and added to cache (a LUTCache) if given. LUTs whose files are up to date
+# are skipped, unless force is True. with profile, the stage timings of every
+# preset are printed and saved as <LUT name>.profile.json. returns a list with
+# the timings of every preset.
+def build_luts(
+    presets,
+    version: str,
+    output_dir: str,
+    formats=('spi3d',),
+    size: int = None,
+    cache=None,
+    profile: bool = False,
+    force: bool = False
+):
+    t_start = time.perf_counter()
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # one thread writes the LUTs in the order their tables are ready
+    writer = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    writes = []
+
+    def submit_write(job, table):
+        def write():
+            t_write = time.perf_counter()
+
+            # the stamp is removed first, so it's only there if the files
+            # were completely written
+            if os.path.isfile(job['stamp_path']):
+                os.remove(job['stamp_path'])
+
+            write_lut(
+                job['path'],
+                table,
+                job['comments'],
+                formats,
+                info=lut_info(job['preset'], version)
+            )
+
+            with open(job['stamp_path'], 'w') as f:
+                f.write(job['stamp'])
+
+            job['write_seconds'] = time.perf_counter() - t_write
+            job['done_at'] = time.perf_counter() - t_start
+
+        writes.append(writer.submit(write))
+
+    def finish(job, table):
+        job['compute_seconds'] = time.perf_counter() - job['t_compute']
+        if cache is not None:
+            cache.put(job['key'], table)
+        submit_write(job, table)
+
+    try:
+        jobs = []
+        pending = []
+        for preset in presets:
+            preset = dict(preset, name=preset['name'].strip().replace(' ', '_'))
+            compiled = flim.compile_preset(preset)
+            lut_size = size if size is not None else compiled.lut_quantize
+            lut_name = f'flim_{preset["name"]}'
+            key = cache_key(compiled, version, lut_size)
+            comments = lut_comments(preset, lut_name, version)
+
+            job = {
+                'preset': preset,
+                'lut_name': lut_name,
+                'path': os.path.join(output_dir, lut_name),
+                'stamp_path': os.path.join(output_dir, f'.{lut_name}.stamp'),
+                'profile_path': os.path.join(
+                    output_dir,
+                    f'{lut_name}.profile.json'
+                ),
+                'compiled': compiled,
+                'size': lut_size,
+                'key': key,
+                'comments': comments,
+                'stamp': lut_stamp(key, formats, comments),
+                'source': 'computed',
+                'compute_seconds': 0.,
+                'write_seconds': 0.,
+                'done_at': 0.
+            }
+            jobs.append(job)
+
+            if not force and lut_up_to_date(job, formats):
+                print(f'"{preset["name"]}" is up to date')
+                job['source'] = 'up to date'
+                continue
+
+            table = cache.get(key) if cache is not None else None
+            if table is not None:
+                print(f'found the "{preset["name"]}" table in the cache')
+                job['source'] = 'cache'
+                submit_write(job, table)
+            else:
+                pending.append(job)
+
+        if len(pending) > 0:
+            if flim.backend == 'parallel':
+                transform_shared(pending, finish, profile)
+            elif flim.backend == 'batch':
+                transform_threaded(pending, finish, profile)
+            else:
+                transform_one_by_one(pending, finish, profile)
+
+        for future in writes:
+            future.result()
+    finally:
+        writer.shutdown(wait=True)
+
+    wall_seconds = time.perf_counter() - t_start
+    print_summary(jobs, wall_seconds)
+
+    return [
+        {
+            'name': job['preset']['name'],
+            'size': job['size'],
+            'source': job['source'],
+            'compute_seconds': job['compute_seconds'],
+            'write_seconds': job['write_seconds'],
+            'done_at': job['done_at']
+        }
+        for job in jobs
+    ]
+
+
+# transform the tables of the jobs with apply_transform, one after another
+# (for the serial and JIT backends)
+def transform_one_by_one(jobs, finish, profile: bool):
+    import colour
+
+    for job in jobs:
+        print(f'transforming "{job["preset"]["name"]}"...')
+        job['t_compute'] = time.perf_counter()
+
+        linear_table = colour.LUT3D.linear_table(job['size'])
+        progress = ConsoleProgress(label=job['preset']['name'])
+        if profile:
+            with profiling() as profiler:
+                table = flim.apply_transform(
+                    linear_table,
+                    job['compiled'],
+                    progress=progress
+                )
+            report_profile(job, profiler)
+        else:
+            table = flim.apply_transform(
+                linear_table,
+                job['compiled'],
+                progress=progress
+            )
+
+        finish(job, table)
+
+
+# transform the tables of the jobs with apply_transform in a pool of threads,
+# one job per thread (for the batch backend). finish is called from this
+# thread for every table as soon as it's done.
+def transform_threaded(jobs, finish, profile: bool):
+    import colour
+
+    workers = flim.n_jobs if flim.n_jobs is not None else os.cpu_count()
+    if workers < 1:
+        raise Exception('n_jobs must be at least 1')
+
+    profilers = ThreadProfilers()
+
+    def transform(job):
+        job['t_compute'] = time.perf_counter()
+
+        linear_table = colour.LUT3D.linear_table(job['size'])
+        progress = ConsoleProgress(label=job['preset']['name'])
+        if not profile:
+            return flim.apply_transform(
+                linear_table,
+                job['compiled'],
+                progress=progress
+            )
+
+        with profilers.use(Profiler()) as profiler:
+            job['profiler'] = profiler
+            return flim.apply_transform(
+                linear_table,
+                job['compiled'],
+                progress=progress
+            )
+
+    print(f'transforming {len(jobs)} tables in '
+          f'{min(workers, len(jobs))} threads...')
+
+    with contextlib.ExitStack() as stack:
+        if profile:
+            stack.enter_context(profiling(profilers))
+        pool = stack.enter_context(
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        )
+
+        futures = {pool.submit(transform, job): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            table = future.result()
+            if profile:
+                report_profile(job, job['profiler'])
+            finish(job, table)
+
+
+# transform the tables of the jobs in slabs that share one pool of worker
+# processes (like the parallel backend, but over all the tables at once).
+# finish is called for every table as soon as all its slabs are done.
+# with profile, the stages that run in this process are timed too, so the
+# timings add up like those of the other backends.
+def transform_shared(jobs, finish, profile: bool):
+    import colour
+    import joblib
+
+    colour.algebra.set_spow_enable(True)
+
+    workers = flim.n_jobs if flim.n_jobs is not None else joblib.cpu_count()
+    if workers < 1:
+        raise Exception('n_jobs must be at least 1')
+
+    total_points = sum(job['size']**3 for job in jobs)
+
+    # a few slabs per worker to balance the load, over all tables
+    points_per_slab = flim.slab_size
+    if points_per_slab is None:
+        points_per_slab = max(-(-total_points // (workers * 4)), 1)
+
+    temp_dir = tempfile.mkdtemp(
+        prefix='flim_build_',
+        dir='/dev/shm' if os.path.isdir('/dev/shm') else None
+    )
+    try:
+        # decompress the tables into memory-mapped files, in the order of
+        # the presets, so the first tables are done (and written) first
+        tasks = []
+        for index, job in enumerate(jobs):
+            job['t_compute'] = time.perf_counter()
+            job['compiled_as'] = flim.compiled_preset_as(
+                job['compiled'],
+                flim.compute_dtype
+            )
+            if profile:
+                job['profiler'] = Profiler()
+
+            table = np.asarray(
+                colour.LUT3D.linear_table(job['size']),
+                dtype=flim.compute_dtype
+            )
+            table = run_stages_profiled(
+                job,
+                table,
+                'decompression',
+                'pre_exposure'
+            )
+
+            num_points = table.size // 3
+            job['shape'] = table.shape
+            job['temp_path'] = os.path.join(temp_dir, f'{index}.dat')
+            job['remaining'] = num_points
+
+            shared = np.memmap(
+                job['temp_path'],
+                dtype=table.dtype,
+                mode='w+',
+                shape=(num_points, 3)
+            )
+            shared[:] = table.reshape(-1, 3)
+            shared.flush()
+            del shared
+
+            for start in range(0, num_points, points_per_slab):
+                tasks.append(joblib.delayed(run_slab)(
+                    index,
+                    job['temp_path'],
+                    num_points,
+                    table.dtype.str,
+                    start,
+                    min(start + points_per_slab, num_points),
+                    job['compiled_as'],
+                    flim.dye_mix_max_error,
+                    profile
+                ))
+
+        print(f'transforming {len(jobs)} tables with {workers} workers...')
+        progress = ConsoleProgress(label='building')
+        progress(0, total_points)
+
+        done = 0
+        results = joblib.Parallel(
+            n_jobs=workers,
+            return_as='generator_unordered'
+        )(tasks)
+        for index, count, stats in results:
+            job = jobs[index]
+            job['remaining'] -= count
+            done += count
+            progress(done, total_points)
+
+            if profile:
+                job['profiler'].merge(stats)
+
+            if job['remaining'] > 0:
+                continue
+
+            num_points = int(np.prod(job['shape'][:-1]))
+            shared = np.memmap(
+                job['temp_path'],
+                dtype=flim.compute_dtype,
+                mode='r',
+                shape=(num_points, 3)
+            )
+            table = np.array(shared).reshape(job['shape'])
+            del shared
+            os.remove(job['temp_path'])
+
+            table = run_stages_profiled(job, table, 'oetf', 'oetf')
+            if profile:
+                report_profile(job, job['profiler'])
+
+            finish(job, table)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# run_stages with the compiled preset of a job, timed into its profiler if it
+# has one
+def run_stages_profiled(job, table, first: str, last: str):
+    if 'profiler' not in job:
+        return flim.run_stages(table, job['compiled_as'], first, last)
+
+    with profiling(job['profiler']):
+        return flim.run_stages(table, job['compiled_as'], first, last)
+
+
+def report_profile(job, profiler: Profiler):
+    print(f'stage timings of "{job["preset"]["name"]}":')
+    print(profiler.summary())
+    profiler.dump_json(job['profile_path'])
+
+
+def print_summary(jobs, wall_seconds: float):
+    print()
+    print(f'{"preset":<20} {"size":>5} {"source":>10} {"compute (s)":>12} '
+          f'{"write (s)":>10} {"done at (s)":>12}')
+    for job in jobs:
+        print(f'{job["preset"]["name"]:<20} {job["size"]:>5} '
+              f'{job["source"]:>10} '
+              f'{job["compute_seconds"]:>12.2f} {job["write_seconds"]:>10.2f} '
+              f'{job["done_at"]:>12.2f}')
+
+    sequential = sum(
+        job['compute_seconds'] + job['write_seconds'] for job in jobs
+    )
+    print(f'built {len(jobs)} LUTs in {wall_seconds:.2f} s '
+          f'(per-preset times add up to {sequential:.2f} s)\n')
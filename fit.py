@@ -0,0 +1,568 @@
+"""
+
+fits flim preset parameters to an existing look
+
+python fit.py old_look.spi3d --params pre_exposure negative_film_exposure
+python fit.py --pairs input.exr graded.png --params print_film_density=20:35
+
+the look is sampled from a reference 3D LUT (made for flim's LUT compression,
+see the Non-OCIO Guide in the README) or from pairs of linear input images and
+graded sRGB output images. the chosen parameters of a base preset are then
+fitted to minimize the mean squared error of the sRGB output on the samples.
+
+every generation of candidates is evaluated at once with flim.transform_sweep.
+the fit starts on a small subset of the samples and doubles it whenever it
+stops improving, and independent restarts run in parallel on all CPU cores.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import argparse
+import json
+import numpy as np
+import time
+
+import flim
+from presets import *
+from utils import gamut_extension_mat_batch
+
+
+# number of worker processes for the restarts (None: all CPU cores)
+n_jobs = None
+
+# limits of the parameters that have them, which the default bounds (see
+# default_bounds) don't go past
+parameter_limits = {
+    'pre_formation_filter': (0., 1.),
+    'pre_formation_filter_strength': (0., 1.),
+    'sigmoid_toe_x': (0., 1.),
+    'sigmoid_toe_y': (0., 1.),
+    'sigmoid_shoulder_x': (0., 1.),
+    'sigmoid_shoulder_y': (0., 1.),
+    'negative_film_density': (0., np.inf),
+    'print_backlight': (0., np.inf),
+    'print_film_density': (0., np.inf),
+    'luminance_weights': (0., 1.),
+    'post_formation_filter': (0., 1.),
+    'post_formation_filter_strength': (0., 1.),
+    'midtone_saturation': (0., np.inf)
+}
+
+# preset keys that can't be fitted (the LUT keys don't affect the transform of
+# linear colors)
+unfittable_keys = flim.preset_info_keys + [
+    'lut_compress_log2_min',
+    'lut_compress_log2_max',
+    'lut_quantize'
+]
+
+
+# the parameters that a fit changes: one (key, channel) pair per dimension
+# (channel is None for numbers) and the lower and upper bounds of each
+# dimension. candidates are vectors in [0, 1] for every dimension.
+class ParameterSpace:
+    def __init__(self, base: dict, bounds: dict):
+        self.base = base
+        self.dims = []
+        low = []
+        high = []
+
+        for key, (key_low, key_high) in bounds.items():
+            if key not in flim.preset_keys or key in unfittable_keys:
+                raise Exception(f'{key} can\'t be fitted')
+
+            if key in flim.preset_rgb_keys:
+                key_low = np.broadcast_to(key_low, (3,))
+                key_high = np.broadcast_to(key_high, (3,))
+                for channel in range(3):
+                    self.dims.append((key, channel))
+                    low.append(key_low[channel])
+                    high.append(key_high[channel])
+            else:
+                self.dims.append((key, None))
+                low.append(key_low)
+                high.append(key_high)
+
+        self.low = np.array(low, dtype=np.float64)
+        self.high = np.array(high, dtype=np.float64)
+        if not np.all(self.low < self.high):
+            raise Exception('lower bounds must be less than upper bounds')
+
+    @property
+    def size(self):
+        return len(self.dims)
+
+    # the base preset as a candidate (clipped to the bounds)
+    def base_vector(self):
+        values = []
+        for key, channel in self.dims:
+            value = self.base[key]
+            if isinstance(value, str) or value is None:
+                value = self.low[len(values)]
+            values.append(value if channel is None else value[channel])
+
+        return np.clip(
+            (np.array(values, dtype=np.float64) - self.low)
+            / (self.high - self.low),
+            0.,
+            1.
+        )
+
+    # the preset of a candidate
+    def preset(self, vector, name: str = None):
+        preset = dict(self.base)
+        values = self.low + np.clip(vector, 0., 1.) * (self.high - self.low)
+
+        for (key, channel), value in zip(self.dims, values):
+            if channel is None:
+                preset[key] = float(value)
+            else:
+                if preset[key] is self.base[key]:
+                    preset[key] = np.array(self.base[key], dtype=np.float64)
+                preset[key][channel] = value
+
+        if name is not None:
+            preset['name'] = name
+        return preset
+
+
+# bounds for fitting key around its value in base: 50% of the value (at least
+# 1) in both directions, within parameter_limits. if the value is outside the
+# limits, the bounds are the nearest span of that size within them, so the
+# lower bounds are always less than the upper bounds.
+def default_bounds(base: dict, key: str):
+    value = base[key]
+    if isinstance(value, str) or value is None:
+        value = 0.
+    value = np.asarray(value, dtype=np.float64)
+
+    span = np.maximum(np.abs(value) * .5, 1.)
+    limit_low, limit_high = parameter_limits.get(key, (-np.inf, np.inf))
+    value = np.clip(value, limit_low + span, limit_high - span)
+    return (
+        np.maximum(value - span, limit_low),
+        np.minimum(value + span, limit_high)
+    )
+
+
+# (linear inputs, sRGB targets) sampled from a reference 3D LUT, which can be
+# a path (.flut files are memory-mapped, other formats are read with colour)
+# or a table with the shape (size, size, size, 3). the samples are spread
+# evenly over the LUT's input range, which is decompressed with log2_min and
+# log2_max (like the AllocationTransform of flim's LUTs).
+def lut_samples(
+    lut,
+    log2_min: float,
+    log2_max: float,
+    count: int = 65536,
+    interpolation: str = 'tetrahedral',
+    seed: int = 0
+):
+    from lut_apply import lut_samplers
+
+    if isinstance(lut, str):
+        if lut.endswith('.flut'):
+            from lut_io import load_flut
+            lut = load_flut(lut)[0]
+        else:
+            import colour
+            lut = colour.read_LUT(lut).table
+
+    table = np.asarray(lut, dtype=np.float64)
+    if table.ndim != 4 or table.shape[3] != 3:
+        raise Exception('the LUT table must have the shape (size, size, size, 3)')
+
+    rng = np.random.default_rng(seed)
+    coords = rng.uniform(0., 1., (count, 3))
+
+    inputs = 2.**(log2_min + coords * (log2_max - log2_min)) - 2.**log2_min
+    targets = lut_samplers[interpolation](table, coords)
+
+    return np.maximum(inputs, 0.), targets
+
+
+# (linear inputs, sRGB targets) sampled from pairs of images: (linear BT.709
+# I-D65 input, sRGB output) arrays with the same shape (..., 3). pixels are
+# picked uniformly from all the images, non-finite ones are skipped.
+def image_pair_samples(pairs, count: int = 65536, seed: int = 0):
+    inputs = []
+    targets = []
+    for inp, out in pairs:
+        inp = np.asarray(inp, dtype=np.float64)[..., :3].reshape(-1, 3)
+        out = np.asarray(out, dtype=np.float64)[..., :3].reshape(-1, 3)
+        if inp.shape != out.shape:
+            raise Exception('the images of a pair must have the same size')
+
+        finite = np.all(np.isfinite(inp), axis=1) \
+            & np.all(np.isfinite(out), axis=1)
+        inputs.append(np.maximum(inp[finite], 0.))
+        targets.append(out[finite])
+
+    inputs = np.concatenate(inputs)
+    targets = np.concatenate(targets)
+    if len(inputs) == 0:
+        raise Exception('the images have no finite pixels')
+
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(inputs), min(count, len(inputs)), replace=False)
+    return inputs[picked], targets[picked]
+
+
+# can the gamut extension matrices of presets (validated parameter dicts) be
+# inverted? (compile_presets raises if any of them can't)
+def invertible_gamut_extension(all_params):
+    def primaries(key):
+        return np.array([
+            [params[f'extended_gamut_{primary}_{key}']
+             for primary in ['red', 'green', 'blue']]
+            for params in all_params
+        ])
+
+    extend_mat = gamut_extension_mat_batch(
+        primaries('scale'),
+        primaries('rot'),
+        primaries('mul')
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cond = np.linalg.cond(extend_mat)
+    return np.isfinite(cond) & (cond < 1. / np.finfo(np.float64).eps)
+
+
+# mean squared error of every candidate (rows of vectors) on the samples.
+# candidates that aren't valid presets, have a gamut extension matrix that
+# can't be inverted or give NaNs cost infinity.
+def candidate_costs(space: ParameterSpace, vectors, inputs, targets):
+    costs = np.full(len(vectors), np.inf)
+
+    valid = []
+    presets = []
+    all_params = []
+    for i, vector in enumerate(vectors):
+        preset = space.preset(vector)
+        try:
+            params = flim.validated_preset_params(preset)
+        except Exception:
+            continue
+        valid.append(i)
+        presets.append(preset)
+        all_params.append(params)
+
+    if len(presets) > 0:
+        invertible = invertible_gamut_extension(all_params)
+        valid = [i for i, ok in zip(valid, invertible) if ok]
+        presets = [preset for preset, ok in zip(presets, invertible) if ok]
+
+    if len(presets) > 0:
+        out = flim.transform_sweep(presets, inputs)
+        with np.errstate(invalid='ignore'):
+            errors = np.mean((out - targets)**2, axis=(1, 2))
+        costs[valid] = np.where(np.isnan(errors), np.inf, errors)
+
+    return costs
+
+
+# one run of the fit from the start vector (runs in a worker process). this is
+# a cross-entropy search: every generation, population candidates are drawn
+# around the mean (with a standard deviation per dimension) and evaluated
+# together, and the mean and the deviations move towards the best quarter.
+# the samples are shuffled, and only the first min_points are used until the
+# best cost stops improving by tolerance (relative) for patience generations,
+# then the subset is doubled. the run ends when the full set stalls too, or
+# after generations. returns (best vector, its cost on all the samples, number
+# of evaluated candidates).
+def fit_restart(
+    space: ParameterSpace,
+    start,
+    inputs,
+    targets,
+    seed: int,
+    dtype=np.float64,
+    generations: int = 200,
+    population: int = 32,
+    min_points: int = 256,
+    tolerance: float = 1e-3,
+    patience: int = 5
+):
+    # the worker uses the caller's compute dtype (joblib may run this in the
+    # main process, so the previous one is restored)
+    previous_dtype = flim.compute_dtype
+    flim.compute_dtype = dtype
+
+    try:
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(inputs))
+        points = min(min_points, len(inputs))
+
+        mean = np.array(start, dtype=np.float64)
+        sigma = np.full(space.size, .25)
+        elite = max(population // 4, 2)
+
+        best = mean
+        best_cost = np.inf
+        stalled = 0
+        evaluations = 0
+
+        for _ in range(generations):
+            subset = order[:points]
+
+            # the best candidate so far is evaluated again, since the subset
+            # may have changed
+            vectors = np.clip(
+                mean + sigma * rng.standard_normal((population, space.size)),
+                0.,
+                1.
+            )
+            vectors[0] = best
+            vectors[1] = mean
+
+            costs = candidate_costs(
+                space,
+                vectors,
+                inputs[subset],
+                targets[subset]
+            )
+            evaluations += len(vectors)
+
+            ranked = np.argsort(costs)
+            if costs[ranked[0]] < best_cost * (1. - tolerance):
+                stalled = 0
+            else:
+                stalled += 1
+            best = vectors[ranked[0]]
+            best_cost = costs[ranked[0]]
+
+            elites = vectors[ranked[:elite]]
+            mean = np.mean(elites, axis=0)
+            sigma = .3 * sigma + .7 * np.std(elites, axis=0) + 1e-6
+
+            if stalled >= patience:
+                if points == len(inputs):
+                    break
+                points = min(points * 2, len(inputs))
+                best_cost = np.inf
+                stalled = 0
+
+        cost = candidate_costs(space, best[np.newaxis], inputs, targets)[0]
+        return best, cost, evaluations
+    finally:
+        flim.compute_dtype = previous_dtype
+
+
+# fit the parameters in bounds (a dict mapping preset keys to (low, high),
+# with triplets for RGB keys) of base (a preset dict) to the samples (linear
+# inputs and sRGB targets, see lut_samples and image_pair_samples). the first
+# restart starts from base, the others from random points within the bounds.
+# returns the fitted preset dict (named name) and a report with the error
+# and the cost of every restart.
+def fit_preset(
+    base: dict,
+    bounds: dict,
+    inputs,
+    targets,
+    restarts: int = None,
+    name: str = None,
+    seed: int = 0,
+    **options
+):
+    import joblib
+
+    space = ParameterSpace(base, bounds)
+
+    workers = n_jobs if n_jobs is not None else joblib.cpu_count()
+    if restarts is None:
+        restarts = max(workers, 4)
+
+    rng = np.random.default_rng(seed)
+    starts = [space.base_vector()] + [
+        rng.uniform(0., 1., space.size) for _ in range(restarts - 1)
+    ]
+
+    t_start = time.perf_counter()
+    results = joblib.Parallel(n_jobs=min(workers, restarts))(
+        joblib.delayed(fit_restart)(
+            space,
+            start,
+            inputs,
+            targets,
+            seed + i + 1,
+            flim.compute_dtype,
+            **options
+        )
+        for i, start in enumerate(starts)
+    )
+    seconds = time.perf_counter() - t_start
+
+    best, cost, _ = min(results, key=lambda result: result[1])
+    preset = space.preset(best, name or f'{base["name"]}_fit')
+
+    out = flim.transform_sweep([preset], inputs)[0]
+    report = {
+        'rms_error': float(np.sqrt(cost)),
+        'max_error': float(np.max(np.abs(out - targets))),
+        'restart_rms_errors': [float(np.sqrt(result[1])) for result in results],
+        'evaluations': sum(result[2] for result in results),
+        'samples': len(inputs),
+        'seconds': seconds
+    }
+
+    return preset, report
+
+
+# a preset dict as Python code in the style of presets.py
+def format_preset(preset: dict, variable: str = None):
+    def format_value(value):
+        if isinstance(value, str) or value is None:
+            return repr(value)
+        if np.ndim(value) > 0:
+            values = ', '.join(format_value(v) for v in np.asarray(value))
+            return f'np.array([{values}])'
+        if isinstance(value, (int, np.integer)):
+            return str(value)
+        return repr(round(float(value), 6))
+
+    variable = variable or f'preset_{preset["name"]}'
+    lines = [f'{variable} = {{']
+    for i, key in enumerate(flim.preset_keys):
+        comma = ',' if i < len(flim.preset_keys) - 1 else ''
+        lines.append(f'    {key!r}: {format_value(preset[key])}{comma}')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+# parses 'key' (default bounds) or 'key=low:high' (the same bounds for every
+# channel of RGB keys)
+def parse_parameter(text: str, base: dict):
+    if '=' not in text:
+        return text, default_bounds(base, text)
+
+    key, bounds = text.split('=', 1)
+    low, high = bounds.split(':')
+    return key, (float(low), float(high))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='fit flim preset parameters to a reference LUT or images'
+    )
+    parser.add_argument(
+        'lut',
+        nargs='?',
+        help='reference 3D LUT (.spi3d, .cube, .flut, ...)'
+    )
+    parser.add_argument(
+        '--pairs',
+        nargs='+',
+        default=[],
+        help='linear input and sRGB output images, alternating'
+    )
+    parser.add_argument(
+        '-p', '--params',
+        nargs='+',
+        required=True,
+        help='parameters to fit, as key or key=low:high'
+    )
+    parser.add_argument(
+        '--base',
+        default=preset_default['name'],
+        help='name of the preset to start from (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--name',
+        default=None,
+        help='name of the fitted preset (default: <base>_fit)'
+    )
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=65536,
+        help='number of sampled colors (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--restarts',
+        type=int,
+        default=None,
+        help='number of restarts (default: the number of CPU cores, at '
+        'least 4)'
+    )
+    parser.add_argument(
+        '--generations',
+        type=int,
+        default=200,
+        help='maximum number of generations per restart '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--dtype',
+        default='float64',
+        choices=['float32', 'float64'],
+        help='compute dtype of the transform (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='also save the fitted preset and the report as JSON here'
+    )
+    args = parser.parse_args()
+
+    by_name = {preset['name']: preset for preset in all_presets}
+    if args.base not in by_name:
+        raise Exception(
+            f'unknown preset: {args.base} (available: {list(by_name)})'
+        )
+    base = by_name[args.base]
+
+    bounds = dict(parse_parameter(text, base) for text in args.params)
+    flim.compute_dtype = np.dtype(args.dtype).type
+
+    if args.lut is not None:
+        log2_min = base['lut_compress_log2_min']
+        log2_max = base['lut_compress_log2_max']
+        if args.lut.endswith('.flut'):
+            from lut_io import read_flut_header
+            header = read_flut_header(args.lut)[0]
+            log2_min = header.get('lut_compress_log2_min', log2_min)
+            log2_max = header.get('lut_compress_log2_max', log2_max)
+        inputs, targets = lut_samples(args.lut, log2_min, log2_max, args.samples)
+    elif len(args.pairs) > 0:
+        if len(args.pairs) % 2 != 0:
+            raise Exception('--pairs takes an even number of images')
+        import colour
+        images = [colour.read_image(path) for path in args.pairs]
+        inputs, targets = image_pair_samples(
+            zip(images[0::2], images[1::2]),
+            args.samples
+        )
+    else:
+        raise Exception('pass a reference LUT or --pairs')
+
+    preset, report = fit_preset(
+        base,
+        bounds,
+        inputs,
+        targets,
+        restarts=args.restarts,
+        name=args.name,
+        generations=args.generations
+    )
+
+    print(format_preset(preset))
+    print(f'RMS error: {report["rms_error"]:.6f}, max error: '
+          f'{report["max_error"]:.6f}')
+    print(f'{report["evaluations"]} candidates in {report["seconds"]:.1f} s')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'preset': {
+                    'name': preset['name'],
+                    'info_url': preset['info_url']
+                } | flim.canonical_preset_params(preset),
+                'report': report
+            }, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,266 +11,1391 @@ https://github.com/bean-mhm/flim
 """
 
 
+# colour and joblib are imported where they're used, since they're slow to
+# import and most of flim doesn't need them
 import numpy as np
-import colour
-import joblib
+import collections
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 
 from utils import *
 
 
-# use parallel processing?
-parallel = True
+# element-wise transform backend:
+#   'batch': runs transform_rgb_batch on the whole table as array operations
+#   'parallel': runs transform_rgb_batch on slabs of the table in a pool of
+#               worker processes
+#   'jit': runs the stages fused into one loop compiled with numba (see
+#          flim_jit.py, falls back to 'batch' if numba isn't installed)
+#   'serial': calls transform_rgb for every triplet (reference)
+backend = 'batch'
+
+# number of worker processes for the parallel backend (None: all CPU cores)
+n_jobs = None
+
+# number of table nodes per task for the parallel backend (None: auto)
+slab_size = None
 
 # print the current indices while processing? (slow)
 print_indices = False
 
+# maximum number of pixels per tile in transform_image
+image_tile_pixels = 256 * 256
 
-# transform a 3D LUT
-def apply_transform(table: np.ndarray, preset: dict):
-    if len(table.shape) != 4:
+# input values of transform_image and transform_sweep are clamped to this
+# (infinities would turn into NaNs in the stages, any value this bright is
+# already white)
+max_input_value = 2.**64
+
+# number of table nodes per chunk for the batch backend
+batch_chunk_points = 65536
+
+# set to a profiling.Profiler to collect per-stage timings (None: disabled)
+profiler = None
+
+# float type of the batch and parallel backends and transform_image:
+# np.float64 (reference) or np.float32 (half the memory traffic, see
+# precision.py for the error it adds). the serial backend always uses float64.
+compute_dtype = np.float64
+
+# maximum absolute error of the dye mix factors in the batch and parallel
+# backends and transform_image. if set, dye_mix_factor is interpolated from a
+# precomputed table per develop pass (see dye_mix_table) instead of being
+# evaluated for every sample (the JIT kernel always evaluates it). None: exact
+# evaluation.
+dye_mix_max_error = None
+
+
+# keys that every preset must have
+preset_keys = [
+    'name',
+    'info_url',
+
+    'lut_compress_log2_min',
+    'lut_compress_log2_max',
+    'lut_quantize',
+
+    'pre_exposure',
+    'pre_formation_filter',
+    'pre_formation_filter_strength',
+
+    'extended_gamut_red_scale',
+    'extended_gamut_green_scale',
+    'extended_gamut_blue_scale',
+    'extended_gamut_red_rot',
+    'extended_gamut_green_rot',
+    'extended_gamut_blue_rot',
+    'extended_gamut_red_mul',
+    'extended_gamut_green_mul',
+    'extended_gamut_blue_mul',
+
+    'sigmoid_log2_min',
+    'sigmoid_log2_max',
+    'sigmoid_toe_x',
+    'sigmoid_toe_y',
+    'sigmoid_shoulder_x',
+    'sigmoid_shoulder_y',
+
+    'negative_film_exposure',
+    'negative_film_density',
+
+    'print_backlight',
+    'print_film_exposure',
+    'print_film_density',
+
+    'luminance_weights',
+    'black_point',
+    'post_formation_filter',
+    'post_formation_filter_strength',
+    'midtone_saturation'
+]
+
+# preset keys that hold RGB triplets
+preset_rgb_keys = [
+    'pre_formation_filter',
+    'print_backlight',
+    'luminance_weights',
+    'post_formation_filter'
+]
+
+# preset keys that don't affect the transform
+preset_info_keys = ['name', 'info_url']
+
+
+# everything the transform needs from a preset, computed once. use
+# compile_preset to make one. instances are immutable and hashable (by the
+# canonical hash of the preset parameters), so they can be used as cache keys.
+# compile_presets stacks several presets into one instance for the batch
+# stages (see there).
+@dataclasses.dataclass(frozen=True, eq=False)
+class CompiledPreset:
+    name: str
+    info_url: str
+
+    # canonical (key, value) pairs of the preset parameters and their hash
+    params: tuple
+    key: str
+
+    # LUT compression
+    lut_compress_log2_min: float
+    lut_compress_log2_max: float
+    lut_quantize: int
+
+    # 2 to the power of pre_exposure
+    pre_exposure_mul: float
+
+    # pre-formation filter lerped by its strength
+    pre_formation_filter: np.ndarray
+
+    # gamut extension matrix and its inverse
+    extend_mat: np.ndarray
+    extend_mat_inv: np.ndarray
+
+    # film develop
+    sigmoid_log2_min: float
+    sigmoid_log2_max: float
+    sigmoid_params: SuperSigmoidParams
+    film_layers: tuple
+
+    # film_layers as matrices (see film_layer_mats)
+    sensitivity_mat: np.ndarray
+    dye_mat: np.ndarray
+
+    negative_exposure_mul: float
+    negative_density: float
+    backlight_ext: np.ndarray
+    print_exposure_mul: float
+    print_density: float
+
+    # upper and lower limits in the print (in the extended gamut!)
+    white_cap: np.ndarray
+    black_cap: np.ndarray
+
+    # black point offset ('auto' is resolved using black_cap)
+    luminance_weights_norm: np.ndarray
+    black_point: float
+
+    # post-formation filter lerped by its strength
+    post_formation_filter: np.ndarray
+
+    midtone_saturation: float
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledPreset):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+# preset parameters as plain Python values, used for hashing. 'auto' black
+# points are unified and RGB triplets become tuples.
+def canonical_preset_params(preset: dict):
+    params = {}
+    for key in preset_keys:
+        if key in preset_info_keys:
+            continue
+
+        value = preset[key]
+        if key in preset_rgb_keys:
+            value = tuple(float(v) for v in np.asarray(value).reshape(3))
+        elif key == 'lut_quantize':
+            value = int(value)
+        elif key == 'black_point' and value in ['Auto', 'auto', '', None]:
+            value = 'auto'
+        else:
+            value = float(value)
+
+        params[key] = value
+
+    return params
+
+
+# hash of (a subset of) canonical preset parameters
+def hash_params(params: dict, keys=None):
+    if keys is not None:
+        params = {key: params[key] for key in keys}
+
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+# canonical hash of the preset parameters (ignores the name and the URL)
+def preset_hash(preset: dict):
+    return hash_params(canonical_preset_params(preset))
+
+
+# validate a preset dict and return its canonical parameters
+def validated_preset_params(preset: dict):
+    missing = [key for key in preset_keys if key not in preset]
+    if len(missing) > 0:
+        raise Exception(f'preset is missing the following keys: {missing}')
+
+    for key in preset_rgb_keys:
+        if np.asarray(preset[key]).shape != (3,):
+            raise Exception(f'{key} must be an RGB triplet')
+
+    if isinstance(preset['black_point'], str) \
+            and preset['black_point'] not in ['Auto', 'auto', '']:
+        raise Exception('black_point must be a number or \'auto\'')
+
+    params = canonical_preset_params(preset)
+
+    if params['lut_quantize'] < 2:
+        raise Exception('lut_quantize must be at least 2')
+
+    if params['lut_compress_log2_min'] >= params['lut_compress_log2_max']:
         raise Exception(
-            'table must have 4 dimensions (3 for xyz, 1 for the color channels)'
+            'lut_compress_log2_min must be less than lut_compress_log2_max'
         )
 
-    if table.shape[3] != 3:
-        raise Exception('the fourth axis must have a size of 3 (RGB)')
+    if params['sigmoid_log2_min'] >= params['sigmoid_log2_max']:
+        raise Exception('sigmoid_log2_min must be less than sigmoid_log2_max')
 
-    # LUT decompression: map range
-    table = colour.algebra.linear_conversion(
-        table,
-        np.array([0., 1.]),
-        np.array([
-            preset['lut_compress_log2_min'],
-            preset['lut_compress_log2_max']
-        ])
-    )
+    if not 0. <= params['sigmoid_toe_x'] < params['sigmoid_shoulder_x'] <= 1.:
+        raise Exception(
+            'sigmoid_toe_x and sigmoid_shoulder_x must be in [0, 1] and the '
+            'toe must come before the shoulder'
+        )
 
-    # LUT decompression: exponent
-    colour.algebra.set_spow_enable(True)
-    table = np.power(2., table)
+    if np.dot(params['luminance_weights'], [1., 1., 1.]) == 0.:
+        raise Exception('luminance_weights must not sum to zero')
+
+    return params
 
-    # LUT decompression: offset
-    table -= 2.**preset['lut_compress_log2_min']
 
-    # eliminate negative values
-    table = np.maximum(table, 0.)
+# validate a preset dict and precompute everything that only depends on it
+def compile_preset(preset: dict):
+    if isinstance(preset, CompiledPreset):
+        return preset
 
-    # pre-exposure
-    table *= 2**preset['pre_exposure']
+    params = validated_preset_params(preset)
 
     # gamut extension matrix
     extend_mat = gamut_extension_mat(
-        preset['extended_gamut_red_scale'],
-        preset['extended_gamut_green_scale'],
-        preset['extended_gamut_blue_scale'],
-        preset['extended_gamut_red_rot'],
-        preset['extended_gamut_green_rot'],
-        preset['extended_gamut_blue_rot'],
-        preset['extended_gamut_red_mul'],
-        preset['extended_gamut_green_mul'],
-        preset['extended_gamut_blue_mul']
+        params['extended_gamut_red_scale'],
+        params['extended_gamut_green_scale'],
+        params['extended_gamut_blue_scale'],
+        params['extended_gamut_red_rot'],
+        params['extended_gamut_green_rot'],
+        params['extended_gamut_blue_rot'],
+        params['extended_gamut_red_mul'],
+        params['extended_gamut_green_mul'],
+        params['extended_gamut_blue_mul']
     )
-    extend_mat_inv = np.linalg.inv(extend_mat)
+    try:
+        extend_mat_inv = np.linalg.inv(extend_mat)
+    except np.linalg.LinAlgError:
+        raise Exception('the gamut extension matrix is not invertible')
+
+    layers = normalize_film_layers(film_layers)
+    sensitivity_mat, dye_mat = film_layer_mats(layers)
+
+    luminance_weights = np.array(params['luminance_weights'])
+    luminance_weights_norm = \
+        luminance_weights / np.dot(luminance_weights, np.array([1., 1., 1.]))
+
+    compiled = CompiledPreset(
+        name=preset['name'],
+        info_url=preset['info_url'],
 
-    # backlight in the extended gamut
-    backlight_ext = np.matmul(extend_mat, preset['print_backlight'])
+        params=tuple(sorted(params.items())),
+        key=hash_params(params),
+
+        lut_compress_log2_min=params['lut_compress_log2_min'],
+        lut_compress_log2_max=params['lut_compress_log2_max'],
+        lut_quantize=params['lut_quantize'],
+
+        pre_exposure_mul=2.**params['pre_exposure'],
+        pre_formation_filter=lerp(
+            np.array([1., 1., 1.]),
+            np.array(params['pre_formation_filter']),
+            params['pre_formation_filter_strength']
+        ),
+
+        extend_mat=extend_mat,
+        extend_mat_inv=extend_mat_inv,
+
+        sigmoid_log2_min=params['sigmoid_log2_min'],
+        sigmoid_log2_max=params['sigmoid_log2_max'],
+        sigmoid_params=super_sigmoid_params(
+            params['sigmoid_toe_x'],
+            params['sigmoid_toe_y'],
+            params['sigmoid_shoulder_x'],
+            params['sigmoid_shoulder_y']
+        ),
+        film_layers=layers,
+        sensitivity_mat=sensitivity_mat,
+        dye_mat=dye_mat,
+        negative_exposure_mul=2.**params['negative_film_exposure'],
+        negative_density=params['negative_film_density'],
+        backlight_ext=np.matmul(
+            extend_mat,
+            np.array(params['print_backlight'])
+        ),
+        print_exposure_mul=2.**params['print_film_exposure'],
+        print_density=params['print_film_density'],
+
+        # filled in below
+        white_cap=None,
+        black_cap=None,
+
+        luminance_weights_norm=luminance_weights_norm,
+        black_point=None,
+
+        post_formation_filter=lerp(
+            np.array([1., 1., 1.]),
+            np.array(params['post_formation_filter']),
+            params['post_formation_filter_strength']
+        ),
+
+        midtone_saturation=params['midtone_saturation']
+    )
 
     # upper and lower limits in the print (in the extended gamut!)
     big = 10_000_000.
-    white_cap = negative_and_print(
-        np.array([big, big, big]),
-        preset,
-        backlight_ext
+    white_cap = negative_and_print(np.array([big, big, big]), compiled)
+    black_cap = negative_and_print(np.array([0., 0., 0.]), compiled) \
+        / white_cap
+
+    # black point
+    if params['black_point'] == 'auto':
+        black_point = np.dot(black_cap, luminance_weights_norm)
+    else:
+        black_point = params['black_point'] / 1000.
+
+    compiled = dataclasses.replace(
+        compiled,
+        white_cap=white_cap,
+        black_cap=black_cap,
+        black_point=black_point
     )
-    black_cap = negative_and_print(
-        np.array([0., 0., 0.]),
-        preset,
-        backlight_ext
-    ) / white_cap
 
-    # element-wise transform (calls transform_rgb)
-    if parallel:
-        print('starting parallel element-wise transform...')
+    # make the arrays read-only
+    for field in dataclasses.fields(compiled):
+        value = getattr(compiled, field.name)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
 
-        num_points = table.shape[0] * table.shape[1] * table.shape[2]
-        stride_y = table.shape[0]
-        stride_z = table.shape[0] * table.shape[1]
+    return compiled
 
-        results = joblib.Parallel(n_jobs=8)(
-            joblib.delayed(run_parallel)(
-                table,
-                (i % stride_y, (i % stride_z) // stride_y, i // stride_z),
-                preset,
-                extend_mat,
-                extend_mat_inv,
-                white_cap,
-                black_cap,
-                backlight_ext
-            )
-            for i in range(num_points)
+
+# compile several presets into one CompiledPreset with a leading preset axis,
+# for the batch stages (run_stages). numbers become (presets, 1, 1) arrays, RGB
+# triplets (presets, 1, 3) and matrices (presets, 3, 3), so (samples, 3)
+# inputs broadcast to (presets, samples, 3) outputs. name, info_url, params
+# and lut_quantize are tuples with an item per preset. the gamut matrices and
+# the caps of all presets are computed together. matches compile_preset
+# within rounding errors.
+def compile_presets(presets):
+    if len(presets) == 0:
+        raise Exception('presets must not be empty')
+
+    all_params = [validated_preset_params(preset) for preset in presets]
+
+    # number of every preset as a (presets, 1, 1) array
+    def numbers(key):
+        return np.array(
+            [params[key] for params in all_params]
+        ).reshape(-1, 1, 1)
+
+    # RGB triplet of every preset as a (presets, 1, 3) array
+    def triplets(key):
+        return np.array(
+            [params[key] for params in all_params]
+        ).reshape(-1, 1, 3)
+
+    # RGB values of every preset as a (presets, 3) array
+    def primaries(key):
+        return np.array([
+            [params[f'extended_gamut_{primary}_{key}']
+             for primary in ['red', 'green', 'blue']]
+            for params in all_params
+        ])
+
+    # gamut extension matrices
+    extend_mat = gamut_extension_mat_batch(
+        primaries('scale'),
+        primaries('rot'),
+        primaries('mul')
+    )
+    try:
+        extend_mat_inv = np.linalg.inv(extend_mat)
+    except np.linalg.LinAlgError:
+        singular = [
+            preset['name'] for preset, mat in zip(presets, extend_mat)
+            if np.linalg.matrix_rank(mat) < 3
+        ]
+        raise Exception(
+            f'the gamut extension matrix is not invertible in {singular}'
         )
 
-        # arrange the results
-        print('arranging the results...')
-        for z in range(table.shape[2]):
-            for y in range(table.shape[1]):
-                for x in range(table.shape[0]):
-                    index = x + (y * stride_y) + (z * stride_z)
-                    table[x, y, z] = results[index]
-    else:
+    layers = normalize_film_layers(film_layers)
+    sensitivity_mat, dye_mat = film_layer_mats(layers)
+
+    luminance_weights = triplets('luminance_weights')
+    luminance_weights_norm = \
+        luminance_weights / rgb_dot(luminance_weights, np.array([1., 1., 1.]))
+
+    ones = np.array([1., 1., 1.])
+    sigmoid_log2_min = numbers('sigmoid_log2_min')
+    sigmoid_log2_max = numbers('sigmoid_log2_max')
+
+    compiled = CompiledPreset(
+        name=tuple(preset['name'] for preset in presets),
+        info_url=tuple(preset['info_url'] for preset in presets),
+
+        params=tuple(tuple(sorted(params.items())) for params in all_params),
+        key=hashlib.sha256(' '.join(
+            hash_params(params) for params in all_params
+        ).encode('utf-8')).hexdigest(),
+
+        lut_compress_log2_min=numbers('lut_compress_log2_min'),
+        lut_compress_log2_max=numbers('lut_compress_log2_max'),
+        lut_quantize=tuple(params['lut_quantize'] for params in all_params),
+
+        pre_exposure_mul=2.**numbers('pre_exposure'),
+        pre_formation_filter=lerp(
+            ones,
+            triplets('pre_formation_filter'),
+            numbers('pre_formation_filter_strength')
+        ),
+
+        extend_mat=extend_mat,
+        extend_mat_inv=extend_mat_inv,
+
+        sigmoid_log2_min=sigmoid_log2_min,
+        sigmoid_log2_max=sigmoid_log2_max,
+        sigmoid_params=super_sigmoid_params(
+            numbers('sigmoid_toe_x'),
+            numbers('sigmoid_toe_y'),
+            numbers('sigmoid_shoulder_x'),
+            numbers('sigmoid_shoulder_y')
+        ),
+        film_layers=layers,
+        sensitivity_mat=sensitivity_mat,
+        dye_mat=dye_mat,
+        negative_exposure_mul=2.**numbers('negative_film_exposure'),
+        negative_density=numbers('negative_film_density'),
+        backlight_ext=np.matmul(
+            triplets('print_backlight'),
+            np.swapaxes(extend_mat, -1, -2)
+        ),
+        print_exposure_mul=2.**numbers('print_film_exposure'),
+        print_density=numbers('print_film_density'),
+
+        # filled in below
+        white_cap=None,
+        black_cap=None,
+
+        luminance_weights_norm=luminance_weights_norm,
+        black_point=None,
+
+        post_formation_filter=lerp(
+            ones,
+            triplets('post_formation_filter'),
+            numbers('post_formation_filter_strength')
+        ),
+
+        midtone_saturation=numbers('midtone_saturation')
+    )
+
+    # upper and lower limits in the print (in the extended gamut!), with
+    # exact dye mix factors like in compile_preset
+    big = 10_000_000.
+    with exact_dye_mix():
+        white_cap = negative_and_print_batch(
+            np.array([[big, big, big]]),
+            compiled
+        )
+        black_cap = negative_and_print_batch(
+            np.array([[0., 0., 0.]]),
+            compiled
+        ) / white_cap
+
+    # black points, 'auto' ones are resolved using black_cap
+    auto = np.array(
+        [params['black_point'] == 'auto' for params in all_params]
+    ).reshape(-1, 1, 1)
+    black_point = np.where(
+        auto,
+        rgb_dot(black_cap, luminance_weights_norm),
+        np.array([
+            0. if params['black_point'] == 'auto'
+            else params['black_point'] / 1000.
+            for params in all_params
+        ]).reshape(-1, 1, 1)
+    )
+
+    compiled = dataclasses.replace(
+        compiled,
+        white_cap=white_cap,
+        black_cap=black_cap,
+        black_point=black_point
+    )
+
+    # make the arrays read-only
+    for field in dataclasses.fields(compiled):
+        value = getattr(compiled, field.name)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+    return compiled
+
+
+# evaluate the dye mix factors exactly (dye_mix_max_error = None) within a
+# with block. the dye mix tables are made per preset, so stacked presets (see
+# compile_presets) need this.
+@contextlib.contextmanager
+def exact_dye_mix():
+    global dye_mix_max_error
+    previous_max_error = dye_mix_max_error
+    dye_mix_max_error = None
+    try:
+        yield
+    finally:
+        dye_mix_max_error = previous_max_error
+
+
+# a copy of a compiled preset with its arrays and numbers converted to dtype.
+# NumPy promotes float32 arrays combined with float64 arrays or scalars to
+# float64, so the batch stages need this to keep float32 arrays float32. the
+# copy has the same key (it has the same parameters).
+def compiled_preset_as(compiled: CompiledPreset, dtype):
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        return compiled
+
+    def cast(value):
+        if isinstance(value, np.ndarray):
+            value = value.astype(dtype)
+            value.flags.writeable = False
+            return value
+        if isinstance(value, (float, np.floating)):
+            return dtype.type(value)
+        if isinstance(value, SuperSigmoidParams):
+            return SuperSigmoidParams(*(cast(v) for v in value))
+        if isinstance(value, tuple):
+            return tuple(cast(v) for v in value)
+        return value
+
+    return dataclasses.replace(compiled, **{
+        field.name: cast(getattr(compiled, field.name))
+        for field in dataclasses.fields(compiled)
+        if field.name != 'params'
+    })
+
+
+# transform a 3D LUT (preset can be a dict or a CompiledPreset). if a
+# StageCache is given, the batch stages are used and the output of every stage
+# is cached, so only the stages after the last changed parameter are rerun.
+# progress is an optional callback, called as progress(done, total) with the
+# number of transformed table nodes (see progress.py).
+def apply_transform(
+    table: np.ndarray,
+    preset: dict,
+    stage_cache=None,
+    progress=None
+):
+    if len(table.shape) != 4:
+        raise Exception(
+            'table must have 4 dimensions (3 for xyz, 1 for the color channels)'
+        )
+
+    if table.shape[3] != 3:
+        raise Exception('the fourth axis must have a size of 3 (RGB)')
+
+    import colour
+
+    compiled = compile_preset(preset)
+
+    colour.algebra.set_spow_enable(True)
+
+    # the serial backend is the float64 reference
+    if stage_cache is not None or backend != 'serial':
+        table = np.asarray(table, dtype=compute_dtype)
+        compiled = compiled_preset_as(compiled, compute_dtype)
+
+    num_points = table.size // 3
+    if progress is not None:
+        progress(0, num_points)
+
+    if stage_cache is not None:
+        print('starting cached batch transform...')
+        table = run_stages_cached(table, compiled, stage_cache)
+        if progress is not None:
+            progress(num_points, num_points)
+        return table
+
+    # LUT decompression and pre-exposure
+    table = run_stages(table, compiled, 'decompression', 'pre_exposure')
+
+    # element-wise transform
+    if backend == 'batch':
+        print('starting batch transform...')
+        table = transform_table_batch(table, compiled, progress)
+    elif backend == 'parallel':
+        print('starting parallel transform...')
+        table = transform_table_parallel(table, compiled, progress)
+    elif backend == 'jit':
+        if jit_available():
+            print('starting JIT transform...')
+            table = transform_table_jit(table, compiled, progress)
+        else:
+            print('numba is not installed, starting batch transform...')
+            table = transform_table_batch(table, compiled, progress)
+    elif backend == 'serial':
         print('starting serial element-wise transform...')
+        done = 0
         for z in range(table.shape[2]):
             for y in range(table.shape[1]):
                 if print_indices:
                     print(f'at [0, {y}, {z}]')
                 for x in range(table.shape[0]):
-                    table[x, y, z] = transform_rgb(
-                        table[x, y, z],
-                        preset,
-                        extend_mat,
-                        extend_mat_inv,
-                        white_cap,
-                        black_cap,
-                        backlight_ext
-                    )
+                    table[x, y, z] = transform_rgb(table[x, y, z], compiled)
+
+                done += table.shape[0]
+                if progress is not None:
+                    progress(done, num_points)
+    else:
+        raise Exception(f'unknown backend: {backend}')
 
     # OETF: Linear BT.709 I-D65 -> sRGB
-    table = colour.models.eotf_inverse_sRGB(table)
+    return run_stages(table, compiled, 'oetf', 'oetf')
+
+
+# clip negative values like the RangeTransform in the OCIO config and clamp
+# values above max_input_value. NaNs are treated like negative values (like
+# lut_apply.lut_shaper), since np.fmax ignores them.
+def clip_input(inp):
+    return np.fmin(np.fmax(inp, 0.), max_input_value)
+
+
+# transform a linear BT.709 I-D65 image with the shape (..., 3), usually
+# (height, width, 3), to sRGB. this applies the exact transform (no LUT) and
+# streams tiles of at most tile_pixels pixels (bands along the first axis)
+# through the batch stages, so peak memory only depends on the tile size. each
+# output tile is written to out, which can be a preallocated array or a
+# np.memmap (by default, a new array with the input's float dtype). negative
+# values are clipped like the RangeTransform in the OCIO config (see
+# clip_input, NaNs are treated like negative values). tiles are
+# processed in compute_dtype, with the JIT kernel if backend is 'jit' (and
+# numba is installed).
+def transform_image(image, preset: dict, out=None, tile_pixels=None):
+    if image.ndim < 2 or image.shape[-1] != 3:
+        raise Exception('image must have the shape (..., 3)')
+
+    compiled = compiled_preset_as(compile_preset(preset), compute_dtype)
+
+    if out is None:
+        dtype = image.dtype \
+            if np.issubdtype(image.dtype, np.floating) else np.float32
+        out = np.empty(image.shape, dtype=dtype)
+    elif out.shape != image.shape:
+        raise Exception('out must have the same shape as image')
+
+    if tile_pixels is None:
+        tile_pixels = image_tile_pixels
 
-    return table
+    # number of slices along the first axis per tile
+    slice_pixels = max(image[0].size // 3, 1)
+    band = max(tile_pixels // slice_pixels, 1)
 
+    jit_args = None
+    if backend == 'jit' and jit_available():
+        import flim_jit
+        jit_args = flim_jit.preset_args(compiled)
 
-# calls transform_rgb
+    for start in range(0, image.shape[0], band):
+        tile = np.asarray(image[start:start + band], dtype=compute_dtype)
+        tile = clip_input(tile)
+
+        if jit_args is not None:
+            out[start:start + band] = run_jit(
+                tile,
+                jit_args,
+                pre_exposure=True,
+                oetf=True
+            )
+        else:
+            out[start:start + band] = run_stages(
+                tile,
+                compiled,
+                'pre_exposure',
+                'oetf'
+            )
+
+    return out
+
+
+# transform probe colors (linear BT.709 I-D65, shape (samples, 3)) with many
+# presets (dicts) at once and return the sRGB results as an array with the
+# shape (presets, samples, 3). the presets are compiled and transformed
+# together in groups (see compile_presets), sized so that each group has about
+# batch_chunk_points samples in total. negative values are clipped like in
+# transform_image. first and last select the stages from 'pre_exposure' on
+# (e.g. last='gamut_return' for linear values). runs in compute_dtype with
+# exact dye mix factors.
+def transform_sweep(presets, probes, first='pre_exposure', last='oetf'):
+    probes = clip_input(np.asarray(probes, dtype=compute_dtype))
+    if probes.ndim != 2 or probes.shape[1] != 3:
+        raise Exception('probes must have the shape (samples, 3)')
+
+    import colour
+
+    colour.algebra.set_spow_enable(True)
+
+    group = max(batch_chunk_points // max(probes.shape[0], 1), 1)
+
+    out = np.empty((len(presets), probes.shape[0], 3), dtype=compute_dtype)
+    with exact_dye_mix():
+        for start in range(0, len(presets), group):
+            compiled = compiled_preset_as(
+                compile_presets(presets[start:start + group]),
+                compute_dtype
+            )
+            out[start:start + group] = run_stages(
+                probes,
+                compiled,
+                first,
+                last
+            )
+
+    return out
+
+
+# transform a table of any shape (..., 3) with transform_rgb_batch in chunks of
+# batch_chunk_points nodes, which bounds the size of the temporary arrays and
+# allows reporting progress (the results don't depend on the chunk size). the
+# output has the dtype of the table.
+def transform_table_batch(table, compiled: CompiledPreset, progress=None):
+    num_points = table.size // 3
+    inp = table.reshape(-1, 3)
+    out = np.empty((num_points, 3), dtype=table.dtype)
+
+    for start in range(0, num_points, batch_chunk_points):
+        stop = min(start + batch_chunk_points, num_points)
+        out[start:stop] = transform_rgb_batch(inp[start:stop], compiled)
+        if progress is not None:
+            progress(stop, num_points)
+
+    return out.reshape(table.shape)
+
+
+# is numba installed? (the import is deferred because it's slow)
+def jit_available():
+    import flim_jit
+    return flim_jit.available
+
+
+# run the JIT kernel on a (..., 3) array (timed as a single 'jit' stage if
+# profiling is enabled)
+def run_jit(inp, jit_args, pre_exposure: bool = False, oetf: bool = False):
+    import flim_jit
+
+    if profiler is None:
+        return flim_jit.transform_array(inp, jit_args, pre_exposure, oetf)
+
+    t_start = time.perf_counter()
+    out = flim_jit.transform_array(inp, jit_args, pre_exposure, oetf)
+    profiler.add('jit', time.perf_counter() - t_start, out.size // 3)
+    return out
+
+
+# same as transform_table_batch, but uses the JIT kernel (flim_jit.py), which
+# is parallel within each chunk
+def transform_table_jit(table, compiled: CompiledPreset, progress=None):
+    import flim_jit
+
+    jit_args = flim_jit.preset_args(compiled)
+
+    num_points = table.size // 3
+    inp = table.reshape(-1, 3)
+    out = np.empty((num_points, 3), dtype=table.dtype)
+
+    for start in range(0, num_points, batch_chunk_points):
+        stop = min(start + batch_chunk_points, num_points)
+        out[start:stop] = run_jit(inp[start:stop], jit_args)
+        if progress is not None:
+            progress(stop, num_points)
+
+    return out.reshape(table.shape)
+
+
+# transform a table of any shape (..., 3) using a pool of worker processes.
+# the table is copied into a memory-mapped file (in shared memory if
+# available) that every worker opens, and each worker transforms a contiguous
+# slab of nodes with transform_rgb_batch and writes the results in place. the
+# output has the dtype of the table.
+def transform_table_parallel(table, compiled: CompiledPreset, progress=None):
+    import joblib
+
+    workers = n_jobs if n_jobs is not None else joblib.cpu_count()
+    if workers < 1:
+        raise Exception('n_jobs must be at least 1')
+
+    num_points = table.size // 3
+
+    # a few slabs per worker to balance the load
+    points_per_slab = slab_size
+    if points_per_slab is None:
+        points_per_slab = max(-(-num_points // (workers * 4)), 1)
+
+    temp_dir = tempfile.mkdtemp(
+        prefix='flim_',
+        dir='/dev/shm' if os.path.isdir('/dev/shm') else None
+    )
+    try:
+        path = os.path.join(temp_dir, 'table.dat')
+        shared = np.memmap(
+            path,
+            dtype=table.dtype,
+            mode='w+',
+            shape=(num_points, 3)
+        )
+        shared[:] = table.reshape(-1, 3)
+        shared.flush()
+
+        # slabs are reported as they complete, in any order
+        slab_results = joblib.Parallel(
+            n_jobs=workers,
+            return_as='generator_unordered'
+        )(
+            joblib.delayed(run_parallel)(
+                path,
+                num_points,
+                table.dtype.str,
+                start,
+                min(start + points_per_slab, num_points),
+                compiled,
+                dye_mix_max_error,
+                profiler is not None
+            )
+            for start in range(0, num_points, points_per_slab)
+        )
+
+        done = 0
+        for count, stats in slab_results:
+            done += count
+            if progress is not None:
+                progress(done, num_points)
+
+            # stage times of the workers are summed (CPU time, not wall time)
+            if profiler is not None:
+                profiler.merge(stats)
+
+        result = np.array(shared).reshape(table.shape)
+        del shared
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return result
+
+
+# transforms nodes [start, stop) of a memory-mapped table of the given dtype
+# in place (runs in a worker process, calls transform_rgb_batch with the
+# caller's dye_mix_max_error). returns the number of nodes and the stage
+# timings (if profile is True, otherwise None).
 def run_parallel(
-        table,
-        indices,
-        preset: dict,
-        extend_mat,
-        extend_mat_inv,
-        white_cap,
-        black_cap,
-        backlight_ext
+    path,
+    num_points,
+    dtype,
+    start,
+    stop,
+    compiled: CompiledPreset,
+    max_error=None,
+    profile: bool = False
 ):
-    result = transform_rgb(
-        table[indices],
-        preset,
-        extend_mat,
-        extend_mat_inv,
-        white_cap,
-        black_cap,
-        backlight_ext
+    # the worker gets its own profiler and settings (joblib may run this in
+    # the main process, so the previous ones are restored)
+    global profiler, dye_mix_max_error
+    previous_profiler = profiler
+    previous_max_error = dye_mix_max_error
+    profiler = None
+    dye_mix_max_error = max_error
+    if profile:
+        from profiling import Profiler
+        profiler = Profiler()
+
+    try:
+        shared = np.memmap(
+            path,
+            dtype=dtype,
+            mode='r+',
+            shape=(num_points, 3)
+        )
+
+        shared[start:stop] = transform_rgb_batch(shared[start:stop], compiled)
+        shared.flush()
+
+        if print_indices:
+            print(f'[{start}, {stop}) done')
+
+        return stop - start, profiler.to_dict() if profile else None
+    finally:
+        profiler = previous_profiler
+        dye_mix_max_error = previous_max_error
+
+
+def negative_develop(inp, compiled: CompiledPreset):
+    return rgb_develop(
+        inp,
+        compiled.negative_exposure_mul,
+        compiled.film_layers,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.negative_density
     )
 
-    if print_indices:
-        print(f'{indices} done')
 
-    return result
+# backlight and develop print
+def print_develop(inp, compiled: CompiledPreset):
+    return rgb_develop(
+        inp * compiled.backlight_ext,
+        compiled.print_exposure_mul,
+        compiled.film_layers,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.print_density
+    )
+
 
+def negative_and_print(inp, compiled: CompiledPreset):
+    return print_develop(negative_develop(inp, compiled), compiled)
 
-def negative_and_print(inp, preset: dict, backlight_ext):
-    log2_min = preset['sigmoid_log2_min']
-    log2_max = preset['sigmoid_log2_max']
-    sigmoid_points = np.array([
-        preset['sigmoid_toe_x'],
-        preset['sigmoid_toe_y'],
-        preset['sigmoid_shoulder_x'],
-        preset['sigmoid_shoulder_y']
-    ])
 
+# same as negative_and_print, but for (..., 3) arrays
+def negative_and_print_batch(inp, compiled: CompiledPreset):
     # develop negative
-    inp = rgb_develop(
+    inp = rgb_develop_batch(
         inp,
-        preset['negative_film_exposure'],
-        log2_min,
-        log2_max,
-        sigmoid_points,
-        preset['negative_film_density']
+        compiled.negative_exposure_mul,
+        compiled.sensitivity_mat,
+        compiled.dye_mat,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.negative_density,
+        dye_mix_max_error
     )
 
     # backlight
-    inp = inp * backlight_ext
+    inp = inp * compiled.backlight_ext
 
     # develop print
-    inp = rgb_develop(
+    inp = rgb_develop_batch(
         inp,
-        preset['print_film_exposure'],
-        log2_min,
-        log2_max,
-        sigmoid_points,
-        preset['print_film_density']
+        compiled.print_exposure_mul,
+        compiled.sensitivity_mat,
+        compiled.dye_mat,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.print_density,
+        dye_mix_max_error
     )
 
     return inp
 
 
 # transform a single RGB triplet (you should never directly call this function)
-def transform_rgb(
-    inp,
-    preset: dict,
-    extend_mat,
-    extend_mat_inv,
-    white_cap,
-    black_cap,
-    backlight_ext
-):
-    luminance_weights = preset['luminance_weights']
-    luminance_weights_norm = \
-        luminance_weights / np.dot(luminance_weights, np.array([1., 1., 1.]))
+def transform_rgb(inp, compiled: CompiledPreset):
+    if profiler is not None:
+        profiler.restart()
 
     # pre-formation filter
-    inp = inp * lerp(
-        np.array([1., 1., 1.]),
-        preset['pre_formation_filter'],
-        preset['pre_formation_filter_strength']
-    )
+    inp = inp * compiled.pre_formation_filter
+    if profiler is not None:
+        profiler.lap('pre_formation_filter')
 
     # convert to the extended gamut
-    inp = np.matmul(extend_mat, inp)
+    inp = np.matmul(compiled.extend_mat, inp)
+    if profiler is not None:
+        profiler.lap('gamut_extension')
 
-    # develop negative and print
-    inp = negative_and_print(inp, preset, backlight_ext)
+    # develop negative
+    inp = negative_develop(inp, compiled)
+    if profiler is not None:
+        profiler.lap('negative_develop')
+
+    # develop print
+    inp = print_develop(inp, compiled)
+    if profiler is not None:
+        profiler.lap('print_develop')
 
     # white cap
-    inp /= white_cap
+    inp /= compiled.white_cap
 
     # black cap
-    if preset['black_point'] in ['Auto', 'auto', '', None]:
-        inp = rgb_uniform_offset(
-            inp,
-            np.dot(black_cap, luminance_weights_norm),
-            0.,
-            luminance_weights_norm
-        )
-    else:
-        inp = rgb_uniform_offset(
-            inp,
-            preset['black_point'] / 1000.,
-            0.,
-            luminance_weights_norm
-        )
+    inp = rgb_uniform_offset(
+        inp,
+        compiled.black_point,
+        0.,
+        compiled.luminance_weights_norm
+    )
+    if profiler is not None:
+        profiler.lap('caps')
 
     # convert from the extended gamut and clip out-of-gamut triplets
-    inp = np.matmul(extend_mat_inv, inp)
+    inp = np.matmul(compiled.extend_mat_inv, inp)
     inp = np.maximum(inp, 0.)
+    if profiler is not None:
+        profiler.lap('gamut_return')
 
     # post-formation filter
-    inp = inp * lerp(
-        np.array([1., 1., 1.]),
-        preset['post_formation_filter'],
-        preset['post_formation_filter_strength']
-    )
+    inp = inp * compiled.post_formation_filter
 
     # clip
     inp = np.clip(inp, 0., 1.)
+    if profiler is not None:
+        profiler.lap('post_filter')
 
     # midtone saturation
-    mono = np.dot(inp, luminance_weights_norm)
+    mono = np.dot(inp, compiled.luminance_weights_norm)
     midtone_fac = max(1. - (abs(mono - .5) / .45), 0.)
     inp = lerp(
         inp,
-        rgb_adjust_hsv(inp, .5, preset['midtone_saturation'], 1.),
+        rgb_adjust_hsv(inp, .5, compiled.midtone_saturation, 1.),
         midtone_fac
     )
 
     # clip and return
+    inp = np.clip(inp, 0., 1.)
+    if profiler is not None:
+        profiler.lap('midtone_saturation')
+
+    return inp
+
+
+# transform an array of RGB triplets with the shape (..., 3) (you should never
+# directly call this function)
+# this runs the stages from pre_formation_filter to midtone_saturation, which
+# follow transform_rgb step by step using array operations, and matches it
+# within an absolute error of 1e-9 per channel (float64). transform_rgb is the
+# reference implementation.
+def transform_rgb_batch(inp, compiled: CompiledPreset):
+    return run_stages(
+        inp,
+        compiled,
+        'pre_formation_filter',
+        'midtone_saturation'
+    )
+
+
+# LUT decompression: map range, exponent, offset, and eliminate negative values
+# (colour computes in float64, the output keeps the input's dtype)
+def stage_decompression(inp, compiled: CompiledPreset):
+    import colour
+
+    dtype = inp.dtype
+    inp = colour.algebra.linear_conversion(
+        inp,
+        np.array([0., 1.]),
+        np.array([
+            compiled.lut_compress_log2_min,
+            compiled.lut_compress_log2_max
+        ])
+    )
+    inp = np.power(2., inp)
+    inp = inp - 2.**compiled.lut_compress_log2_min
+    return np.maximum(inp, 0.).astype(dtype, copy=False)
+
+
+def stage_pre_exposure(inp, compiled: CompiledPreset):
+    return inp * compiled.pre_exposure_mul
+
+
+def stage_pre_formation_filter(inp, compiled: CompiledPreset):
+    return inp * compiled.pre_formation_filter
+
+
+# convert to the extended gamut (the matrices may be stacked, see
+# compile_presets)
+def stage_gamut_extension(inp, compiled: CompiledPreset):
+    return np.matmul(inp, np.swapaxes(compiled.extend_mat, -1, -2))
+
+
+def stage_negative_develop(inp, compiled: CompiledPreset):
+    return rgb_develop_batch(
+        inp,
+        compiled.negative_exposure_mul,
+        compiled.sensitivity_mat,
+        compiled.dye_mat,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.negative_density,
+        dye_mix_max_error
+    )
+
+
+# backlight and develop print
+def stage_print_develop(inp, compiled: CompiledPreset):
+    return rgb_develop_batch(
+        inp * compiled.backlight_ext,
+        compiled.print_exposure_mul,
+        compiled.sensitivity_mat,
+        compiled.dye_mat,
+        compiled.sigmoid_log2_min,
+        compiled.sigmoid_log2_max,
+        compiled.sigmoid_params,
+        compiled.print_density,
+        dye_mix_max_error
+    )
+
+
+# white cap and black cap
+def stage_caps(inp, compiled: CompiledPreset):
+    return rgb_uniform_offset_batch(
+        inp / compiled.white_cap,
+        compiled.black_point,
+        0.,
+        compiled.luminance_weights_norm
+    )
+
+
+# convert from the extended gamut and clip out-of-gamut triplets
+def stage_gamut_return(inp, compiled: CompiledPreset):
+    return np.maximum(
+        np.matmul(inp, np.swapaxes(compiled.extend_mat_inv, -1, -2)),
+        0.
+    )
+
+
+# post-formation filter and clip
+def stage_post_filter(inp, compiled: CompiledPreset):
+    return np.clip(inp * compiled.post_formation_filter, 0., 1.)
+
+
+# midtone saturation and clip
+def stage_midtone_saturation(inp, compiled: CompiledPreset):
+    mono = rgb_dot(inp, compiled.luminance_weights_norm)
+    midtone_fac = np.maximum(1. - (np.abs(mono - .5) / .45), 0.)
+    inp = lerp(
+        inp,
+        rgb_adjust_hsv_batch(inp, .5, compiled.midtone_saturation, 1.),
+        midtone_fac
+    )
     return np.clip(inp, 0., 1.)
+
+
+# OETF: Linear BT.709 I-D65 -> sRGB (colour computes in float64, the output
+# keeps the input's dtype)
+def stage_oetf(inp, compiled: CompiledPreset):
+    import colour
+
+    return colour.models.eotf_inverse_sRGB(inp).astype(inp.dtype, copy=False)
+
+
+# the stages of the batch transform in order, as (name, function, preset keys
+# read by the stage). keys read by earlier stages aren't repeated, since a
+# change in an earlier stage invalidates every stage after it anyway. stage
+# functions never modify their input.
+stages = [
+    (
+        'decompression',
+        stage_decompression,
+        ['lut_compress_log2_min', 'lut_compress_log2_max']
+    ),
+    (
+        'pre_exposure',
+        stage_pre_exposure,
+        ['pre_exposure']
+    ),
+    (
+        'pre_formation_filter',
+        stage_pre_formation_filter,
+        ['pre_formation_filter', 'pre_formation_filter_strength']
+    ),
+    (
+        'gamut_extension',
+        stage_gamut_extension,
+        [
+            'extended_gamut_red_scale',
+            'extended_gamut_green_scale',
+            'extended_gamut_blue_scale',
+            'extended_gamut_red_rot',
+            'extended_gamut_green_rot',
+            'extended_gamut_blue_rot',
+            'extended_gamut_red_mul',
+            'extended_gamut_green_mul',
+            'extended_gamut_blue_mul'
+        ]
+    ),
+    (
+        'negative_develop',
+        stage_negative_develop,
+        [
+            'sigmoid_log2_min',
+            'sigmoid_log2_max',
+            'sigmoid_toe_x',
+            'sigmoid_toe_y',
+            'sigmoid_shoulder_x',
+            'sigmoid_shoulder_y',
+            'negative_film_exposure',
+            'negative_film_density'
+        ]
+    ),
+    (
+        'print_develop',
+        stage_print_develop,
+        ['print_backlight', 'print_film_exposure', 'print_film_density']
+    ),
+    (
+        'caps',
+        stage_caps,
+        ['luminance_weights', 'black_point']
+    ),
+    (
+        'gamut_return',
+        stage_gamut_return,
+        []
+    ),
+    (
+        'post_filter',
+        stage_post_filter,
+        ['post_formation_filter', 'post_formation_filter_strength']
+    ),
+    (
+        'midtone_saturation',
+        stage_midtone_saturation,
+        ['midtone_saturation']
+    ),
+    (
+        'oetf',
+        stage_oetf,
+        []
+    )
+]
+
+stage_names = [name for name, _, _ in stages]
+
+
+# the stages from first to last (inclusive)
+def stage_range(first: str, last: str):
+    for name in [first, last]:
+        if name not in stage_names:
+            raise Exception(f'unknown stage: {name}')
+
+    return stages[stage_names.index(first):stage_names.index(last) + 1]
+
+
+# run a single stage on a (..., 3) array (timed if profiling is enabled)
+def run_stage(name: str, function, inp, compiled: CompiledPreset):
+    if profiler is None:
+        return function(inp, compiled)
+
+    t_start = time.perf_counter()
+    out = function(inp, compiled)
+    profiler.add(name, time.perf_counter() - t_start, out.size // 3)
+    return out
+
+
+# run the stages from first to last (inclusive) on a (..., 3) array
+def run_stages(inp, compiled: CompiledPreset, first: str, last: str):
+    for name, function, _ in stage_range(first, last):
+        inp = run_stage(name, function, inp, compiled)
+    return inp
+
+
+# in-memory LRU cache for the outputs of the transform stages. it can be
+# shared between threads (e.g. a cancelled preview that's still finishing a
+# chunk and the preview that replaces it).
+class StageCache:
+    def __init__(self, max_bytes: int = 1024**3):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key: str, value: np.ndarray):
+        value.flags.writeable = False
+
+        with self._lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key).nbytes
+
+            self.entries[key] = value
+            self.nbytes += value.nbytes
+
+            # evict the least recently used outputs (but keep the newest)
+            while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+# cache keys of the outputs of the stages from first to last for a given
+# input. each key covers the input (and dye_mix_max_error), the stage and
+# every stage before it.
+def stage_keys(inp, compiled: CompiledPreset, first: str, last: str):
+    inp = np.ascontiguousarray(inp)
+    h = hashlib.sha256()
+    h.update(
+        f'{inp.dtype.str} {inp.shape} {dye_mix_max_error}'.encode('utf-8')
+    )
+    h.update(inp.data)
+    key = h.hexdigest()
+
+    params = dict(compiled.params)
+    keys = []
+    for name, _, param_keys in stage_range(first, last):
+        key = hash_params({
+            'input': key,
+            'stage': name,
+            'params': {k: params[k] for k in param_keys}
+        })
+        keys.append(key)
+
+    return keys
+
+
+# same as run_stages, but reuses cached stage outputs and caches new ones.
+# only the stages after the last one with a cached output are run.
+def run_stages_cached(
+    inp,
+    compiled: CompiledPreset,
+    cache: StageCache,
+    first: str = 'decompression',
+    last: str = 'oetf'
+):
+    selected = stage_range(first, last)
+    keys = stage_keys(inp, compiled, first, last)
+
+    # find the last cached output
+    start = 0
+    for i in reversed(range(len(selected))):
+        cached = cache.get(keys[i])
+        if cached is not None:
+            inp = cached
+            start = i + 1
+            break
+
+    for i in range(start, len(selected)):
+        inp = run_stage(selected[i][0], selected[i][1], inp, compiled)
+        cache.put(keys[i], inp)
+
+    # the cached arrays are read-only
+    return inp.copy()
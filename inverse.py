@@ -0,0 +1,723 @@
+"""
+
+inverse of flim: sRGB display values back to scene-linear BT.709 I-D65
+
+python inverse.py                   inverse LUTs of all the presets
+python inverse.py silver --size 65  select presets and the LUT size
+
+the forward transform is evaluated on a LUT grid (in flim's LUT compression
+space), and its sRGB outputs are put in uniform grids of cells. each color to
+invert starts from the few forward nodes with the nearest outputs, found by
+only searching the cells around it, and is then refined with Levenberg-
+Marquardt steps through the batch stages. colors that don't converge (the
+transform folds near white and for some saturated colors) are refined again
+from a neighbourhood of forward nodes. display colors that flim can't produce
+are mapped to a color with the nearest output it can produce.
+
+many scene colors give the same display color (for example everything that
+clips to white), so the darkest one is preferred.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import argparse
+import numpy as np
+import os
+import time
+from typing import NamedTuple
+
+import flim
+from presets import *
+
+
+# number of colors inverted at once (bounds the size of the temporary arrays)
+inverse_chunk_points = 16384
+
+# number of nearest forward nodes every color is refined from (the nearest
+# node can lead into a clip or a fold of the transform)
+inverse_starts = 4
+
+# roundtrip error above which a color is refined again from other forward
+# nodes (see invert_coords)
+retry_tolerance = 1e-9
+
+# maximum number of forward nodes kept per grid cell. cells only hold nodes
+# with nearly the same output, so the darkest ones are enough as guesses.
+cell_capacity = 8
+
+# roundtrip error (max over the channels) above which a color is considered
+# out of flim's output range in the reports
+reachable_tolerance = 1e-3
+
+
+# uniform grid of cells over [0, 1]^3 for nearest-neighbour searches among
+# points (an (n, 3) array). the points of every cell are stored contiguously
+# (sorted by cell), at most capacity per cell, preferring the points with the
+# lowest priority.
+class UniformGrid:
+    def __init__(self, points, resolution: int, capacity=None, priority=None):
+        self.resolution = resolution
+        self.points = np.asarray(points, dtype=np.float64)
+
+        cells = self.cell_ids(self.points)
+        if priority is None:
+            priority = np.zeros(len(cells))
+        order = np.lexsort((priority, cells))
+        cells = cells[order]
+
+        # rank of every point within its cell
+        counts = np.bincount(cells, minlength=resolution**3)
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(cells)) - starts[cells]
+
+        if capacity is not None:
+            order = order[rank < capacity]
+            cells = cells[rank < capacity]
+            counts = np.minimum(counts, capacity)
+            starts = np.cumsum(counts) - counts
+
+        # indices of the points, sorted by cell, and the slice of every cell
+        self.order = order
+        self.starts = starts
+        self.counts = counts
+
+    def cell_coords(self, points):
+        return np.clip(
+            np.floor(points * self.resolution).astype(np.intp),
+            0,
+            self.resolution - 1
+        )
+
+    def cell_ids(self, points):
+        coords = self.cell_coords(points)
+        return (coords[:, 0] * self.resolution + coords[:, 1]) \
+            * self.resolution + coords[:, 2]
+
+    # indices of the candidates in the cells at distance radius (in cells,
+    # max over the axes) from every query cell, as (query index, point index)
+    # arrays
+    def candidates(self, query_cells, radius: int):
+        span = np.arange(-radius, radius + 1)
+        offsets = np.stack(
+            np.meshgrid(span, span, span, indexing='ij'),
+            axis=-1
+        ).reshape(-1, 3)
+        offsets = offsets[np.max(np.abs(offsets), axis=-1) == radius]
+
+        cells = query_cells[:, np.newaxis, :] + offsets
+        inside = np.all((cells >= 0) & (cells < self.resolution), axis=-1)
+        cells = np.clip(cells, 0, self.resolution - 1)
+        ids = (cells[..., 0] * self.resolution + cells[..., 1]) \
+            * self.resolution + cells[..., 2]
+
+        counts = np.where(inside, self.counts[ids], 0).ravel()
+        starts = self.starts[ids].ravel()
+        total = np.sum(counts)
+
+        query_index = np.repeat(
+            np.repeat(np.arange(len(query_cells)), len(offsets)),
+            counts
+        )
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        point_index = self.order[np.repeat(starts, counts) + within]
+
+        return query_index, point_index
+
+    # indices of the first points of every block of block^3 cells (that has
+    # any points)
+    def block_firsts(self, block: int):
+        cells = self.cell_coords(self.points[self.order]) // block
+        ids = (cells[:, 0] * self.resolution + cells[:, 1]) \
+            * self.resolution + cells[:, 2]
+        return self.order[np.unique(ids, return_index=True)[1]]
+
+    # merge candidates (query index, point index and distance arrays, as
+    # returned by candidates) into the k nearest points found so far (nearest
+    # and distance, (queries, k) arrays sorted by distance, -1 and inf where
+    # nothing was found yet). candidates already in nearest are skipped.
+    @staticmethod
+    def merge(nearest, distance, query_index, point_index, d):
+        k = nearest.shape[1]
+        d = np.where(
+            np.any(point_index[:, np.newaxis] == nearest[query_index], axis=-1),
+            np.inf,
+            d
+        )
+
+        # the k closest candidates of every query
+        ranked = np.lexsort((d, query_index))
+        query_index = query_index[ranked]
+        counts = np.bincount(query_index, minlength=len(nearest))
+        rank = np.arange(len(ranked)) \
+            - np.repeat(np.cumsum(counts) - counts, counts)
+        kept = rank < k
+
+        found = np.full(nearest.shape, -1, dtype=np.intp)
+        found_distance = np.full(nearest.shape, np.inf)
+        found[query_index[kept], rank[kept]] = point_index[ranked][kept]
+        found_distance[query_index[kept], rank[kept]] = d[ranked][kept]
+
+        merged = np.concatenate([nearest, found], axis=-1)
+        merged_distance = np.concatenate([distance, found_distance], axis=-1)
+        order = np.argsort(merged_distance, axis=-1, kind='stable')[:, :k]
+        return (
+            np.take_along_axis(merged, order, axis=-1),
+            np.take_along_axis(merged_distance, order, axis=-1)
+        )
+
+    # indices of the k nearest points (among the ones kept in the cells) to
+    # every query and the distances to them, as (queries, k) arrays sorted by
+    # distance (-1 and inf if there are fewer than k points). the search grows
+    # ring by ring until the k-th nearest point found is closer than the
+    # unsearched cells. queries without k points within max_radius cells
+    # (colors far from flim's output range) get the nearest of the first
+    # points of every block of block^3 cells instead (brute force), which are
+    # at most a block diagonal farther than the nearest points (unless
+    # fallback is False, then they only get the points within max_radius
+    # cells).
+    def nearest(
+        self,
+        queries,
+        k: int = 1,
+        max_radius: int = 2,
+        block: int = 3,
+        fallback: bool = True
+    ):
+        queries = np.asarray(queries, dtype=np.float64)
+        query_cells = self.cell_coords(queries)
+
+        nearest = np.full((len(queries), k), -1, dtype=np.intp)
+        distance = np.full((len(queries), k), np.inf)
+        pending = np.arange(len(queries))
+
+        for radius in range(max_radius + 1):
+            query_index, point_index = self.candidates(
+                query_cells[pending],
+                radius
+            )
+
+            d = np.sqrt(np.sum(
+                (self.points[point_index] - queries[pending[query_index]])**2,
+                axis=-1
+            ))
+            nearest[pending], distance[pending] = self.merge(
+                nearest[pending],
+                distance[pending],
+                query_index,
+                point_index,
+                d
+            )
+
+            # every point within radius cells of a query has been checked
+            done = distance[pending, -1] <= radius / self.resolution
+            pending = pending[~done]
+            if len(pending) == 0:
+                return nearest, distance
+
+        if not fallback:
+            return nearest, distance
+
+        firsts = self.block_firsts(block)
+        first_points = self.points[firsts]
+        for start in range(0, len(pending), 256):
+            chunk = pending[start:start + 256]
+            d = np.sqrt(np.maximum(
+                np.sum(queries[chunk]**2, axis=-1)[:, np.newaxis]
+                - 2. * np.matmul(queries[chunk], first_points.T)
+                + np.sum(first_points**2, axis=-1),
+                0.
+            ))
+
+            # only the k closest of every query can be merged
+            closest = np.argpartition(
+                d,
+                min(k, d.shape[1]) - 1,
+                axis=-1
+            )[:, :k]
+            nearest[chunk], distance[chunk] = self.merge(
+                nearest[chunk],
+                distance[chunk],
+                np.repeat(np.arange(len(chunk)), closest.shape[1]),
+                firsts[closest].ravel(),
+                np.take_along_axis(d, closest, axis=-1).ravel()
+            )
+
+        return nearest, distance
+
+
+# forward transform from LUT coordinates (flim's LUT compression space) to
+# sRGB, with exact dye mix factors. the inverse always runs in float64, since
+# the finite differences need it.
+def forward(coords, compiled):
+    with flim.exact_dye_mix():
+        return flim.run_stages(coords, compiled, 'decompression', 'oetf')
+
+
+# forward without the clips after the caps (and without the midtone
+# saturation), which keeps the derivatives of the clipped channels
+def forward_unclipped(coords, compiled):
+    with flim.exact_dye_mix():
+        inp = flim.run_stages(coords, compiled, 'decompression', 'caps')
+    inp = np.matmul(inp, compiled.extend_mat_inv.T) \
+        * compiled.post_formation_filter
+    return flim.run_stages(inp, compiled, 'oetf', 'oetf')
+
+
+# jacobians (..., channel, axis) of function at coords, with forward
+# differences (stepping inwards at the upper bound)
+def jacobians(function, coords, outputs, compiled, h=1e-5):
+    steps = np.where(coords + h <= 1., h, -h)
+    shifted = np.repeat(coords[:, np.newaxis, :], 3, axis=1)
+    shifted[:, [0, 1, 2], [0, 1, 2]] += steps
+    shifted_outputs = function(shifted.reshape(-1, 3), compiled) \
+        .reshape(-1, 3, 3)
+
+    return np.swapaxes(
+        (shifted_outputs - outputs[:, np.newaxis, :])
+        / steps[:, :, np.newaxis],
+        1,
+        2
+    )
+
+
+# the forward nodes of a LUT with size nodes per axis (their coordinates) and
+# two UniformGrids of their sRGB outputs, one that prefers the darkest nodes
+# in its cells and a finer one that prefers the brightest
+class ForwardIndex(NamedTuple):
+    coords: np.ndarray
+    grid: UniformGrid
+    bright_grid: UniformGrid
+    size: int
+
+
+# the ForwardIndex of a LUT with forward_size nodes per axis
+def forward_index(compiled, forward_size: int):
+    import colour
+
+    coords = colour.LUT3D.linear_table(forward_size).reshape(-1, 3)
+    outputs = np.empty(coords.shape)
+    for start in range(0, len(coords), flim.batch_chunk_points):
+        stop = start + flim.batch_chunk_points
+        outputs[start:stop] = forward(coords[start:stop], compiled)
+
+    # about 2 nodes per cell if they were spread evenly
+    resolution = max(int(round((len(coords) / 2.)**(1. / 3.))), 1)
+    grid = UniformGrid(
+        outputs,
+        resolution,
+        cell_capacity,
+        priority=np.sum(coords, axis=-1)
+    )
+
+    # most outputs are near white, so a cell of the coarse grid can hold a
+    # third of all the nodes
+    bright_grid = UniformGrid(
+        outputs,
+        resolution * 4,
+        cell_capacity * 2,
+        priority=-np.sum(coords, axis=-1)
+    )
+
+    return ForwardIndex(coords, grid, bright_grid, forward_size)
+
+
+# channels of outputs that are clipped to zero or one while their targets
+# (both (n, 3) arrays) aren't
+def clipped_channels(outputs, targets, epsilon=1e-12):
+    return ((outputs <= epsilon) & (targets > epsilon)) \
+        | ((outputs >= 1. - epsilon) & (targets < 1. - epsilon))
+
+
+# residuals (targets - outputs) of LUT coordinates with their forward outputs.
+# channels that are clipped (see clipped_channels) use the value of
+# forward_unclipped instead, which keeps measuring how far past the clip they
+# are. returns the residuals and the mask of the clipped channels.
+def residuals_of(coords, outputs, targets, compiled):
+    residuals = targets - outputs
+    clipped = clipped_channels(outputs, targets)
+
+    rows = np.nonzero(np.any(clipped, axis=-1))[0]
+    if len(rows) > 0:
+        unclipped = forward_unclipped(coords[rows], compiled)
+        residuals[rows] = np.where(
+            clipped[rows],
+            targets[rows] - unclipped,
+            residuals[rows]
+        )
+
+    return residuals, clipped
+
+
+# Levenberg-Marquardt steps (an (n, 3) array) at LUT coordinates coords with
+# jacobians (n, channel, axis), residuals and damping factors (both (n,)).
+# the damping is scaled per axis, since near white some axes have derivatives
+# many orders of magnitude smaller than the others, and a fraction of the
+# largest one keeps the steps along the flat axes short when the damping
+# grows. coordinates at a bound of the LUT's range whose steps point outwards
+# are held fixed and the others are solved again (a few times), since the
+# clipped step usually doesn't reduce the error.
+def damped_steps(coords, jacobian, residuals, damping):
+    blocked = np.zeros(coords.shape, dtype=bool)
+    for _ in range(3):
+        free_jacobian = np.where(blocked[:, np.newaxis, :], 0., jacobian)
+        jt = np.swapaxes(free_jacobian, 1, 2)
+        jtj = np.matmul(jt, free_jacobian)
+
+        diagonal = np.diagonal(jtj, axis1=1, axis2=2)
+        regularization = damping[:, np.newaxis] * (
+            diagonal + 1e-3 * np.max(diagonal, axis=-1, keepdims=True)
+        ) + 1e-300
+        jtj += regularization[:, :, np.newaxis] * np.eye(3)
+
+        delta = np.linalg.solve(
+            jtj,
+            np.matmul(jt, residuals[..., np.newaxis])
+        )[..., 0]
+
+        outwards = ((coords <= 0.) & (delta < 0.)) \
+            | ((coords >= 1.) & (delta > 0.))
+        if not np.any(outwards & ~blocked):
+            break
+        blocked |= outwards
+
+    delta[blocked] = 0.
+    return delta
+
+
+# Levenberg-Marquardt refinement of LUT coordinates (coords) so that their
+# forward transforms get closer to targets (sRGB). the Jacobian is computed
+# with finite differences. channels that are clipped (and have no derivative)
+# use the value and the derivative of forward_unclipped instead, both in the
+# steps and when comparing the errors, so that they can be brought back into
+# range. the steps are limited to a radius (max over the axes) around the
+# current coordinates. after every step that doesn't reduce the error of a
+# color, its damping grows tenfold and its radius is halved (a few times, then
+# it's stuck), and after every step that does, they shrink and grow again.
+# returns the refined coordinates and the remaining error (max over the
+# channels).
+def refine(coords, targets, compiled, iterations: int = 16, damping=1e-6):
+    coords = coords.copy()
+    outputs = forward(coords, compiled)
+    residuals, clipped = residuals_of(coords, outputs, targets, compiled)
+    errors = np.sum(residuals**2, axis=-1)
+    dampings = np.full(len(coords), damping)
+    radii = np.full(len(coords), .25)
+
+    # colors that are neither converged nor stuck
+    active = np.nonzero(errors > 1e-24)[0]
+
+    for _ in range(iterations):
+        if len(active) == 0:
+            break
+
+        # jacobian[i, channel, axis]
+        jacobian = jacobians(forward, coords[active], outputs[active], compiled)
+
+        rows = np.nonzero(np.any(clipped[active], axis=-1))[0]
+        if len(rows) > 0:
+            indices = active[rows]
+            unclipped_jacobian = jacobians(
+                forward_unclipped,
+                coords[indices],
+                targets[indices] - residuals[indices],
+                compiled
+            )
+            jacobian[rows] = np.where(
+                clipped[indices][..., np.newaxis],
+                unclipped_jacobian,
+                jacobian[rows]
+            )
+
+        pending = np.arange(len(active))
+        for _ in range(8):
+            indices = active[pending]
+            delta = damped_steps(
+                coords[indices],
+                jacobian[pending],
+                residuals[indices],
+                dampings[indices]
+            )
+            delta *= np.minimum(
+                radii[indices] / (np.max(np.abs(delta), axis=-1) + 1e-300),
+                1.
+            )[:, np.newaxis]
+            candidates = np.clip(coords[indices] + delta, 0., 1.)
+            candidate_outputs = forward(candidates, compiled)
+            candidate_residuals, candidate_clipped = residuals_of(
+                candidates,
+                candidate_outputs,
+                targets[indices],
+                compiled
+            )
+            candidate_errors = np.sum(candidate_residuals**2, axis=-1)
+
+            better = candidate_errors < errors[indices]
+            improved = indices[better]
+            coords[improved] = candidates[better]
+            outputs[improved] = candidate_outputs[better]
+            residuals[improved] = candidate_residuals[better]
+            clipped[improved] = candidate_clipped[better]
+            errors[improved] = candidate_errors[better]
+            dampings[improved] = np.maximum(dampings[improved] * .1, 1e-12)
+            radii[improved] = np.minimum(radii[improved] * 2., 1.)
+
+            pending = pending[~better]
+            dampings[active[pending]] *= 10.
+            radii[active[pending]] *= .5
+            if len(pending) == 0:
+                break
+
+        stuck = np.zeros(len(active), dtype=bool)
+        stuck[pending] = True
+        active = active[~stuck & (errors[active] > 1e-24)]
+
+    return coords, np.max(np.abs(targets - outputs), axis=-1)
+
+
+# refine colors (an (n, 3) array) from several starts (LUT coordinates, an
+# (n, starts, 3) array) and keep the result with the lowest roundtrip error of
+# every color (the darkest one if several are as good). returns the LUT
+# coordinates and the roundtrip errors (max over the channels).
+def refine_best(colors, starts, compiled, iterations: int):
+    k = starts.shape[1]
+    candidates, candidate_errors = refine(
+        starts.reshape(-1, 3),
+        np.repeat(colors, k, axis=0),
+        compiled,
+        iterations
+    )
+    candidates = candidates.reshape(-1, k, 3)
+    candidate_errors = candidate_errors.reshape(-1, k)
+
+    good = candidate_errors \
+        <= np.min(candidate_errors, axis=-1, keepdims=True) + 1e-9
+    best = np.argmin(
+        np.where(good, np.sum(candidates, axis=-1), np.inf),
+        axis=-1
+    )
+    rows = np.arange(len(best))
+    return candidates[rows, best], candidate_errors[rows, best]
+
+
+# invert sRGB colors (an (n, 3) array) with a compiled preset and a
+# ForwardIndex. every color is refined from its inverse_starts nearest forward
+# nodes among the darkest ones. near white, the darkest nodes often lead into
+# a fold of the transform, and elsewhere the nearest nodes can all be on the
+# wrong side of one, so colors that don't round-trip within retry_tolerance
+# are refined again from the nearest node of the finer grid (which prefers
+# the brightest ones, or of the other grid if there's none nearby) and its
+# neighbours in the LUT. returns the LUT
+# coordinates of the inverses and their roundtrip errors (max over the
+# channels).
+def invert_coords(colors, compiled, index, iterations: int = 16):
+    colors = np.clip(np.asarray(colors, dtype=np.float64), 0., 1.)
+
+    coords = np.empty(colors.shape)
+    errors = np.empty(len(colors))
+    chunk = max(inverse_chunk_points // inverse_starts, 1)
+    for start in range(0, len(colors), chunk):
+        stop = start + chunk
+        nearest, _ = index.grid.nearest(colors[start:stop], inverse_starts)
+
+        # fewer nodes than starts, repeat the nearest one
+        nearest = np.where(nearest >= 0, nearest, nearest[:, :1])
+
+        coords[start:stop], errors[start:stop] = refine_best(
+            colors[start:stop],
+            index.coords[nearest],
+            compiled,
+            iterations
+        )
+
+    span = np.arange(-1, 2) / max(index.size - 1, 1)
+    neighbours = np.stack(
+        np.meshgrid(span, span, span, indexing='ij'),
+        axis=-1
+    ).reshape(-1, 3)
+
+    retry = np.nonzero(errors > retry_tolerance)[0]
+    chunk = max(inverse_chunk_points // len(neighbours), 1)
+    for start in range(0, len(retry), chunk):
+        indices = retry[start:start + chunk]
+        nearest, _ = index.bright_grid.nearest(
+            colors[indices],
+            fallback=False
+        )
+
+        # the cells of the finer grid are small for the steep parts of the
+        # transform
+        missing = nearest[:, 0] < 0
+        nearest[missing], _ = index.grid.nearest(
+            colors[indices[missing]],
+            fallback=False
+        )
+
+        # colors without any node nearby are out of flim's range
+        nearby = nearest[:, 0] >= 0
+        indices = indices[nearby]
+        if len(indices) == 0:
+            continue
+
+        retry_coords, retry_errors = refine_best(
+            colors[indices],
+            np.clip(
+                index.coords[nearest[nearby]] + neighbours,
+                0.,
+                1.
+            ),
+            compiled,
+            iterations
+        )
+
+        better = retry_errors < errors[indices]
+        coords[indices[better]] = retry_coords[better]
+        errors[indices[better]] = retry_errors[better]
+
+    return coords, errors
+
+
+# scene-linear BT.709 I-D65 colors from LUT coordinates
+def decompress(coords, compiled):
+    return flim.run_stages(coords, compiled, 'decompression', 'decompression')
+
+
+# invert an sRGB image or array of colors with the shape (..., 3) to
+# scene-linear BT.709 I-D65 with preset (a dict or a flim.CompiledPreset).
+# the forward index has forward_size nodes per axis (default: the preset's
+# lut_quantize).
+def inverse_transform(colors, preset, forward_size: int = None):
+    compiled = flim.compile_preset(preset)
+    if forward_size is None:
+        forward_size = compiled.lut_quantize
+
+    colors = np.asarray(colors)
+    index = forward_index(compiled, forward_size)
+    coords, _ = invert_coords(colors.reshape(-1, 3), compiled, index)
+    return decompress(coords, compiled).reshape(colors.shape)
+
+
+# the inverse LUT of preset: a table with size nodes per axis that maps sRGB
+# ([0, 1], no shaper) to scene-linear BT.709 I-D65, and a report with the
+# roundtrip error percentiles, the fraction of nodes flim can't produce and
+# the timings
+def inverse_table(
+    preset,
+    size: int = 33,
+    forward_size: int = None,
+    iterations: int = 16
+):
+    import colour
+
+    colour.algebra.set_spow_enable(True)
+
+    compiled = flim.compile_preset(preset)
+    if forward_size is None:
+        forward_size = compiled.lut_quantize
+
+    t_start = time.perf_counter()
+    index = forward_index(compiled, forward_size)
+    t_index = time.perf_counter() - t_start
+
+    colors = colour.LUT3D.linear_table(size).reshape(-1, 3)
+    coords, errors = invert_coords(colors, compiled, index, iterations)
+    table = decompress(coords, compiled).reshape(size, size, size, 3)
+    t_invert = time.perf_counter() - t_start - t_index
+
+    reachable = errors <= reachable_tolerance
+    report = {
+        'size': size,
+        'forward_size': forward_size,
+        'error_percentiles': {
+            str(q): float(np.percentile(errors[reachable], q))
+            if np.any(reachable) else None
+            for q in [50, 90, 99, 100]
+        },
+        'unreachable_fraction': float(1. - np.mean(reachable)),
+        'index_seconds': t_index,
+        'invert_seconds': t_invert
+    }
+
+    return table, report
+
+
+# comments for an inverse LUT file
+def inverse_lut_comments(preset: dict, size: int):
+    return [
+        f'inverse of flim - preset: {preset["name"]}',
+        'input: sRGB (0 to 1, no shaper), output: Linear BT.709 I-D65',
+        f'{size}^3 nodes, https://github.com/bean-mhm/flim'
+    ]
+
+
+def main():
+    from lut_io import write_lut
+
+    parser = argparse.ArgumentParser(
+        description='generate inverse 3D LUTs for flim'
+    )
+    parser.add_argument(
+        'presets',
+        nargs='*',
+        help='names of the presets (default: all)'
+    )
+    parser.add_argument(
+        '-s', '--size',
+        type=int,
+        default=33,
+        help='inverse LUT size (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--forward-size',
+        type=int,
+        default=None,
+        help='size of the indexed forward LUT (default: lut_quantize of '
+        'each preset)'
+    )
+    parser.add_argument(
+        '-o', '--output-dir',
+        default=os.path.realpath(os.path.dirname(__file__)),
+        help='directory for the LUT files (default: next to this script)'
+    )
+    parser.add_argument(
+        '-f', '--formats',
+        nargs='+',
+        default=['spi3d'],
+        choices=['spi3d', 'cube', 'flut', 'flut16', 'npy'],
+        help='LUT formats (default: %(default)s)'
+    )
+    args = parser.parse_args()
+
+    by_name = {preset['name']: preset for preset in all_presets}
+    unknown = [name for name in args.presets if name not in by_name]
+    if len(unknown) > 0:
+        raise Exception(
+            f'unknown presets: {unknown} (available: {list(by_name)})'
+        )
+    presets = [by_name[name] for name in args.presets] or all_presets
+
+    for preset in presets:
+        table, report = inverse_table(preset, args.size, args.forward_size)
+        paths = write_lut(
+            os.path.join(args.output_dir, f'flim_{preset["name"]}_inverse'),
+            table,
+            inverse_lut_comments(preset, args.size),
+            args.formats,
+            info={'name': preset['name'], 'inverse': True}
+        )
+
+        percentiles = ', '.join(
+            f'p{q}: {value:.2e}' if value is not None else f'p{q}: -'
+            for q, value in report['error_percentiles'].items()
+        )
+        print(f'{preset["name"]}: {", ".join(paths)}')
+        print(f'  roundtrip error {percentiles}, '
+              f'{report["unreachable_fraction"] * 100.:.1f}% out of range, '
+              f'index {report["index_seconds"]:.2f} s, '
+              f'invert {report["invert_seconds"]:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
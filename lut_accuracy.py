@@ -0,0 +1,330 @@
+"""
+
+measures how accurately 3D LUTs of different sizes and LUT compression ranges
+reproduce flim's exact transform, and recommends the smallest LUT that meets
+a target error
+
+python lut_accuracy.py default --target 1 --percentile 99.9
+
+a large sample of HDR colors is transformed exactly (no LUT) and through LUTs
+of every candidate configuration (sampled like lut_apply.py, with trilinear
+and tetrahedral interpolation). the errors are CIEDE2000 color differences of
+the sRGB outputs. for every compression range, bigger sizes are only tried
+until one meets the target.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import argparse
+import contextlib
+import io
+import json
+import numpy as np
+import time
+
+import flim
+from lut_apply import apply_lut
+from presets import *
+
+
+# candidate LUT sizes, in increasing order
+candidate_sizes = [17, 21, 25, 29, 33, 41, 49, 57, 65, 80]
+
+# candidate LUT compression ranges as (lut_compress_log2_min,
+# lut_compress_log2_max)
+candidate_ranges = [
+    (-12., 8.), (-12., 10.), (-12., 12.),
+    (-10., 8.), (-10., 10.), (-10., 12.),
+    (-8., 8.), (-8., 10.), (-8., 12.)
+]
+
+# percentiles of the errors in the reports
+report_percentiles = [50, 90, 99, 99.9, 100]
+
+
+# random linear BT.709 I-D65 HDR colors: a log2-uniform exposure in
+# [log2_min, log2_max] per color, with each channel spread by up to spread
+# stops around it (so there are neutral and saturated colors). a fraction
+# of the colors are pure grays.
+def hdr_samples(
+    count: int,
+    log2_min: float = -14.,
+    log2_max: float = 14.,
+    spread: float = 6.,
+    seed: int = 0
+):
+    rng = np.random.default_rng(seed)
+
+    exposure = rng.uniform(log2_min, log2_max, (count, 1))
+    spreads = rng.uniform(0., spread, (count, 1))
+    spreads[:count // 16] = 0.
+
+    return 2.**(exposure + spreads * rng.uniform(-.5, .5, (count, 3)))
+
+
+# CIE L*a*b* (D65) of sRGB colors
+def srgb_to_lab(srgb):
+    import colour
+
+    return colour.XYZ_to_Lab(colour.sRGB_to_XYZ(np.clip(srgb, 0., 1.)))
+
+
+# error percentiles (report_percentiles) as a dict
+def percentiles(errors):
+    return {
+        str(q): float(value)
+        for q, value in zip(
+            report_percentiles,
+            np.percentile(errors, report_percentiles)
+        )
+    }
+
+
+# CIEDE2000 errors of a LUT with size nodes per axis and the given
+# compression range for preset, sampled at samples (with the exact Lab values
+# in exact_lab), for every interpolation method. returns a dict mapping the
+# methods to error arrays, and the time to compile the LUT. the progress
+# messages of apply_transform are hidden, so they don't mix into the report.
+def lut_errors(preset: dict, size: int, log2_range, samples, exact_lab):
+    import colour
+
+    preset = dict(preset)
+    preset['lut_compress_log2_min'], preset['lut_compress_log2_max'] = \
+        log2_range
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        t_start = time.perf_counter()
+        table = flim.apply_transform(colour.LUT3D.linear_table(size), preset)
+        seconds = time.perf_counter() - t_start
+
+    errors = {}
+    for interpolation in ['trilinear', 'tetrahedral']:
+        out = apply_lut(samples, table, *log2_range, interpolation)
+        errors[interpolation] = colour.delta_E(
+            exact_lab,
+            srgb_to_lab(out),
+            method='CIE 2000'
+        )
+
+    return errors, seconds
+
+
+# count random HDR colors (see hdr_samples) and the CIE L*a*b* values of
+# their exact transform with preset
+def exact_reference(preset: dict, count: int = 262144, seed: int = 0):
+    samples = hdr_samples(count, seed=seed)
+    return samples, srgb_to_lab(flim.transform_image(samples, preset))
+
+
+# the result of a LUT configuration with the errors and compile time from
+# lut_errors
+def lut_result(size: int, log2_range, errors, seconds: float):
+    return {
+        'size': size,
+        'lut_compress_log2_min': log2_range[0],
+        'lut_compress_log2_max': log2_range[1],
+        'compile_seconds': seconds,
+        'errors': {
+            method: percentiles(method_errors)
+            for method, method_errors in errors.items()
+        }
+    }
+
+
+# evaluate the candidate configurations (lists of sizes and compression
+# ranges) for preset on count random HDR colors and recommend the smallest
+# one (then the most accurate) whose error at percentile is at most target
+# with the given interpolation. reference is the output of exact_reference,
+# it's computed from count and seed if not given. returns the recommendation
+# (None if nothing meets the target) and the results of every evaluated
+# configuration.
+def analyze(
+    preset: dict,
+    target: float = 1.,
+    percentile: float = 99.9,
+    interpolation: str = 'trilinear',
+    sizes=None,
+    ranges=None,
+    count: int = 262144,
+    seed: int = 0,
+    reference=None
+):
+    import colour
+
+    colour.algebra.set_spow_enable(True)
+
+    sizes = sorted(sizes or candidate_sizes)
+    ranges = ranges or candidate_ranges
+
+    if reference is None:
+        reference = exact_reference(preset, count, seed)
+    samples, exact_lab = reference
+
+    results = []
+    for log2_range in ranges:
+        for size in sizes:
+            errors, seconds = lut_errors(
+                preset,
+                size,
+                log2_range,
+                samples,
+                exact_lab
+            )
+
+            result = lut_result(size, log2_range, errors, seconds)
+            result['score'] = float(
+                np.percentile(errors[interpolation], percentile)
+            )
+            result['meets_target'] = result['score'] <= target
+            results.append(result)
+
+            # bigger sizes with this range can't be recommended over this one
+            if result['meets_target']:
+                break
+
+    passing = [result for result in results if result['meets_target']]
+    recommendation = min(
+        passing,
+        key=lambda result: (result['size'], result['score']),
+        default=None
+    )
+
+    return recommendation, results
+
+
+def format_result(result, interpolation: str):
+    errors = ', '.join(
+        f'p{q}: {value:.3f}'
+        for q, value in result['errors'][interpolation].items()
+    )
+    return (
+        f'{result["size"]:3d}^3 '
+        f'[{result["lut_compress_log2_min"]:g}, '
+        f'{result["lut_compress_log2_max"]:g}]  {errors}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='find the smallest LUT size and compression range that '
+        'reproduce a preset within a target error'
+    )
+    parser.add_argument(
+        'preset',
+        nargs='?',
+        default=preset_default['name'],
+        help='name of the preset (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--target',
+        type=float,
+        default=1.,
+        help='maximum CIEDE2000 error at the percentile (default: '
+        '%(default)s)'
+    )
+    parser.add_argument(
+        '--percentile',
+        type=float,
+        default=99.9,
+        help='percentile of the errors to compare with the target (default: '
+        '%(default)s)'
+    )
+    parser.add_argument(
+        '--interpolation',
+        default='trilinear',
+        choices=['trilinear', 'tetrahedral'],
+        help='interpolation the LUT will be used with (default: '
+        '%(default)s, like the OCIO config)'
+    )
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=candidate_sizes,
+        help='candidate LUT sizes'
+    )
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=262144,
+        help='number of sampled colors (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        default=None,
+        help='also save the results as JSON here'
+    )
+    args = parser.parse_args()
+
+    by_name = {preset['name']: preset for preset in all_presets}
+    if args.preset not in by_name:
+        raise Exception(
+            f'unknown preset: {args.preset} (available: {list(by_name)})'
+        )
+    preset = by_name[args.preset]
+
+    # the preset's own configuration is compared too
+    ranges = list(candidate_ranges)
+    own_range = (
+        preset['lut_compress_log2_min'],
+        preset['lut_compress_log2_max']
+    )
+    if own_range not in ranges:
+        ranges.append(own_range)
+
+    # the exact transform of the samples is shared by every configuration
+    reference = exact_reference(preset, args.samples)
+
+    recommendation, results = analyze(
+        preset,
+        args.target,
+        args.percentile,
+        args.interpolation,
+        args.sizes,
+        ranges,
+        reference=reference
+    )
+
+    print(f'\nCIEDE2000 errors ({args.interpolation}):')
+    for result in results:
+        mark = '*' if result['meets_target'] else ' '
+        print(f'{mark} {format_result(result, args.interpolation)}')
+
+    # the preset's current configuration, for comparison
+    errors, seconds = lut_errors(
+        preset,
+        preset['lut_quantize'],
+        own_range,
+        *reference
+    )
+    current = lut_result(preset['lut_quantize'], own_range, errors, seconds)
+
+    print(f'\ncurrent:     {format_result(current, args.interpolation)}')
+    if recommendation is None:
+        print(f'no configuration meets p{args.percentile:g} <= '
+              f'{args.target:g}, try bigger sizes')
+    else:
+        print(f'recommended: {format_result(recommendation, args.interpolation)}')
+        print(f'  ({recommendation["size"]**3 / current["size"]**3:.1%} of '
+              'the current number of nodes, compiled in '
+              f'{recommendation["compile_seconds"]:.2f} s instead of '
+              f'{current["compile_seconds"]:.2f} s)')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'preset': preset['name'],
+                'target': args.target,
+                'percentile': args.percentile,
+                'interpolation': args.interpolation,
+                'current': current,
+                'recommendation': recommendation,
+                'results': results
+            }, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
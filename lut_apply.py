@@ -0,0 +1,161 @@
+"""
+
+applies flim's 3D LUTs to linear images without OCIO (see the Non-OCIO Guide
+in the README)
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import concurrent.futures
+import os
+
+
+# number of threads for apply_lut (None: all CPU cores)
+n_threads = None
+
+# maximum number of pixels per chunk in apply_lut
+chunk_pixels = 256 * 256
+
+
+# the AllocationTransform from the OCIO config: clip negative values, offset
+# by 2 to the power of log2_min, take the log2 and map [log2_min, log2_max] to
+# [0, 1] (clamped). NaNs (common in rendered EXRs) are treated like negative
+# values, since np.fmax ignores them.
+def lut_shaper(inp, log2_min, log2_max):
+    inp = np.fmax(inp, 0.)
+    inp = np.log2(inp + 2.**log2_min)
+    return np.clip((inp - log2_min) / (log2_max - log2_min), 0., 1.)
+
+
+# flat indices of the lower corners of the cells containing coords (in [0, 1]),
+# the fractional positions in the cells, and the axis strides of the table
+def lut_cells(size, coords):
+    pos = coords * (size - 1)
+    lower = np.clip(np.floor(pos), 0, size - 2).astype(np.intp)
+    frac = pos - lower
+
+    strides = np.array([size * size, size, 1], dtype=np.intp)
+    base = np.sum(lower * strides, axis=-1)
+
+    return base, frac, strides
+
+
+# sample a 3D LUT table with the shape (size, size, size, 3) at coords with
+# the shape (..., 3) in [0, 1] using trilinear interpolation
+def sample_trilinear(table, coords):
+    size = table.shape[0]
+    flat = table.reshape(-1, 3)
+    base, frac, strides = lut_cells(size, coords)
+
+    fr = frac[..., 0:1]
+    fg = frac[..., 1:2]
+    fb = frac[..., 2:3]
+
+    def corner(r, g, b):
+        return flat[base + (r * strides[0] + g * strides[1] + b * strides[2])]
+
+    c00 = corner(0, 0, 0) + fb * (corner(0, 0, 1) - corner(0, 0, 0))
+    c01 = corner(0, 1, 0) + fb * (corner(0, 1, 1) - corner(0, 1, 0))
+    c10 = corner(1, 0, 0) + fb * (corner(1, 0, 1) - corner(1, 0, 0))
+    c11 = corner(1, 1, 0) + fb * (corner(1, 1, 1) - corner(1, 1, 0))
+
+    c0 = c00 + fg * (c01 - c00)
+    c1 = c10 + fg * (c11 - c10)
+
+    return c0 + fr * (c1 - c0)
+
+
+# same as sample_trilinear, but using tetrahedral interpolation. the cell is
+# split into 6 tetrahedra along its main diagonal, and the one containing the
+# sample is picked by sorting the fractional positions.
+def sample_tetrahedral(table, coords):
+    size = table.shape[0]
+    flat = table.reshape(-1, 3)
+    base, frac, strides = lut_cells(size, coords)
+
+    # axes in order of decreasing fractional position
+    order = np.argsort(-frac, axis=-1, kind='stable')
+    f = np.take_along_axis(frac, order, axis=-1)
+    step = strides[order]
+
+    # vertices of the tetrahedron, from the lower to the upper corner
+    v1 = base + step[..., 0]
+    v2 = v1 + step[..., 1]
+    v3 = base + np.sum(strides)
+
+    return (1. - f[..., 0:1]) * flat[base] \
+        + (f[..., 0:1] - f[..., 1:2]) * flat[v1] \
+        + (f[..., 1:2] - f[..., 2:3]) * flat[v2] \
+        + f[..., 2:3] * flat[v3]
+
+
+lut_samplers = {
+    'trilinear': sample_trilinear,
+    'tetrahedral': sample_tetrahedral
+}
+
+
+# apply a 3D LUT compiled by main.py to a linear BT.709 I-D65 image with the
+# shape (..., 3). lut can be a colour.LUT3D or a table with the shape
+# (size, size, size, 3), like the memory-mapped tables from lut_io.load_flut.
+# log2_min and log2_max are the preset's lut_compress_log2_min and
+# lut_compress_log2_max (also found in .flut headers). the image is split into
+# chunks of at most chunk_pixels pixels (bands along the first axis), which
+# are processed by a pool of threads and written to out (by default, a new
+# array with the input's float dtype).
+def apply_lut(
+    image,
+    lut,
+    log2_min,
+    log2_max,
+    interpolation: str = 'tetrahedral',
+    out=None
+):
+    table = np.asarray(getattr(lut, 'table', lut))
+    if table.ndim != 4 or table.shape[3] != 3 \
+            or not table.shape[0] == table.shape[1] == table.shape[2]:
+        raise Exception('the LUT table must have the shape (size, size, size, 3)')
+
+    if interpolation not in lut_samplers:
+        raise Exception(f'unknown interpolation method: {interpolation}')
+    sampler = lut_samplers[interpolation]
+
+    image = np.asarray(image)
+    if image.shape[-1] != 3:
+        raise Exception('image must have the shape (..., 3)')
+
+    if out is None:
+        dtype = image.dtype \
+            if np.issubdtype(image.dtype, np.floating) else np.float32
+        out = np.empty(image.shape, dtype=dtype)
+    elif out.shape != image.shape:
+        raise Exception('out must have the same shape as image')
+
+    # a single pixel is treated as a 1-pixel image
+    if image.ndim == 1:
+        out[...] = sampler(table, lut_shaper(image, log2_min, log2_max))
+        return out
+
+    # number of slices along the first axis per chunk
+    slice_pixels = max(image[0].size // 3, 1)
+    band = max(chunk_pixels // slice_pixels, 1)
+
+    def run_chunk(start):
+        coords = lut_shaper(image[start:start + band], log2_min, log2_max)
+        out[start:start + band] = sampler(table, coords)
+
+    starts = range(0, image.shape[0], band)
+    workers = n_threads if n_threads is not None else os.cpu_count()
+    if workers <= 1 or len(starts) <= 1:
+        for start in starts:
+            run_chunk(start)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for _ in executor.map(run_chunk, starts):
+                pass
+
+    return out
@@ -0,0 +1,145 @@
+"""
+
+on-disk cache for transformed LUT tables
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import hashlib
+import os
+import tempfile
+
+import flim
+from flim import compile_preset, hash_params
+
+
+# source files (relative to this script) that the transform depends on
+transform_sources = ['flim.py', 'flim_jit.py', 'utils.py', 'super_sigmoid.py']
+
+
+# hash of the transform source code, so that cached tables are invalidated
+# when the transform changes
+def transform_source_hash():
+    script_dir = os.path.realpath(os.path.dirname(__file__))
+
+    h = hashlib.sha256()
+    for name in transform_sources:
+        h.update(name.encode('utf-8'))
+        with open(os.path.join(script_dir, name), 'rb') as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+
+# cache key of a transformed LUT table. size defaults to the preset's
+# lut_quantize and dtype to flim.compute_dtype. flim.dye_mix_max_error is
+# included.
+def cache_key(preset: dict, version: str, size: int = None, dtype=None):
+    compiled = compile_preset(preset)
+    if size is None:
+        size = compiled.lut_quantize
+    if dtype is None:
+        dtype = flim.compute_dtype
+
+    return hash_params({
+        'preset': compiled.key,
+        'size': int(size),
+        'dtype': np.dtype(dtype).name,
+        'dye_mix_max_error': flim.dye_mix_max_error,
+        'version': version,
+        'source': transform_source_hash()
+    })
+
+
+# the umask of the process (it can only be read by setting it)
+def current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# a directory of .npy files named by their cache keys. the least recently used
+# files are removed once the total size goes above max_bytes. writes are
+# atomic (temporary file + rename), so concurrent processes can share a cache.
+class LUTCache:
+    def __init__(self, directory: str, max_bytes: int = 1024**3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str):
+        return os.path.join(self.directory, f'{key}.npy')
+
+    # returns the cached table or None
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            table = np.load(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError):
+            # unreadable, treat as a miss and let it be replaced
+            self._remove(path)
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return table
+
+    def put(self, key: str, table: np.ndarray):
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.directory,
+            prefix=f'.{key}.',
+            suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, table)
+            # mkstemp creates the file readable only by its owner, give it
+            # the permissions of a normally created file
+            os.chmod(temp_path, 0o666 & ~current_umask())
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        self.evict()
+
+    # remove the least recently used tables until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.npy'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy') or entry.name.endswith('.tmp'):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
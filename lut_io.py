@@ -0,0 +1,203 @@
+"""
+
+fast writers (and readers) for flim's 3D LUTs
+
+all writers take a table with the shape (size, size, size, 3), indexed as
+table[r, g, b] like colour.LUT3D, and a list of comment lines. tables are
+formatted in bulk and written in chunks instead of line by line.
+
+formats:
+  spi3d: Sony SPI3D text (same output as colour.write_LUT)
+  cube: Resolve/Adobe .cube text (same output as colour.write_LUT)
+  flut: binary, a small JSON header followed by the raw table (float32),
+        which load_flut memory-maps without parsing anything
+  flut16: same as flut, but float16
+  npy: NumPy .npy (comments go in a .txt file next to it)
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import json
+import os
+import struct
+
+
+# number of table nodes formatted at once by the text writers
+text_chunk_points = 65536
+
+# magic bytes at the start of .flut files
+flut_magic = b'FLIMLUT\0'
+
+# the table in .flut files starts at a multiple of this many bytes
+flut_alignment = 64
+
+
+def check_table(table):
+    table = np.asarray(table)
+    if table.ndim != 4 or table.shape[3] != 3 \
+            or not table.shape[0] == table.shape[1] == table.shape[2]:
+        raise Exception('the LUT table must have the shape (size, size, size, 3)')
+    return table
+
+
+# write rows of values with a printf-style line format, one chunk at a time.
+# rows must have the shape (n, columns).
+def write_rows(f, rows, line_format: str):
+    for start in range(0, rows.shape[0], text_chunk_points):
+        chunk = rows[start:start + text_chunk_points]
+        f.write((line_format * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+
+
+def write_spi3d(path: str, table, comments=(), decimals: int = 5):
+    table = check_table(table)
+    size = table.shape[0]
+
+    # node indices (r, g, b) in table order
+    indices = np.indices((size, size, size)).reshape(3, -1).T
+
+    rows = np.concatenate(
+        [indices.astype(np.float64), table.reshape(-1, 3)],
+        axis=1
+    )
+
+    with open(path, 'w') as f:
+        f.write('SPILUT 1.0\n')
+        f.write('3 3\n')
+        f.write(f'{size} {size} {size}\n')
+
+        write_rows(f, rows, f'%d %d %d %.{decimals}f %.{decimals}f %.{decimals}f\n')
+
+        f.writelines(f'# {comment}\n' for comment in comments)
+
+
+def write_cube(
+    path: str,
+    table,
+    comments=(),
+    title: str = 'flim',
+    decimals: int = 5
+):
+    table = check_table(table)
+    size = table.shape[0]
+
+    # the domain is the default [0, 1], so there are no DOMAIN_MIN/MAX lines
+    with open(path, 'w') as f:
+        f.write(f'TITLE "{title}"\n')
+        f.writelines(f'# {comment}\n' for comment in comments)
+        f.write(f'LUT_3D_SIZE {size}\n')
+
+        # red changes fastest in .cube files
+        rows = np.ascontiguousarray(table.transpose(2, 1, 0, 3)).reshape(-1, 3)
+        write_rows(f, rows, f'%.{decimals}f %.{decimals}f %.{decimals}f\n')
+
+
+# .flut layout:
+#   8 bytes: flut_magic
+#   4 bytes: length of the JSON header in bytes (little-endian uint32)
+#   JSON header (UTF-8), padded with spaces so the table starts at a multiple
+#   of flut_alignment bytes. it has 'size', 'dtype' and 'comments', plus the
+#   entries of info (main.py adds the preset name, the flim version and
+#   lut_compress_log2_min/max).
+#   the table as little-endian floats in table[r, g, b, channel] order
+def write_flut(path: str, table, comments=(), dtype='float32', info=None):
+    table = check_table(table)
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype.kind != 'f':
+        raise Exception('the .flut dtype must be a float type')
+
+    header = dict(info) if info is not None else {}
+    header.update({
+        'size': table.shape[0],
+        'dtype': dtype.str,
+        'comments': list(comments)
+    })
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    prefix_length = len(flut_magic) + 4
+    padding = -(prefix_length + len(header_bytes)) % flut_alignment
+    header_bytes += b' ' * padding
+
+    with open(path, 'wb') as f:
+        f.write(flut_magic)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(np.ascontiguousarray(table, dtype=dtype).tobytes())
+
+
+# returns (header, offset of the table in bytes) from a .flut file
+def read_flut_header(path: str):
+    with open(path, 'rb') as f:
+        if f.read(len(flut_magic)) != flut_magic:
+            raise Exception(f'{path} is not a .flut file')
+        (header_length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+
+    return header, len(flut_magic) + 4 + header_length
+
+
+# returns (table, header) from a .flut file. by default, the table is a
+# read-only memory-mapped view of the file, so nothing is read until it's
+# used (apply_lut takes it as is). with mmap=False, the table is loaded into
+# a regular array.
+def load_flut(path: str, mmap: bool = True):
+    header, offset = read_flut_header(path)
+
+    size = header['size']
+    dtype = np.dtype(header['dtype'])
+    shape = (size, size, size, 3)
+
+    table_bytes = size**3 * 3 * dtype.itemsize
+    if os.path.getsize(path) < offset + table_bytes:
+        raise Exception(f'{path} is truncated')
+
+    if mmap:
+        table = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            table = np.fromfile(f, dtype=dtype, count=size**3 * 3).reshape(shape)
+
+    return table, header
+
+
+def write_npy(path: str, table, comments=()):
+    table = check_table(table)
+    np.save(path, table)
+
+    with open(f'{path}.txt', 'w') as f:
+        f.writelines(f'{comment}\n' for comment in comments)
+
+
+# format name -> (file extension, writer(path, table, comments, info))
+lut_formats = {
+    'spi3d': ('.spi3d', lambda path, table, comments, info: write_spi3d(
+        path, table, comments)),
+    'cube': ('.cube', lambda path, table, comments, info: write_cube(
+        path, table, comments, (info or {}).get('name', 'flim'))),
+    'flut': ('.flut', lambda path, table, comments, info: write_flut(
+        path, table, comments, 'float32', info)),
+    'flut16': ('_f16.flut', lambda path, table, comments, info: write_flut(
+        path, table, comments, 'float16', info)),
+    'npy': ('.npy', lambda path, table, comments, info: write_npy(
+        path, table, comments))
+}
+
+
+# write a table in several formats. path has no extension, the format's
+# extension is appended. info is a dict of extra metadata for the formats
+# that can store it (.flut). returns the written paths.
+def write_lut(path: str, table, comments=(), formats=('spi3d',), info=None):
+    written = []
+    for name in formats:
+        if name not in lut_formats:
+            raise Exception(f'unknown LUT format: {name}')
+
+        extension, writer = lut_formats[name]
+        writer(f'{path}{extension}', table, comments, info)
+        written.append(f'{path}{extension}')
+
+    return written
@@ -2,252 +2,174 @@
 
 3D LUT generator for flim
 
+python main.py                          compile presets_to_compile
+python main.py compile silver --size 33 compile selected presets
+python main.py list                     list the presets
+
+run python main.py compile --help for all the options. importing this file
+has no side effects, call main() to run the command line interface.
+
 repo:
 https://github.com/bean-mhm/flim
 
 """
 
 
-import numpy as np
-import colour
+import argparse
 import os
 import time
 
-from flim import apply_transform
+from presets import *
 
 
 version = '1.2.0'
 
+# print per-stage timings of each preset and save them next to the LUT as
+# flim_<name>.profile.json? (set FLIM_PROFILE=1 or pass --profile)
+profile = os.environ.get('FLIM_PROFILE', '') not in ['', '0']
 
-# Presets
-
-preset_default = {
-    'name': 'default',
-    'info_url': None,
-
-    'lut_compress_log2_min': -10.,
-    'lut_compress_log2_max': 10.,
-    'lut_quantize': 80,
-
-    'pre_exposure': 4.3,
-    'pre_formation_filter': np.array([1., 1., 1.]),
-    'pre_formation_filter_strength': 1.,
-
-    'extended_gamut_red_scale': 1.05,
-    'extended_gamut_green_scale': 1.12,
-    'extended_gamut_blue_scale': 1.045,
-    'extended_gamut_red_rot': .5,
-    'extended_gamut_green_rot': 2.,
-    'extended_gamut_blue_rot': .1,
-    'extended_gamut_red_mul': 1.,
-    'extended_gamut_green_mul': 1.,
-    'extended_gamut_blue_mul': 1.,
-
-    'sigmoid_log2_min': -10.,
-    'sigmoid_log2_max': 22.,
-    'sigmoid_toe_x': .44,
-    'sigmoid_toe_y': .28,
-    'sigmoid_shoulder_x': .591,
-    'sigmoid_shoulder_y': .779,
-
-    'negative_film_exposure': 6.,
-    'negative_film_density': 5.,
-
-    'print_backlight': np.array([1., 1., 1.]),
-    'print_film_exposure': 6.,
-    'print_film_density': 27.5,
-
-    'luminance_weights': np.array([.3, .5, .2]),
-    'black_point': 'auto',
-    'post_formation_filter': np.array([1., 1., 1.]),
-    'post_formation_filter_strength': 1.,
-    'midtone_saturation': 1.02
-}
-
-preset_nostalgia = {
-    'name': 'nostalgia',
-    'info_url': None,
-
-    'lut_compress_log2_min': -10.,
-    'lut_compress_log2_max': 10.,
-    'lut_quantize': 80,
-
-    'pre_exposure': 5.563035,
-    'pre_formation_filter': np.array([1., 1., 1.]),
-    'pre_formation_filter_strength': 1.,
-
-    'extended_gamut_red_scale': 1.05,
-    'extended_gamut_green_scale': 1.12,
-    'extended_gamut_blue_scale': 1.045,
-    'extended_gamut_red_rot': .5,
-    'extended_gamut_green_rot': 2.,
-    'extended_gamut_blue_rot': .1,
-    'extended_gamut_red_mul': 1.1,
-    'extended_gamut_green_mul': 1.,
-    'extended_gamut_blue_mul': 1.2,
-
-    'sigmoid_log2_min': -10.,
-    'sigmoid_log2_max': 23.,
-    'sigmoid_toe_x': .44,
-    'sigmoid_toe_y': .28,
-    'sigmoid_shoulder_x': .591,
-    'sigmoid_shoulder_y': .779,
-
-    'negative_film_exposure': 5.8,
-    'negative_film_density': 5.,
-
-    'print_backlight': np.array([.99, 1.1, 1.035989]),
-    'print_film_exposure': 6.,
-    'print_film_density': 40.,
-
-    'luminance_weights': np.array([.3, .5, .2]),
-    'black_point': -5.,
-    'post_formation_filter': np.array([1., 1., 1.]),
-    'post_formation_filter_strength': 1.,
-    'midtone_saturation': 1.1
-}
-
-preset_silver = {
-    'name': 'silver',
-    'info_url': None,
-
-    'lut_compress_log2_min': -10.,
-    'lut_compress_log2_max': 10.,
-    'lut_quantize': 80,
-
-    'pre_exposure': 3.9,
-    'pre_formation_filter': np.array([0., .5, 1.]),
-    'pre_formation_filter_strength': .05,
-
-    'extended_gamut_red_scale': 1.05,
-    'extended_gamut_green_scale': 1.12,
-    'extended_gamut_blue_scale': 1.045,
-    'extended_gamut_red_rot': .5,
-    'extended_gamut_green_rot': 2.,
-    'extended_gamut_blue_rot': .1,
-    'extended_gamut_red_mul': 1.,
-    'extended_gamut_green_mul': 1.,
-    'extended_gamut_blue_mul': 1.06,
-
-    'sigmoid_log2_min': -10.,
-    'sigmoid_log2_max': 22.,
-    'sigmoid_toe_x': .44,
-    'sigmoid_toe_y': .28,
-    'sigmoid_shoulder_x': .591,
-    'sigmoid_shoulder_y': .779,
-
-    'negative_film_exposure': 4.7,
-    'negative_film_density': 7.,
-
-    'print_backlight': np.array([.9992, .99, 1.]),
-    'print_film_exposure': 4.7,
-    'print_film_density': 30.,
-
-    'luminance_weights': np.array([.3, .5, .2]),
-    'black_point': .5,
-    'post_formation_filter': np.array([1., 1., 0.]),
-    'post_formation_filter_strength': .04,
-    'midtone_saturation': 1.
-}
 
 presets_to_compile = [preset_default, preset_nostalgia, preset_silver]
 
+# output formats for each preset (see lut_io.py): 'spi3d', 'cube', 'flut',
+# 'flut16' and 'npy'. .flut files can be memory-mapped by tools that apply
+# the LUTs (lut_io.load_flut), which is much faster than parsing .spi3d.
+lut_formats = ['spi3d', 'flut']
+
+script_dir = os.path.realpath(os.path.dirname(__file__))
+
+# directory of the on-disk cache of transformed LUT tables, so unchanged
+# presets aren't recompiled (--no-cache disables it)
+lut_cache_dir = os.environ.get('FLIM_CACHE_DIR', f'{script_dir}/.flim_cache')
+
+
+def find_presets(names):
+    by_name = {preset['name']: preset for preset in all_presets}
+
+    unknown = [name for name in names if name not in by_name]
+    if len(unknown) > 0:
+        raise Exception(
+            f'unknown presets: {unknown} (available: {list(by_name)})'
+        )
+
+    return [by_name[name] for name in names]
 
-# compile the presets to 3D LUT files
-for preset in presets_to_compile:
-    preset['name'] = preset['name'].strip().replace(' ', '_')
-    lut_name = f'flim_{preset["name"]}'
-
-    ocio_view_name = f"flim ({preset['name']})"
-    ocio_allocation_vars = f'vars: [{preset["lut_compress_log2_min"]}, {preset["lut_compress_log2_max"]}, {2**preset["lut_compress_log2_min"]}]'
-    ocio_guide_comments = \
-        f"Here's how you can add this to an OpenColorIO config:\n" \
-        f"```yaml\n" \
-        f"colorspaces:\n" \
-        f"  - !<ColorSpace>\n" \
-        f"    name: {ocio_view_name}\n" \
-        f"    family: Image Formation\n" \
-        f"    equalitygroup: \"\"\n" \
-        f"    bitdepth: unknown\n" \
-        f"    description: flim v{version} - https://github.com/bean-mhm/flim\n" \
-        f"    isdata: false\n" \
-        f"    allocation: uniform\n" \
-        f"    from_scene_reference: !<GroupTransform>\n" \
-        f"      children:\n" \
-        f"        - !<ColorSpaceTransform> {{src: reference, dst: Linear BT.709 I-D65}}\n" \
-        f"        - !<RangeTransform> {{min_in_value: 0., min_out_value: 0.}}\n" \
-        f"        - !<AllocationTransform> {{allocation: lg2, {ocio_allocation_vars}}}\n" \
-        f"        - !<FileTransform> {{src: {lut_name}.spi3d, interpolation: linear}}\n" \
-        f"```\n" \
-        f"Explanation:\n" \
-        f"  1. ColorSpaceTransform converts the input from the scene reference to Linear BT.709 I-D65. If this is named\n" \
-        f"     differently in your config (for example Linear Rec.709), change the name manually.\n" \
-        f"  2. RangeTransform clips negative values. You might want to use a gamut compression algorithm before this step.\n" \
-        f"  3. AllocationTransform is for LUT compression, it takes the log2 of the RGB values and maps them from a\n" \
-        f"     specified range (the first two values after 'vars') to [0, 1]. The third value is the offset applied to the\n" \
-        f"     values before log2. This is done to keep the blacks.\n" \
-        f"  4. Lastly, the FileTransform references the 3D LUT and defines a trilinear interpolation method.\n" \
-        f"\n" \
-        f"Adding this as a view transform is pretty straightforward:\n" \
-        f"```yaml\n" \
-        f"displays:\n" \
-        f"  sRGB:\n" \
-        f"    - !<View> {{name: {ocio_view_name}, colorspace: {ocio_view_name}}}\n" \
-        f"    ... (other view transforms here)\n" \
-        f"```"
-
-    lut_comments = [
-        '-------------------------------------------------',
-        '',
-        f'flim v{version} - Filmic Color Transform',
-        '',
-        f'Preset: {preset["name"]}',
-        f'URL: {preset["info_url"]}',
-        '',
-        'LUT input is expected to be in Linear BT.709 I-D65 and gone through an AllocationTransform like the following:',
-        f'!<AllocationTransform> {{allocation: lg2, {ocio_allocation_vars}}}',
-        '',
-        'Output will be in sRGB.',
-        ''] + \
-        ocio_guide_comments.splitlines() + [
-        '',
-        'Repo:',
-        'https://github.com/bean-mhm/flim',
-        '',
-        'Read more:',
-        'https://opencolorio.readthedocs.io/en/latest/guides/authoring/authoring.html#how-to-configure-colorspace-allocation',
-        '',
-        '-------------------------------------------------'
-    ]
-
-    print(f'compiling "{preset["name"]}" preset')
-
-    t_start = time.time()
-
-    # make a linear 3D LUT
-    print('making a linear 3D LUT...')
-    lut = colour.LUT3D(
-        table=colour.LUT3D.linear_table(preset['lut_quantize']),
-        name='flim',
-        domain=np.array([[0, 0, 0], [1, 1, 1]]),
-        size=preset['lut_quantize'],
-        comments=lut_comments
+
+def command_list(args):
+    for preset in all_presets:
+        default = ' (default)' if preset in presets_to_compile else ''
+        print(f'{preset["name"]}{default}: {preset["lut_quantize"]}^3, '
+              f'{preset["info_url"] or "no URL"}')
+
+
+def command_compile(args):
+    # the transform is only imported when it's needed
+    import flim
+    from build import build_luts
+    from lut_cache import LUTCache
+
+    presets = find_presets(args.presets) if len(args.presets) > 0 \
+        else presets_to_compile
+
+    if args.backend is not None:
+        flim.backend = args.backend
+    if args.jobs is not None:
+        flim.n_jobs = args.jobs
+
+    cache = None
+    if not args.no_cache:
+        cache = LUTCache(lut_cache_dir, max_bytes=1024**3)
+
+    build_luts(
+        presets,
+        version,
+        args.output_dir,
+        args.formats,
+        size=args.size,
+        cache=cache,
+        profile=args.profile,
+        force=args.force
     )
 
-    # apply transform on the LUT table
-    print('transforming the LUT table...')
-    lut.table = apply_transform(lut.table, preset)
-
-    # write the LUT
-    print('writing the LUT...')
-    script_dir = os.path.realpath(os.path.dirname(__file__))
-    colour.write_LUT(
-        LUT=lut,
-        path=f"{script_dir}/{lut_name}.spi3d",
-        decimals=5,
-        method='Sony SPI3D'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=f'3D LUT generator for flim v{version}'
     )
+    commands = parser.add_subparsers(dest='command')
+
+    parser_compile = commands.add_parser(
+        'compile',
+        help='compile presets to 3D LUTs (default)'
+    )
+    parser_compile.add_argument(
+        'presets',
+        nargs='*',
+        help='names of the presets (default: '
+        f'{" ".join(p["name"] for p in presets_to_compile)})'
+    )
+    parser_compile.add_argument(
+        '-s', '--size',
+        type=int,
+        default=None,
+        help='LUT size (default: lut_quantize of each preset)'
+    )
+    parser_compile.add_argument(
+        '-o', '--output-dir',
+        default=script_dir,
+        help='directory for the LUT files (default: next to this script)'
+    )
+    parser_compile.add_argument(
+        '-f', '--formats',
+        nargs='+',
+        default=lut_formats,
+        choices=['spi3d', 'cube', 'flut', 'flut16', 'npy'],
+        help=f'LUT formats (default: {" ".join(lut_formats)})'
+    )
+    parser_compile.add_argument(
+        '-b', '--backend',
+        default=None,
+        choices=['batch', 'parallel', 'jit', 'serial'],
+        help='transform backend (default: batch)'
+    )
+    parser_compile.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='number of worker processes (default: all CPU cores)'
+    )
+    parser_compile.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='don\'t use the on-disk cache of transformed tables'
+    )
+    parser_compile.add_argument(
+        '--force',
+        action='store_true',
+        help='rewrite LUTs that are up to date'
+    )
+    parser_compile.add_argument(
+        '--profile',
+        action='store_true',
+        default=profile,
+        help='print and save per-stage timings'
+    )
+    parser_compile.set_defaults(function=command_compile)
+
+    parser_list = commands.add_parser('list', help='list the presets')
+    parser_list.set_defaults(function=command_list)
+
+    args = parser.parse_args(argv)
+
+    # compile by default
+    if args.command is None:
+        args = parser.parse_args(['compile'])
+
+    t_start = time.perf_counter()
+    args.function(args)
+    if args.command == 'compile':
+        print(f'done in {time.perf_counter() - t_start:.2f} s')
 
-    t_end = time.time()
 
-    print(f'"{preset["name"]}" preset compiled in {t_end - t_start:.1f} s.\n')
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+
+measures the error of flim's float32 compute mode (flim.compute_dtype)
+against the float64 reference, over all the nodes of a LUT:
+
+python precision.py
+python precision.py --sizes 33 65 --backend parallel
+
+a LUT written with 5 decimals (.spi3d) can't tell the difference when the
+maximum error stays below half a step (0.000005).
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import colour
+import argparse
+import contextlib
+import io
+import time
+
+import flim
+from presets import all_presets
+
+
+# half a step of the 5 decimals in .spi3d files
+spi3d_tolerance = .5e-5
+
+
+# transform a linear LUT table in the given dtype, returns the table and the
+# wall time
+def timed_transform(table, compiled, dtype, backend):
+    previous = flim.compute_dtype, flim.backend
+    flim.compute_dtype, flim.backend = dtype, backend
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            t_start = time.perf_counter()
+            out = flim.apply_transform(table, compiled)
+            t_end = time.perf_counter()
+    finally:
+        flim.compute_dtype, flim.backend = previous
+
+    return out, t_end - t_start
+
+
+# error of dtype against float64 for a preset at a given LUT size
+def precision_report(preset, size: int, dtype=np.float32, backend='batch'):
+    if backend == 'serial':
+        raise Exception('the serial backend always uses float64')
+
+    compiled = flim.compile_preset(preset)
+    table = colour.LUT3D.linear_table(size)
+
+    reference, reference_seconds = timed_transform(
+        table,
+        compiled,
+        np.float64,
+        backend
+    )
+    out, seconds = timed_transform(table, compiled, dtype, backend)
+
+    out = out.astype(np.float64)
+    error = np.abs(out - reference)
+    worst = np.unravel_index(np.argmax(error), error.shape)
+
+    return {
+        'preset': compiled.name,
+        'size': size,
+        'dtype': np.dtype(dtype).name,
+        'backend': backend,
+        'max_error': float(error.max()),
+        'mean_error': float(error.mean()),
+        'max_error_per_channel': error.reshape(-1, 3).max(axis=0).tolist(),
+
+        # LUT node and channel of the largest error
+        'max_error_at': [int(i) for i in worst],
+
+        # share of values that differ when written with 5 decimals
+        'spi3d_mismatch': float(np.mean(
+            np.round(out, 5) != np.round(reference, 5)
+        )),
+        'spi3d_safe': bool(error.max() < spi3d_tolerance),
+
+        'seconds': seconds,
+        'reference_seconds': reference_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='error of float32 flim against float64'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[33],
+                        help='LUT sizes')
+    parser.add_argument('--dtype', default='float32',
+                        help='compute dtype to test')
+    parser.add_argument('--backend', default='batch',
+                        help='flim backend (batch or parallel)')
+    args = parser.parse_args()
+
+    print(f'{"preset":<14} {"size":>5} {"max error":>12} {"mean error":>12} '
+          f'{".spi3d diff":>12} {"safe":>5} {"time (s)":>9} {"float64":>9}')
+    for preset in all_presets:
+        for size in args.sizes:
+            r = precision_report(preset, size, args.dtype, args.backend)
+            print(f'{r["preset"]:<14} {size:>5} {r["max_error"]:>12.3e} '
+                  f'{r["mean_error"]:>12.3e} '
+                  f'{100. * r["spi3d_mismatch"]:>11.4f}% '
+                  f'{"yes" if r["spi3d_safe"] else "no":>5} '
+                  f'{r["seconds"]:>9.3f} {r["reference_seconds"]:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+
+presets for flim
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+
+
+preset_default = {
+    'name': 'default',
+    'info_url': None,
+
+    'lut_compress_log2_min': -10.,
+    'lut_compress_log2_max': 10.,
+    'lut_quantize': 80,
+
+    'pre_exposure': 4.3,
+    'pre_formation_filter': np.array([1., 1., 1.]),
+    'pre_formation_filter_strength': 1.,
+
+    'extended_gamut_red_scale': 1.05,
+    'extended_gamut_green_scale': 1.12,
+    'extended_gamut_blue_scale': 1.045,
+    'extended_gamut_red_rot': .5,
+    'extended_gamut_green_rot': 2.,
+    'extended_gamut_blue_rot': .1,
+    'extended_gamut_red_mul': 1.,
+    'extended_gamut_green_mul': 1.,
+    'extended_gamut_blue_mul': 1.,
+
+    'sigmoid_log2_min': -10.,
+    'sigmoid_log2_max': 22.,
+    'sigmoid_toe_x': .44,
+    'sigmoid_toe_y': .28,
+    'sigmoid_shoulder_x': .591,
+    'sigmoid_shoulder_y': .779,
+
+    'negative_film_exposure': 6.,
+    'negative_film_density': 5.,
+
+    'print_backlight': np.array([1., 1., 1.]),
+    'print_film_exposure': 6.,
+    'print_film_density': 27.5,
+
+    'luminance_weights': np.array([.3, .5, .2]),
+    'black_point': 'auto',
+    'post_formation_filter': np.array([1., 1., 1.]),
+    'post_formation_filter_strength': 1.,
+    'midtone_saturation': 1.02
+}
+
+preset_nostalgia = {
+    'name': 'nostalgia',
+    'info_url': None,
+
+    'lut_compress_log2_min': -10.,
+    'lut_compress_log2_max': 10.,
+    'lut_quantize': 80,
+
+    'pre_exposure': 5.563035,
+    'pre_formation_filter': np.array([1., 1., 1.]),
+    'pre_formation_filter_strength': 1.,
+
+    'extended_gamut_red_scale': 1.05,
+    'extended_gamut_green_scale': 1.12,
+    'extended_gamut_blue_scale': 1.045,
+    'extended_gamut_red_rot': .5,
+    'extended_gamut_green_rot': 2.,
+    'extended_gamut_blue_rot': .1,
+    'extended_gamut_red_mul': 1.1,
+    'extended_gamut_green_mul': 1.,
+    'extended_gamut_blue_mul': 1.2,
+
+    'sigmoid_log2_min': -10.,
+    'sigmoid_log2_max': 23.,
+    'sigmoid_toe_x': .44,
+    'sigmoid_toe_y': .28,
+    'sigmoid_shoulder_x': .591,
+    'sigmoid_shoulder_y': .779,
+
+    'negative_film_exposure': 5.8,
+    'negative_film_density': 5.,
+
+    'print_backlight': np.array([.99, 1.1, 1.035989]),
+    'print_film_exposure': 6.,
+    'print_film_density': 40.,
+
+    'luminance_weights': np.array([.3, .5, .2]),
+    'black_point': -5.,
+    'post_formation_filter': np.array([1., 1., 1.]),
+    'post_formation_filter_strength': 1.,
+    'midtone_saturation': 1.1
+}
+
+preset_silver = {
+    'name': 'silver',
+    'info_url': None,
+
+    'lut_compress_log2_min': -10.,
+    'lut_compress_log2_max': 10.,
+    'lut_quantize': 80,
+
+    'pre_exposure': 3.9,
+    'pre_formation_filter': np.array([0., .5, 1.]),
+    'pre_formation_filter_strength': .05,
+
+    'extended_gamut_red_scale': 1.05,
+    'extended_gamut_green_scale': 1.12,
+    'extended_gamut_blue_scale': 1.045,
+    'extended_gamut_red_rot': .5,
+    'extended_gamut_green_rot': 2.,
+    'extended_gamut_blue_rot': .1,
+    'extended_gamut_red_mul': 1.,
+    'extended_gamut_green_mul': 1.,
+    'extended_gamut_blue_mul': 1.06,
+
+    'sigmoid_log2_min': -10.,
+    'sigmoid_log2_max': 22.,
+    'sigmoid_toe_x': .44,
+    'sigmoid_toe_y': .28,
+    'sigmoid_shoulder_x': .591,
+    'sigmoid_shoulder_y': .779,
+
+    'negative_film_exposure': 4.7,
+    'negative_film_density': 7.,
+
+    'print_backlight': np.array([.9992, .99, 1.]),
+    'print_film_exposure': 4.7,
+    'print_film_density': 30.,
+
+    'luminance_weights': np.array([.3, .5, .2]),
+    'black_point': .5,
+    'post_formation_filter': np.array([1., 1., 0.]),
+    'post_formation_filter_strength': .04,
+    'midtone_saturation': 1.
+}
+
+all_presets = [preset_default, preset_nostalgia, preset_silver]
@@ -0,0 +1,220 @@
+"""
+
+progressive LUT previews for tweaking presets
+
+preview() transforms a coarse LUT right away and returns it, then refines it
+to bigger sizes in a background thread and publishes every refined table
+through a callback:
+
+def show(size, table):
+    ...
+
+coarse, refiner = preview(preset, show)
+...
+refiner.cancel()  # the preset changed, start over with a new preview
+
+nodes that a level shares with the previous one (17, 33, 65 and 129 nodes
+per axis all line up) are copied instead of being transformed again. with a
+flim.StageCache, the stages that a parameter change doesn't affect are reused
+between previews too.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import numpy as np
+import threading
+import time
+
+import flim
+
+
+# LUT sizes of the preview levels before the final size (sizes at or above
+# the final size are skipped)
+preview_sizes = [17, 33, 65]
+
+# number of nodes transformed between checks for cancellation
+preview_chunk_points = 32768
+
+
+# for every index on an axis with size nodes, the index of the same
+# coordinate on an axis with previous_size nodes (or -1 if there's none)
+def shared_indices(size: int, previous_size: int):
+    scaled = np.arange(size) * (previous_size - 1)
+    return np.where(scaled % (size - 1) == 0, scaled // (size - 1), -1)
+
+
+# refines a preview in a background thread (made by preview)
+class PreviewRefiner:
+    def __init__(
+        self,
+        compiled,
+        callback,
+        sizes,
+        coarse,
+        stage_cache=None
+    ):
+        self.compiled = compiled
+        self.callback = callback
+        self.sizes = sizes
+        self.stage_cache = stage_cache
+
+        # the latest table and its size
+        self.size = coarse.shape[0]
+        self.table = coarse
+
+        # (size, seconds) of every level
+        self.timings = []
+
+        self._cancelled = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # stop refining (the current chunk is finished first)
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    # wait until the last level is done (or cancelled), returns True if the
+    # thread finished. errors in the thread are raised here.
+    def wait(self, timeout: float = None):
+        self._thread.join(timeout)
+        if self._error is not None:
+            raise self._error
+        return not self._thread.is_alive()
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    def _run(self):
+        try:
+            for size in self.sizes:
+                t_start = time.perf_counter()
+                table = refine(
+                    self.table,
+                    size,
+                    self.compiled,
+                    self.stage_cache,
+                    self._cancelled
+                )
+                if table is None:
+                    return
+
+                self.timings.append((size, time.perf_counter() - t_start))
+                self.size = size
+                self.table = table
+                self.callback(size, table)
+        except Exception as e:
+            self._error = e
+
+
+# transform a LUT with size nodes per axis, copying the nodes it shares with
+# previous (a transformed LUT of another size). returns None if cancelled
+# (a threading.Event) is set before it's done.
+def refine(previous, size: int, compiled, stage_cache=None, cancelled=None):
+    import colour
+
+    table = np.empty((size, size, size, 3), dtype=flim.compute_dtype)
+    missing = np.ones((size, size, size), dtype=bool)
+
+    if previous is not None:
+        r, g, b = [shared_indices(size, previous.shape[0])] * 3
+        shared = [np.nonzero(indices >= 0)[0] for indices in (r, g, b)]
+
+        table[np.ix_(*shared)] = \
+            previous[np.ix_(r[shared[0]], g[shared[1]], b[shared[2]])]
+        missing[np.ix_(*shared)] = False
+
+    inp = colour.LUT3D.linear_table(size)[missing].astype(table.dtype)
+
+    # the chunks of a level are the same every time, so with stage_cache
+    # their stage outputs are reused when the preset is previewed again
+    out = np.empty(inp.shape, dtype=table.dtype)
+    for start in range(0, inp.shape[0], preview_chunk_points):
+        if cancelled is not None and cancelled.is_set():
+            return None
+
+        stop = start + preview_chunk_points
+        if stage_cache is not None:
+            out[start:stop] = flim.run_stages_cached(
+                inp[start:stop],
+                compiled,
+                stage_cache
+            )
+        else:
+            out[start:stop] = flim.run_stages(
+                inp[start:stop],
+                compiled,
+                'decompression',
+                'oetf'
+            )
+
+    table[missing] = out
+    return table
+
+
+# transform a coarse LUT for preset (a dict or a flim.CompiledPreset) with
+# the first of sizes nodes per axis and return it along with a
+# PreviewRefiner, which refines it to the other sizes and then to final_size
+# (default: the preset's lut_quantize) in a background thread. callback is
+# called as callback(size, table) from that thread with every refined table.
+# stage_cache (a flim.StageCache) is optional, it helps when the same preset
+# is previewed again with a few parameters changed.
+def preview(
+    preset,
+    callback,
+    sizes=None,
+    final_size: int = None,
+    stage_cache=None
+):
+    import colour
+
+    colour.algebra.set_spow_enable(True)
+
+    compiled = flim.compiled_preset_as(
+        flim.compile_preset(preset),
+        flim.compute_dtype
+    )
+
+    if final_size is None:
+        final_size = compiled.lut_quantize
+    if sizes is None:
+        sizes = preview_sizes
+
+    sizes = [size for size in sizes if size < final_size] + [final_size]
+    if any(size < 2 for size in sizes):
+        raise Exception('LUT sizes must be at least 2')
+
+    coarse = refine(None, sizes[0], compiled, stage_cache)
+
+    refiner = PreviewRefiner(compiled, callback, sizes[1:], coarse, stage_cache)
+
+    return coarse, refiner
+
+
+# print how long every level of a preview takes (after the imports)
+if __name__ == '__main__':
+    import sys
+    from presets import all_presets
+
+    names = sys.argv[1:] or [all_presets[0]['name']]
+    for preset in all_presets:
+        if preset['name'] not in names:
+            continue
+
+        t_start = time.perf_counter()
+
+        def report(size, table):
+            print(f'  {size}^3 ready at {time.perf_counter() - t_start:.3f} s')
+
+        coarse, refiner = preview(preset, report)
+        print(f'{preset["name"]}: {coarse.shape[0]}^3 ready at '
+              f'{time.perf_counter() - t_start:.3f} s')
+        refiner.wait()
@@ -0,0 +1,152 @@
+"""
+
+opt-in per-stage profiling for flim
+
+set flim.profiler to a Profiler (or use the profiling context manager) to
+collect the wall time, call count and sample count of every stage of
+apply_transform/transform_rgb:
+
+with profiling() as profiler:
+    apply_transform(table, preset)
+print(profiler.summary())
+profiler.dump_json('profile.json')
+
+when flim.profiler is None (the default), the only cost is one check per
+stage call.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import contextlib
+import json
+import threading
+import time
+
+
+# aggregated timings of named stages
+class Profiler:
+    def __init__(self):
+        # stage name -> {'seconds', 'calls', 'samples'}
+        self.stats = {}
+        self._last = time.perf_counter()
+
+    def add(self, name: str, seconds: float, samples: int = 1, calls: int = 1):
+        entry = self.stats.setdefault(
+            name,
+            {'seconds': 0., 'calls': 0, 'samples': 0}
+        )
+        entry['seconds'] += seconds
+        entry['calls'] += calls
+        entry['samples'] += samples
+
+    # start timing for lap
+    def restart(self):
+        self._last = time.perf_counter()
+
+    # add the time since the last lap (or restart) to a stage
+    def lap(self, name: str, samples: int = 1):
+        now = time.perf_counter()
+        self.add(name, now - self._last, samples)
+        self._last = now
+
+    # time the body of a with statement as a stage
+    @contextlib.contextmanager
+    def stage(self, name: str, samples: int = 1):
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t_start, samples)
+
+    # add the stats of another profiler (or its to_dict output)
+    def merge(self, other):
+        stats = other.stats if isinstance(other, Profiler) else other
+        for name, entry in stats.items():
+            self.add(name, entry['seconds'], entry['samples'], entry['calls'])
+
+    def reset(self):
+        self.stats = {}
+        self.restart()
+
+    def to_dict(self):
+        return {name: dict(entry) for name, entry in self.stats.items()}
+
+    def dump_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    # a table of the stages in the order they were first seen
+    def summary(self):
+        total = sum(entry['seconds'] for entry in self.stats.values())
+
+        lines = [
+            f'{"stage":<22} {"time (s)":>10} {"%":>6} {"calls":>10} '
+            f'{"samples":>12} {"us/sample":>10}'
+        ]
+        for name, entry in self.stats.items():
+            share = 100. * entry['seconds'] / total if total > 0. else 0.
+            per_sample = 1e6 * entry['seconds'] / entry['samples'] \
+                if entry['samples'] > 0 else 0.
+            lines.append(
+                f'{name:<22} {entry["seconds"]:>10.4f} {share:>6.1f} '
+                f'{entry["calls"]:>10} {entry["samples"]:>12} '
+                f'{per_sample:>10.3f}'
+            )
+        lines.append(f'{"total":<22} {total:>10.4f}')
+
+        return '\n'.join(lines)
+
+
+# passes the timings of every thread on to the profiler that the thread set
+# with use (timings of other threads are dropped). set flim.profiler to one of
+# these to profile transforms that run in several threads at once.
+class ThreadProfilers:
+    def __init__(self):
+        self._local = threading.local()
+
+    # send the timings of this thread to profiler in the body of a with
+    # statement
+    @contextlib.contextmanager
+    def use(self, profiler: Profiler):
+        self._local.profiler = profiler
+        try:
+            yield profiler
+        finally:
+            self._local.profiler = None
+
+    def current(self):
+        return getattr(self._local, 'profiler', None)
+
+    def add(self, name: str, seconds: float, samples: int = 1, calls: int = 1):
+        profiler = self.current()
+        if profiler is not None:
+            profiler.add(name, seconds, samples, calls)
+
+    def restart(self):
+        profiler = self.current()
+        if profiler is not None:
+            profiler.restart()
+
+    def lap(self, name: str, samples: int = 1):
+        profiler = self.current()
+        if profiler is not None:
+            profiler.lap(name, samples)
+
+
+# enable profiling in flim for the body of a with statement
+@contextlib.contextmanager
+def profiling(profiler: Profiler = None):
+    import flim
+
+    if profiler is None:
+        profiler = Profiler()
+
+    previous = flim.profiler
+    flim.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        flim.profiler = previous
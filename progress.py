@@ -0,0 +1,59 @@
+"""
+
+progress reporting for long LUT compiles
+
+apply_transform accepts a progress callback that is called as
+progress(done, total) with the number of completed table nodes. calls can be
+very frequent, so reporters should throttle their output like ConsoleProgress.
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import time
+
+
+def format_duration(seconds: float):
+    if seconds < 60.:
+        return f'{seconds:.1f} s'
+    if seconds < 3600.:
+        return f'{int(seconds // 60)} min {int(seconds % 60)} s'
+    return f'{int(seconds // 3600)} h {int(seconds % 3600 // 60)} min'
+
+
+# prints completed nodes, throughput and ETA at most once every interval
+# seconds (and always when done), one line per report so it reads well in CI
+# logs
+class ConsoleProgress:
+    def __init__(self, label: str = 'transforming', interval: float = 2.):
+        self.label = label
+        self.interval = interval
+        self.t_start = None
+        self.t_last_report = None
+
+    def __call__(self, done: int, total: int):
+        now = time.perf_counter()
+        if self.t_start is None or done == 0:
+            self.t_start = now
+            self.t_last_report = now
+            return
+
+        finished = done >= total
+        if not finished and now - self.t_last_report < self.interval:
+            return
+        self.t_last_report = now
+
+        elapsed = now - self.t_start
+        rate = done / elapsed if elapsed > 0. else 0.
+        percent = 100. * done / total if total > 0 else 100.
+
+        line = f'{self.label}: {done}/{total} nodes ({percent:.1f}%), ' \
+            f'{rate:.0f} nodes/s'
+        if finished:
+            line += f', took {format_duration(elapsed)}'
+        elif rate > 0.:
+            line += f', ETA {format_duration((total - done) / rate)}'
+
+        print(line, flush=True)
@@ -1,10 +1,23 @@
+from typing import NamedTuple
+
 import numpy as np
 
 
-# https://www.desmos.com/calculator/khkztixyeu
-def super_sigmoid(inp, toe_x, toe_y, shoulder_x, shoulder_y):
+# parameters of super_sigmoid that only depend on the toe and shoulder points
+class SuperSigmoidParams(NamedTuple):
+    toe_x: float
+    toe_y: float
+    shoulder_x: float
+    shoulder_y: float
+    slope: float
+    intercept: float
+    toe_pow: float
+    shoulder_pow: float
+
+
+# precompute the parameters for super_sigmoid_from_params
+def super_sigmoid_params(toe_x, toe_y, shoulder_x, shoulder_y):
     # clip
-    inp = np.clip(inp, 0., 1.)
     toe_x = np.clip(toe_x, 0., 1.)
     toe_y = np.clip(toe_y, 0., 1.)
     shoulder_x = np.clip(shoulder_x, 0., 1.)
@@ -14,22 +27,66 @@ def super_sigmoid(inp, toe_x, toe_y, shoulder_x, shoulder_y):
     slope = (shoulder_y - toe_y) / (shoulder_x - toe_x)
 
     # toe
-    if inp < toe_x:
-        toe_pow = slope * toe_x / toe_y
-        return toe_y * (inp / toe_x)**toe_pow
+    toe_pow = slope * toe_x / toe_y
 
     # straight line
-    if inp < shoulder_x:
-        intercept = toe_y - (slope * toe_x)
-        return slope * inp + intercept
+    intercept = toe_y - (slope * toe_x)
 
     # shoulder
     shoulder_pow = -slope / (
         ((shoulder_x - 1.) / (1. - shoulder_x)**2.) * (1. - shoulder_y)
     )
-    return (1. - (1. - (inp - shoulder_x) / (1. - shoulder_x))**shoulder_pow)  \
-        * (1. - shoulder_y)  \
-        + shoulder_y
+
+    return SuperSigmoidParams(
+        toe_x,
+        toe_y,
+        shoulder_x,
+        shoulder_y,
+        slope,
+        intercept,
+        toe_pow,
+        shoulder_pow
+    )
+
+
+# evaluate super_sigmoid on a scalar or an array of any shape with precomputed
+# parameters. all three segments are evaluated over the whole input and then
+# selected with masks, so there is no per-sample branching.
+def super_sigmoid_from_params(inp, params: SuperSigmoidParams):
+    # clip
+    inp = np.clip(inp, 0., 1.)
+
+    # the unused segments may divide by zero or overflow, which is harmless
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # toe
+        toe = params.toe_y * (inp / params.toe_x)**params.toe_pow
+
+        # straight line
+        line = params.slope * inp + params.intercept
+
+        # shoulder
+        shoulder = (
+            1. - (
+                1. - (inp - params.shoulder_x) / (1. - params.shoulder_x)
+            )**params.shoulder_pow
+        ) * (1. - params.shoulder_y) + params.shoulder_y
+
+    out = np.where(
+        inp < params.toe_x,
+        toe,
+        np.where(inp < params.shoulder_x, line, shoulder)
+    )
+
+    # return a scalar for scalar input
+    return out[()]
+
+
+# https://www.desmos.com/calculator/khkztixyeu
+def super_sigmoid(inp, toe_x, toe_y, shoulder_x, shoulder_y):
+    return super_sigmoid_from_params(
+        inp,
+        super_sigmoid_params(toe_x, toe_y, shoulder_x, shoulder_y)
+    )
 
 
 if __name__ == "__main__":
@@ -40,8 +97,7 @@ if __name__ == "__main__":
     shoulder = [.664, .699]
 
     xs = np.arange(0., 1., .01)
-    ys = np.vectorize(super_sigmoid)(
-        xs, toe[0], toe[1], shoulder[0], shoulder[1])
+    ys = super_sigmoid(xs, toe[0], toe[1], shoulder[0], shoulder[1])
 
     fig, ax = plt.subplots()
     ax.plot(xs, ys)
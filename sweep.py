@@ -0,0 +1,98 @@
+"""
+
+parameter sweeps over flim presets
+
+preset_grid() makes a variant of a base preset for every combination of the
+given parameter values, and flim.transform_sweep() evaluates all of them on a
+set of probe colors at once:
+
+variants = preset_grid(preset_default, {
+    'negative_film_exposure': np.linspace(4., 8., 9),
+    'print_film_density': np.linspace(5., 9., 9),
+})
+out = flim.transform_sweep(variants, probe_colors())  # (81, 4096, 3)
+
+repo:
+https://github.com/bean-mhm/flim
+
+"""
+
+
+import itertools
+import numpy as np
+import time
+
+import flim
+
+
+# variants of base (a preset dict) for every combination of values, a dict
+# mapping parameter names to lists of values (RGB parameters take lists of
+# triplets). the last parameter varies the fastest. the variants are named
+# like base (with the index of the variant appended).
+def preset_grid(base: dict, values: dict):
+    unknown = [key for key in values if key not in flim.preset_keys]
+    if len(unknown) > 0:
+        raise Exception(f'unknown preset keys: {unknown}')
+
+    variants = []
+    for combination in itertools.product(*values.values()):
+        variant = dict(base)
+        variant.update(zip(values.keys(), combination))
+        variant['name'] = f'{base["name"]}_{len(variants)}'
+        variants.append(variant)
+
+    return variants
+
+
+# random linear BT.709 I-D65 probe colors, log2-uniform per channel in
+# [log2_min, log2_max], plus a gray ramp with a point per stop. the same seed
+# gives the same colors.
+def probe_colors(
+    count: int = 4096,
+    log2_min: float = -10.,
+    log2_max: float = 10.,
+    seed: int = 0
+):
+    ramp = 2.**np.arange(log2_min, log2_max + 1.)
+    ramp = np.repeat(ramp[:, np.newaxis], 3, axis=1)
+
+    rng = np.random.default_rng(seed)
+    colors = 2.**rng.uniform(log2_min, log2_max, (count - len(ramp), 3))
+
+    return np.concatenate([ramp, colors])
+
+
+# compare the time of a sweep with compiling and transforming the variants one
+# by one
+if __name__ == '__main__':
+    from presets import preset_default
+
+    variants = preset_grid(preset_default, {
+        'negative_film_exposure': np.linspace(4., 8., 20),
+        'print_film_density': np.linspace(5., 9., 20),
+        'extended_gamut_red_mul': [.95, 1., 1.05],
+    })
+    probes = probe_colors(256)
+
+    # warm up (imports)
+    flim.transform_sweep(variants[:1], probes)
+
+    t_start = time.perf_counter()
+    out = flim.transform_sweep(variants, probes)
+    t_sweep = time.perf_counter() - t_start
+    print(f'{len(variants)} variants x {len(probes)} probes: {out.shape}, '
+          f'{t_sweep:.2f} s')
+
+    # a tenth of the variants is enough for an estimate
+    count = max(len(variants) // 10, 1)
+    t_start = time.perf_counter()
+    for variant in variants[:count]:
+        flim.run_stages(
+            probes,
+            flim.compile_preset(variant),
+            'pre_exposure',
+            'oetf'
+        )
+    t_each = (time.perf_counter() - t_start) * len(variants) / count
+    print(f'one by one: {t_each:.2f} s (estimated), '
+          f'{t_each / t_sweep:.1f}x slower')
@@ -0,0 +1,65 @@
+import numpy as np
+import colour
+import json
+import os
+
+import flim
+from build import build_luts
+from lut_cache import LUTCache
+from presets import *
+
+
+# build every preset with a backend, with all presets transformed at once
+def build(output_dir, backend, **kwargs):
+    previous = flim.backend, flim.n_jobs
+    flim.backend, flim.n_jobs = backend, 3
+    try:
+        return build_luts(
+            all_presets,
+            'test',
+            str(output_dir),
+            ['npy', 'cube'],
+            size=9,
+            **kwargs
+        )
+    finally:
+        flim.backend, flim.n_jobs = previous
+
+
+def test_build_luts(tmp_path):
+    references = {
+        preset['name']: flim.apply_transform(
+            colour.LUT3D.linear_table(9),
+            preset
+        )
+        for preset in all_presets
+    }
+
+    for backend in ['batch', 'parallel']:
+        output_dir = tmp_path / backend
+        cache = LUTCache(str(tmp_path / f'{backend}_cache'))
+
+        summary = build(output_dir, backend, cache=cache, profile=True)
+        assert [job['source'] for job in summary] == ['computed'] * 3
+
+        for preset in all_presets:
+            path = output_dir / f'flim_{preset["name"]}'
+            np.testing.assert_allclose(
+                np.load(f'{path}.npy'),
+                references[preset['name']],
+                rtol=0.,
+                atol=1e-9
+            )
+            assert os.path.isfile(f'{path}.cube')
+
+            # every stage is timed
+            with open(f'{path}.profile.json') as f:
+                stages = json.load(f)
+            assert list(stages) == [name for name, _, _ in flim.stages]
+
+        # unchanged LUTs are skipped, forced ones come from the cache
+        summary = build(output_dir, backend, cache=cache)
+        assert [job['source'] for job in summary] == ['up to date'] * 3
+
+        summary = build(output_dir, backend, cache=cache, force=True)
+        assert [job['source'] for job in summary] == ['cache'] * 3
@@ -0,0 +1,49 @@
+import numpy as np
+
+import flim
+from fit import ParameterSpace, candidate_costs, fit_restart
+from presets import *
+
+
+# a red multiplier of 0 (the lower bound) makes the gamut extension matrix
+# singular
+bounds = {'extended_gamut_red_mul': (0., 2.)}
+
+
+def samples(count=256):
+    rng = np.random.default_rng(0)
+    inputs = 2. ** rng.uniform(-8., 4., (count, 3))
+    return inputs, flim.transform_sweep([preset_default], inputs)[0]
+
+
+def test_singular_candidates_cost_infinity():
+    space = ParameterSpace(preset_default, bounds)
+    inputs, targets = samples()
+
+    costs = candidate_costs(
+        space,
+        np.array([[0.], [.5], [0.], [1.]]),
+        inputs,
+        targets
+    )
+
+    assert np.all(np.isinf(costs[[0, 2]]))
+    assert np.all(np.isfinite(costs[[1, 3]]))
+
+
+def test_fit_survives_singular_candidates():
+    space = ParameterSpace(preset_default, bounds)
+    inputs, targets = samples()
+
+    # starting at the singular lower bound, many candidates are clipped to it
+    best, cost, _ = fit_restart(
+        space,
+        np.array([0.]),
+        inputs,
+        targets,
+        seed=0,
+        generations=20
+    )
+
+    assert np.isfinite(cost)
+    assert best[0] > 0.
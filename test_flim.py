@@ -0,0 +1,244 @@
+import numpy as np
+import colour
+import contextlib
+import io
+import pytest
+
+import flim
+from precision import spi3d_tolerance
+from presets import *
+from profiling import profiling
+from utils import *
+
+
+# documented tolerance of the float64 paths against transform_rgb
+tolerance = 1e-9
+
+
+# a 9^3 LUT of preset transformed with the given backend and compute dtype
+# (the serial backend is the transform_rgb reference)
+def transform_lut(
+    preset,
+    backend='serial',
+    dtype=np.float64,
+    stage_cache=None
+):
+    previous = flim.backend, flim.compute_dtype, flim.n_jobs
+    flim.backend, flim.compute_dtype, flim.n_jobs = backend, dtype, 2
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return flim.apply_transform(
+                colour.LUT3D.linear_table(9),
+                preset,
+                stage_cache=stage_cache
+            )
+    finally:
+        flim.backend, flim.compute_dtype, flim.n_jobs = previous
+
+
+def test_batch_matches_serial():
+    for preset in all_presets:
+        np.testing.assert_allclose(
+            transform_lut(preset, 'batch'),
+            transform_lut(preset),
+            rtol=0.,
+            atol=tolerance,
+            err_msg=preset['name']
+        )
+
+
+def test_parallel_matches_serial():
+    # the default slabs and slabs that don't divide the table evenly
+    previous_slab_size = flim.slab_size
+    try:
+        for slab_size in [None, 100]:
+            flim.slab_size = slab_size
+            for preset in all_presets:
+                np.testing.assert_allclose(
+                    transform_lut(preset, 'parallel'),
+                    transform_lut(preset),
+                    rtol=0.,
+                    atol=tolerance,
+                    err_msg=f'{preset["name"]}, {slab_size}'
+                )
+    finally:
+        flim.slab_size = previous_slab_size
+
+
+def test_jit_matches_serial():
+    if not flim.jit_available():
+        pytest.skip('numba is not installed')
+
+    for preset in all_presets:
+        np.testing.assert_allclose(
+            transform_lut(preset, 'jit'),
+            transform_lut(preset),
+            rtol=0.,
+            atol=tolerance,
+            err_msg=preset['name']
+        )
+
+
+def test_float32_matches_serial():
+    for preset in all_presets:
+        reference = transform_lut(preset)
+        for backend in ['batch', 'parallel']:
+            out = transform_lut(preset, backend, np.float32)
+            assert out.dtype == np.float32
+            np.testing.assert_allclose(
+                out,
+                reference,
+                rtol=0.,
+                atol=spi3d_tolerance,
+                err_msg=f'{preset["name"]}, {backend}'
+            )
+
+
+def test_stage_cache_matches_serial():
+    cache = flim.StageCache()
+    for preset in all_presets:
+        reference = transform_lut(preset)
+
+        # the second run reuses the cached stage outputs
+        for _ in range(2):
+            np.testing.assert_allclose(
+                transform_lut(preset, 'batch', stage_cache=cache),
+                reference,
+                rtol=0.,
+                atol=tolerance,
+                err_msg=preset['name']
+            )
+
+        # a post-formation change only reruns the stages after the develop
+        tweaked = dict(
+            preset,
+            midtone_saturation=preset['midtone_saturation'] * 1.5
+        )
+        with profiling() as profiler:
+            out = transform_lut(tweaked, 'batch', stage_cache=cache)
+        assert list(profiler.stats) == ['midtone_saturation', 'oetf']
+        np.testing.assert_allclose(
+            out,
+            transform_lut(tweaked),
+            rtol=0.,
+            atol=tolerance,
+            err_msg=preset['name']
+        )
+
+
+def test_sweep_matches_serial():
+    # the decompressed nodes of the LUT are the probes, so that the sweep
+    # runs the same stages as apply_transform. all the presets get the LUT
+    # compression range of the default preset to share them.
+    log2_range = {
+        'lut_compress_log2_min': preset_default['lut_compress_log2_min'],
+        'lut_compress_log2_max': preset_default['lut_compress_log2_max']
+    }
+    probes = flim.run_stages(
+        colour.LUT3D.linear_table(9),
+        flim.compile_preset(preset_default),
+        'decompression',
+        'decompression'
+    ).reshape(-1, 3)
+
+    # every preset twice, so that the groups have several presets
+    presets = [
+        dict(preset, **log2_range) for preset in all_presets for _ in range(2)
+    ]
+    out = flim.transform_sweep(presets, probes)
+
+    for preset, preset_out in zip(presets, out):
+        np.testing.assert_allclose(
+            preset_out,
+            transform_lut(preset).reshape(-1, 3),
+            rtol=0.,
+            atol=tolerance,
+            err_msg=preset['name']
+        )
+
+
+def test_fused_develop_matches_layers():
+    # exposures over the whole sigmoid range, neutral and saturated
+    rng = np.random.default_rng(0)
+    inp = 2. ** rng.uniform(-12., 12., (2000, 3))
+
+    for preset in all_presets:
+        compiled = flim.compile_preset(preset)
+        for density in [compiled.negative_density, compiled.print_density]:
+            args = (
+                compiled.sigmoid_log2_min,
+                compiled.sigmoid_log2_max,
+                compiled.sigmoid_params,
+                density
+            )
+
+            # the layers one by one, like rgb_develop, with array operations
+            exposed = inp * compiled.negative_exposure_mul
+            layers = 1.
+            for sensitivity, dye in compiled.film_layers:
+                mix = dye_mix_factor(np.dot(exposed, sensitivity), *args)
+                layers = layers * lerp(dye, white, mix[:, np.newaxis])
+
+            np.testing.assert_array_equal(
+                rgb_develop_batch(
+                    inp,
+                    compiled.negative_exposure_mul,
+                    compiled.sensitivity_mat,
+                    compiled.dye_mat,
+                    *args
+                ),
+                layers,
+                err_msg=preset['name']
+            )
+
+        # the scalar develop only differs by the rounding of NumPy's
+        # vectorized power (see rgb_develop_batch)
+        np.testing.assert_allclose(
+            flim.negative_and_print_batch(inp, compiled),
+            [flim.negative_and_print(v.copy(), compiled) for v in inp],
+            rtol=0.,
+            atol=1e-14,
+            err_msg=preset['name']
+        )
+
+
+def test_hsv_batch_is_bit_compatible():
+    rng = np.random.default_rng(0)
+    rgb = rng.uniform(0., 1., (2000, 3))
+    rgb[:4] = [[0., 0., 0.], [.5, .5, .5], [1., 0., 0.], [0., 1., 1.]]
+    hsv = rgb_to_hsv_batch(rgb)
+
+    np.testing.assert_array_equal(
+        hsv,
+        [rgb_to_hsv(v) for v in rgb]
+    )
+    np.testing.assert_array_equal(
+        hsv_to_rgb_batch(hsv),
+        [hsv_to_rgb(v) for v in hsv]
+    )
+    np.testing.assert_array_equal(
+        rgb_adjust_hsv_batch(rgb, .5, 1.1, .9),
+        [rgb_adjust_hsv(v, .5, 1.1, .9) for v in rgb]
+    )
+
+
+def test_transform_image_with_nan_and_inf_pixels():
+    image = np.full((4, 4, 3), .18)
+    image[0, 0] = [np.nan, .5, np.nan]
+    image[0, 1] = [np.inf, .5, .1]
+    image[0, 2] = [-np.inf, .5, .1]
+    image[0, 3] = [np.inf, np.inf, np.inf]
+
+    for preset in all_presets:
+        out = flim.transform_image(image, preset)
+        assert np.all(np.isfinite(out))
+
+        # NaN and -inf are treated like negative values, inf like a very
+        # bright value
+        expected = flim.transform_image(np.array([
+            [0., .5, 0.],
+            [1e30, .5, .1],
+            [0., .5, .1],
+            [1e30, 1e30, 1e30]
+        ]), preset)
+        np.testing.assert_allclose(out[0], expected, rtol=0., atol=1e-9)
@@ -0,0 +1,29 @@
+import numpy as np
+
+import flim
+import inverse
+from presets import *
+
+
+# flim's own outputs (highlights included) must invert to colors that map
+# back to them
+def test_roundtrip_of_forward_outputs():
+    rng = np.random.default_rng(0)
+    scene = np.concatenate([
+        2.**rng.uniform(-10., 8., (2000, 3)),
+        [[8.17, 8.02, 6.72], [100., 100., 100.], [.18, .18, .18]]
+    ])
+
+    for preset in all_presets:
+        compiled = flim.compile_preset(preset)
+        outputs = flim.transform_image(scene, preset)
+        index = inverse.forward_index(compiled, 32)
+
+        coords, errors = inverse.invert_coords(outputs, compiled, index)
+        roundtrip = np.max(
+            np.abs(inverse.forward(coords, compiled) - outputs),
+            axis=-1
+        )
+
+        assert np.max(roundtrip) <= inverse.reachable_tolerance
+        np.testing.assert_allclose(errors, roundtrip, atol=1e-12)
@@ -0,0 +1,61 @@
+import numpy as np
+import colour
+
+import flim
+from lut_accuracy import *
+from presets import *
+
+
+def test_analyze_percentiles():
+    reference = exact_reference(preset_default, 300)
+
+    recommendation, results = analyze(
+        preset_default,
+        target=100.,
+        sizes=[9, 17],
+        ranges=[(-10., 10.)],
+        reference=reference
+    )
+
+    # the first size meets the loose target, so the bigger one isn't tried
+    assert [result['size'] for result in results] == [9]
+    assert recommendation is results[0]
+
+    for method, errors in results[0]['errors'].items():
+        assert list(errors) == [str(q) for q in report_percentiles]
+        values = list(errors.values())
+        assert values == sorted(values), method
+        assert values[0] >= 0.
+
+    recommendation, _ = analyze(
+        preset_default,
+        target=0.,
+        sizes=[9],
+        ranges=[(-10., 10.)],
+        reference=reference
+    )
+    assert recommendation is None
+
+
+def test_exact_reference_has_no_error():
+    samples, exact_lab = exact_reference(preset_default, 300)
+
+    errors = colour.delta_E(exact_lab, exact_lab, method='CIE 2000')
+    assert all(value == 0. for value in percentiles(errors).values())
+
+    # at the nodes of the LUT, the interpolation gives the exact transform
+    log2_range = (
+        preset_default['lut_compress_log2_min'],
+        preset_default['lut_compress_log2_max']
+    )
+    nodes = flim.run_stages(
+        colour.LUT3D.linear_table(9),
+        flim.compile_preset(preset_default),
+        'decompression',
+        'decompression'
+    ).reshape(-1, 3)
+    nodes_lab = srgb_to_lab(flim.transform_image(nodes, preset_default))
+
+    errors, _ = lut_errors(preset_default, 9, log2_range, nodes, nodes_lab)
+    for method, method_errors in errors.items():
+        assert np.max(method_errors) < 1e-9, method
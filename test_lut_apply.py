@@ -0,0 +1,31 @@
+import numpy as np
+
+from lut_apply import apply_lut, lut_shaper
+
+
+def identity_table(size):
+    axis = np.linspace(0., 1., size)
+    return np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+
+
+def test_shaper_treats_nan_like_negative_values():
+    inp = np.array([[np.nan, -1., 0.]])
+    out = lut_shaper(inp, -10., 10.)
+
+    assert np.all(np.isfinite(out))
+    assert np.all(out == out[0, 2])
+
+
+def test_apply_lut_with_nan_pixels():
+    image = np.full((4, 4, 3), .18)
+    image[1, 2] = [np.nan, .5, np.nan]
+    table = identity_table(9)
+
+    for interpolation in ['trilinear', 'tetrahedral']:
+        out = apply_lut(image, table, -10., 10., interpolation)
+
+        assert np.all(np.isfinite(out))
+        np.testing.assert_allclose(
+            out[1, 2],
+            apply_lut(np.array([0., .5, 0.]), table, -10., 10., interpolation)
+        )
@@ -0,0 +1,82 @@
+import numpy as np
+import os
+import stat
+
+import flim
+import lut_cache
+from lut_cache import LUTCache, cache_key
+from presets import *
+
+
+def test_put_creates_files_with_normal_permissions(tmp_path):
+    previous = os.umask(0o022)
+    try:
+        cache = LUTCache(str(tmp_path))
+        table = np.linspace(0., 1., 9 * 9 * 9 * 3).reshape(9, 9, 9, 3)
+        cache.put('key', table)
+    finally:
+        os.umask(previous)
+
+    mode = stat.S_IMODE(os.stat(cache.path('key')).st_mode)
+    assert mode == 0o644
+
+    np.testing.assert_array_equal(cache.get('key'), table)
+    assert [entry.name for entry in os.scandir(tmp_path)] == ['key.npy']
+
+
+def test_get_returns_stored_tables(tmp_path):
+    cache = LUTCache(str(tmp_path))
+    table = np.linspace(0., 1., 9 * 9 * 9 * 3).reshape(9, 9, 9, 3)
+
+    assert cache.get('key') is None
+    cache.put('key', table)
+    np.testing.assert_array_equal(cache.get('key'), table)
+    assert cache.get('other') is None
+
+
+def test_cache_key_changes_with_the_inputs(monkeypatch):
+    key = cache_key(preset_default, 'v1', 9, np.float64)
+    assert cache_key(preset_default, 'v1', 9, np.float64) == key
+
+    changed = [
+        cache_key(dict(preset_default, pre_exposure=1.5), 'v1', 9, np.float64),
+        cache_key(preset_default, 'v2', 9, np.float64),
+        cache_key(preset_default, 'v1', 17, np.float64),
+        cache_key(preset_default, 'v1', 9, np.float32)
+    ]
+
+    monkeypatch.setattr(flim, 'dye_mix_max_error', 1e-4)
+    changed.append(cache_key(preset_default, 'v1', 9, np.float64))
+    monkeypatch.setattr(flim, 'dye_mix_max_error', None)
+
+    monkeypatch.setattr(
+        lut_cache,
+        'transform_source_hash',
+        lambda: 'changed source'
+    )
+    changed.append(cache_key(preset_default, 'v1', 9, np.float64))
+
+    assert len(set(changed + [key])) == len(changed) + 1
+
+
+def test_every_backend_is_a_transform_source():
+    for name in ['flim.py', 'flim_jit.py', 'utils.py', 'super_sigmoid.py']:
+        assert name in lut_cache.transform_sources
+
+
+def test_evicts_the_least_recently_used_tables(tmp_path):
+    table = np.zeros((9, 9, 9, 3))
+    entry_bytes = 128 + table.nbytes
+    cache = LUTCache(str(tmp_path), max_bytes=3 * entry_bytes)
+
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, table)
+        os.utime(cache.path(key), (1000. + i, 1000. + i))
+
+    # reading 'a' makes it the most recently used
+    assert cache.get('a') is not None
+
+    cache.put('d', table)
+    assert sorted(
+        entry.name for entry in os.scandir(tmp_path)
+    ) == ['a.npy', 'c.npy', 'd.npy']
@@ -0,0 +1,77 @@
+import numpy as np
+import colour
+import os
+import pytest
+
+from lut_io import *
+
+
+def random_table(size=9):
+    return np.random.default_rng(0).uniform(0., 1., (size, size, size, 3))
+
+
+def test_text_writers_match_colour(tmp_path):
+    table = random_table()
+    comments = ['flim test', '', 'Preset: default']
+
+    for extension, writer in [
+        ('.spi3d', lambda path: write_spi3d(path, table, comments)),
+        ('.cube', lambda path: write_cube(path, table, comments, 'flim'))
+    ]:
+        path = str(tmp_path / f'fast{extension}')
+        reference_path = str(tmp_path / f'colour{extension}')
+        writer(path)
+        colour.write_LUT(
+            colour.LUT3D(table, name='flim', comments=comments),
+            reference_path,
+            decimals=5
+        )
+
+        with open(path, 'rb') as f, open(reference_path, 'rb') as g:
+            assert f.read() == g.read(), extension
+
+
+def test_flut_round_trip(tmp_path):
+    table = random_table()
+    info = {'name': 'default', 'version': 'test'}
+
+    # comments of different lengths, so the header needs different padding
+    for comments in [[], ['a'], ['flim test'] * 7]:
+        for dtype, max_error in [('float32', 2.**-25), ('float16', 2.**-12)]:
+            path = str(tmp_path / f'{dtype}.flut')
+            write_flut(path, table, comments, dtype, info)
+
+            header, offset = read_flut_header(path)
+            assert offset % flut_alignment == 0
+            assert header['size'] == 9
+            assert header['comments'] == comments
+            assert header['name'] == 'default'
+            assert np.dtype(header['dtype']) == np.dtype(dtype)
+            assert os.path.getsize(path) \
+                == offset + table.size * np.dtype(dtype).itemsize
+
+            for mmap in [True, False]:
+                loaded, loaded_header = load_flut(path, mmap)
+                assert loaded_header == header
+                assert loaded.dtype == np.dtype(dtype)
+                np.testing.assert_array_equal(
+                    loaded,
+                    table.astype(dtype)
+                )
+
+                # the values are rounded to the nearest float, which is at
+                # most half a step away below 1
+                error = np.abs(np.asarray(loaded, dtype=np.float64) - table)
+                assert error.max() <= max_error
+
+            del loaded
+
+
+def test_load_flut_rejects_truncated_files(tmp_path):
+    path = str(tmp_path / 'truncated.flut')
+    write_flut(path, random_table())
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    with pytest.raises(Exception, match='truncated'):
+        load_flut(path)
@@ -0,0 +1,50 @@
+import numpy as np
+import colour
+import contextlib
+import io
+
+import flim
+import preview
+from presets import *
+
+
+def test_cancel_and_restart_matches_apply_transform():
+    cache = flim.StageCache(max_bytes=1024**2)
+    tables = []
+
+    # small chunks, so the cancelled refiner is still writing to the cache
+    # while the new preview runs
+    previous_chunk_points = preview.preview_chunk_points
+    preview.preview_chunk_points = 64
+    try:
+        _, cancelled = preview.preview(
+            preset_default,
+            lambda size, table: None,
+            sizes=[5, 9, 17],
+            final_size=33,
+            stage_cache=cache
+        )
+        cancelled.cancel()
+
+        _, refiner = preview.preview(
+            preset_default,
+            lambda size, table: tables.append((size, table)),
+            sizes=[5, 9, 17],
+            final_size=33,
+            stage_cache=cache
+        )
+        assert refiner.wait(60.)
+        assert cancelled.wait(60.)
+    finally:
+        preview.preview_chunk_points = previous_chunk_points
+
+    assert [size for size, _ in tables] == [9, 17, 33]
+    assert cache.nbytes == sum(value.nbytes for value in cache.entries.values())
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = flim.apply_transform(
+            colour.LUT3D.linear_table(33),
+            preset_default
+        )
+    np.testing.assert_allclose(tables[-1][1], reference, rtol=0., atol=1e-9)
+    np.testing.assert_array_equal(refiner.table, tables[-1][1])
@@ -0,0 +1,92 @@
+import numpy as np
+
+import flim
+from presets import *
+from utils import *
+
+
+# sigmoid toe and shoulder points: (toe_x, toe_y, shoulder_x, shoulder_y)
+# with straight segments (powers of 1), with powers of about 1.18 and with
+# powers below 1, where f'' is unbounded at 0 and 1
+sigmoid_variants = [
+    (.3, .3, .7, .7),
+    (.3, .28, .7, .72),
+    (.3, .35, .7, .65)
+]
+
+
+def sigmoid_variant(points):
+    return dict(
+        preset_default,
+        name=f'sigmoid {points}',
+        sigmoid_toe_x=points[0],
+        sigmoid_toe_y=points[1],
+        sigmoid_shoulder_x=points[2],
+        sigmoid_shoulder_y=points[3]
+    )
+
+
+def test_dye_mix_table_error_is_within_max_error():
+    # exposures log-uniform over the sigmoid range and a bit beyond, at
+    # random points that don't line up with the nodes of the tables, plus
+    # exposures close to the ends of the range
+    rng = np.random.default_rng(0)
+
+    presets = all_presets + [sigmoid_variant(v) for v in sigmoid_variants]
+    for preset in presets:
+        compiled = flim.compile_preset(preset)
+        params = compiled.sigmoid_params
+        log2_min = compiled.sigmoid_log2_min
+        log2_max = compiled.sigmoid_log2_max
+        offset = 2.**log2_min
+        near = np.geomspace(1e-12, 1e-2, 10000)
+        mono = np.concatenate([
+            2. ** rng.uniform(log2_min - 1., log2_max + 1., 1_000_000),
+            offset * near,
+            (2.**log2_max + offset) * (1. - near) - offset,
+            [0., 2.**log2_max]
+        ])
+
+        bounded = all(
+            power == 1. or power >= 2.
+            for power in [params.toe_pow, params.shoulder_pow]
+        )
+
+        for density in [compiled.negative_density, compiled.print_density]:
+            args = (log2_min, log2_max, params, density)
+            exact = dye_mix_factor(mono, *args)
+
+            for max_error in [1e-3, 1e-5, 1e-7]:
+                table = dye_mix_table(params, density, max_error)
+
+                # without a bound, the develop evaluates the factors exactly
+                if table is None:
+                    assert not bounded, preset['name']
+                    inp = mono[:3000].reshape(-1, 3)
+                    develop_args = (
+                        1.,
+                        compiled.sensitivity_mat,
+                        compiled.dye_mat,
+                        *args
+                    )
+                    np.testing.assert_array_equal(
+                        rgb_develop_batch(inp, *develop_args, max_error),
+                        rgb_develop_batch(inp, *develop_args)
+                    )
+                    continue
+
+                values, slopes, _ = table
+                lookup = dye_mix_factor_lookup(
+                    mono,
+                    log2_min,
+                    log2_max,
+                    values,
+                    slopes
+                )
+
+                assert np.max(np.abs(lookup - exact)) <= max_error, \
+                    preset['name']
+
+            # the shipped presets always get a table
+            if preset in all_presets:
+                assert bounded
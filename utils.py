@@ -9,9 +9,9 @@ https://github.com/bean-mhm/flim
 
 
 import numpy as np
-import colour
+import functools
 
-from super_sigmoid import super_sigmoid
+from super_sigmoid import *
 
 
 # constants
@@ -23,6 +23,10 @@ cyan = np.array([0.0, 1.0, 1.0])
 blue = np.array([0.0, 0.0, 1.0])
 magenta = np.array([1.0, 0.0, 1.0])
 
+# (sensitivity tone, dye tone) of the blue-, green- and red-sensitive film
+# layers
+film_layers = ((blue, yellow), (green, magenta), (red, cyan))
+
 
 def wrap(x, a, b):
     return a + np.mod(x - a, b - a)
@@ -157,6 +161,95 @@ def rgb_adjust_hsv(inp, hue, sat, value):
     return hsv_to_rgb(hsv)
 
 
+# same as rgb_to_hsv, but for (..., 3) arrays (bit-compatible)
+def rgb_to_hsv_batch(inp):
+    cmax = np.maximum(inp[..., 0], np.maximum(inp[..., 1], inp[..., 2]))
+    cmin = np.minimum(inp[..., 0], np.minimum(inp[..., 1], inp[..., 2]))
+    cdelta = cmax - cmin
+
+    v = cmax
+
+    # saturation (0 where cmax is 0)
+    nonzero = cmax != 0.
+    s = np.where(nonzero, cdelta / np.where(nonzero, cmax, 1.), 0.)
+
+    # hue (0 where saturation is 0)
+    has_hue = s != 0.
+    c = (-inp + cmax[..., np.newaxis]) \
+        / np.where(has_hue, cdelta, 1.)[..., np.newaxis]
+
+    h = np.where(
+        inp[..., 0] == cmax,
+        c[..., 2] - c[..., 1],
+        np.where(
+            inp[..., 1] == cmax,
+            2. + c[..., 0] - c[..., 2],
+            4. + c[..., 1] - c[..., 0]
+        )
+    )
+
+    h /= 6.
+
+    h = np.where(h < 0., h + 1., h)
+    h = np.where(has_hue, h, 0.)
+
+    return np.stack([h, s, v], axis=-1)
+
+
+# same as hsv_to_rgb, but for (..., 3) arrays (bit-compatible)
+def hsv_to_rgb_batch(inp):
+    h = inp[..., 0]
+    s = inp[..., 1]
+    v = inp[..., 2]
+
+    h = np.where(h == 1., 0., h)
+
+    h = h * 6.
+    i = np.floor(h)
+    f = h - i
+    p = v * (1. - s)
+    q = v * (1. - (s * f))
+    t = v * (1. - (s * (1. - f)))
+
+    # pick the sector, the last one is the fallback like in hsv_to_rgb
+    out = np.select(
+        [
+            (i == 0.)[..., np.newaxis],
+            (i == 1.)[..., np.newaxis],
+            (i == 2.)[..., np.newaxis],
+            (i == 3.)[..., np.newaxis],
+            (i == 4.)[..., np.newaxis]
+        ],
+        [
+            np.stack([v, t, p], axis=-1),
+            np.stack([q, v, p], axis=-1),
+            np.stack([p, v, t], axis=-1),
+            np.stack([p, q, v], axis=-1),
+            np.stack([t, p, v], axis=-1)
+        ],
+        np.stack([v, p, q], axis=-1)
+    )
+
+    # no saturation
+    return np.where(
+        (s == 0.)[..., np.newaxis],
+        np.stack([v, v, v], axis=-1),
+        out
+    )
+
+
+# same as rgb_adjust_hsv, but for (..., 3) arrays (bit-compatible). hue, sat
+# and value can also be arrays that broadcast against (..., 1).
+def rgb_adjust_hsv_batch(inp, hue, sat, value):
+    hsv = rgb_to_hsv_batch(inp)
+
+    hsv[..., 0:1] = np.modf(hsv[..., 0:1] + hue + .5)[0]
+    hsv[..., 1:2] = np.clip(hsv[..., 1:2] * sat, 0, 1)
+    hsv[..., 2:3] = hsv[..., 2:3] * value
+
+    return hsv_to_rgb_batch(hsv)
+
+
 def rgb_sum(inp):
     return inp[0] + inp[1] + inp[2]
 
@@ -169,6 +262,11 @@ def rgb_min(inp):
     return min(min(inp[0], inp[1]), inp[2])
 
 
+def rgb_dot(inp, weights):
+    # dot product over the last axis, kept as a size-1 axis for broadcasting
+    return np.sum(inp * weights, axis=-1, keepdims=True)
+
+
 def rgb_uniform_offset(inp, black_point, white_point, luminance_weights_norm):
     mono = np.dot(inp, luminance_weights_norm)
 
@@ -183,11 +281,35 @@ def rgb_uniform_offset(inp, black_point, white_point, luminance_weights_norm):
     ) / mono
 
 
+# same as rgb_uniform_offset, but for (..., 3) arrays
+def rgb_uniform_offset_batch(
+    inp,
+    black_point,
+    white_point,
+    luminance_weights_norm
+):
+    mono = rgb_dot(inp, luminance_weights_norm)
+
+    # avoid division by zero
+    small = np.abs(mono) < .0001
+    safe_mono = np.where(small, 1., mono)
+
+    out = inp * remap01(
+        mono,
+        np.minimum(black_point, .999, dtype=inp.dtype),
+        1. - np.minimum(white_point, .999, dtype=inp.dtype)
+    ) / safe_mono
+
+    return np.where(small, inp, out)
+
+
+# works on scalars and arrays of any shape. sigmoid_params are precomputed
+# super_sigmoid parameters (see super_sigmoid_params).
 def dye_mix_factor(
     mono,
     log2_min,
     log2_max,
-    sigmoid_points,
+    sigmoid_params: SuperSigmoidParams,
     max_density
 ):
 
@@ -196,13 +318,7 @@ def dye_mix_factor(
     fac = remap01(np.log2(mono + offset), log2_min, log2_max)
 
     # calculate amount of exposure from 0 to 1
-    fac = super_sigmoid(
-        fac,
-        toe_x=sigmoid_points[0],
-        toe_y=sigmoid_points[1],
-        shoulder_x=sigmoid_points[2],
-        shoulder_y=sigmoid_points[3]
-    )
+    fac = super_sigmoid_from_params(fac, sigmoid_params)
 
     # calculate dye density
     fac *= max_density
@@ -214,26 +330,121 @@ def dye_mix_factor(
     return np.clip(fac, 0., 1.)
 
 
+# dye_mix_factor as a function of the log2 exposure remapped to [0, 1], which
+# is all of dye_mix_factor after remap01
+def dye_mix_factor_remapped(fac, sigmoid_params: SuperSigmoidParams, max_density):
+    fac = super_sigmoid_from_params(fac, sigmoid_params)
+    return np.clip(2. ** (-(fac * max_density)), 0., 1.)
+
+
+# a table of dye_mix_factor_remapped at evenly spaced points in [0, 1] for
+# dye_mix_factor_lookup. the error of linear interpolation with a spacing of h
+# is at most h^2 / 8 * max|f''|, so the size is derived from the largest
+# second derivative, estimated from second differences on a grid of
+# curvature_points (with a 5% margin). returns (values, slopes between them,
+# max error measured at 8 points per interval, an estimate below the bound),
+# or None if the bound can't be met: with toe_pow or shoulder_pow below 2
+# (except 1, a straight segment), f'' is unbounded at 0 or 1, and the size is
+# limited to max_size. the caller should evaluate dye_mix_factor exactly then.
+# tables are cached, since they only depend on the arguments.
+@functools.lru_cache(maxsize=64)
+def dye_mix_table(
+    sigmoid_params: SuperSigmoidParams,
+    max_density,
+    max_error,
+    min_size: int = 256,
+    max_size: int = 2**20,
+    curvature_points: int = 2**18
+):
+    for power in [sigmoid_params.toe_pow, sigmoid_params.shoulder_pow]:
+        if not (power == 1. or 2. <= power < np.inf):
+            return None
+
+    fine = dye_mix_factor_remapped(
+        np.linspace(0., 1., curvature_points + 1),
+        sigmoid_params,
+        max_density
+    )
+    curvature = 1.05 * np.max(np.abs(np.diff(fine, 2))) * curvature_points**2
+
+    intervals = int(np.ceil(np.sqrt(curvature / (8. * max_error))))
+    size = max(intervals + 1, min_size)
+    if size > max_size:
+        return None
+
+    values = dye_mix_factor_remapped(
+        np.linspace(0., 1., size),
+        sigmoid_params,
+        max_density
+    )
+    slopes = np.diff(values)
+
+    check = np.linspace(0., 1., (size - 1) * 8 + 1)
+    error = np.max(np.abs(
+        lookup_uniform(values, slopes, check)
+        - dye_mix_factor_remapped(check, sigmoid_params, max_density)
+    ))
+
+    values.flags.writeable = False
+    slopes.flags.writeable = False
+    return values, slopes, float(error)
+
+
+# linear interpolation in a table of values at evenly spaced points in [0, 1]
+# with the slopes between them (np.diff of the values). faster than np.interp,
+# which searches for the interval of every sample.
+def lookup_uniform(values, slopes, fac):
+    pos = fac * (values.shape[0] - 1)
+    i = pos.astype(np.intp)
+    pos -= i
+
+    # indices out of range (fac = 1 or NaN) are clipped
+    out = np.take(slopes, i, mode='clip')
+    out *= pos
+    out += np.take(values, i, mode='clip')
+    return out
+
+
+# same as dye_mix_factor, but interpolated from a dye_mix_table instead of
+# evaluating the sigmoid and the density (for arrays)
+def dye_mix_factor_lookup(mono, log2_min, log2_max, values, slopes):
+    offset = 2.**log2_min
+    fac = remap01(np.log2(mono + offset), log2_min, log2_max)
+    return lookup_uniform(values, slopes, fac).astype(fac.dtype, copy=False)
+
+
+# normalize the tones of film layers (see film_layers) for rgb_color_layer
+def normalize_film_layers(layers):
+    out = []
+    for sensitivity_tone, dye_tone in layers:
+        sensitivity_tone_norm = sensitivity_tone / rgb_sum(sensitivity_tone)
+        dye_tone_norm = dye_tone / rgb_max(dye_tone)
+
+        sensitivity_tone_norm.flags.writeable = False
+        dye_tone_norm.flags.writeable = False
+
+        out.append((sensitivity_tone_norm, dye_tone_norm))
+
+    return tuple(out)
+
+
+# the tones must be normalized (see normalize_film_layers)
 def rgb_color_layer(
     inp,
-    sensitivity_tone,
-    dye_tone,
+    sensitivity_tone_norm,
+    dye_tone_norm,
     log2_min,
     log2_max,
-    sigmoid_points,
+    sigmoid_params: SuperSigmoidParams,
     max_density
 ):
-    # normalize
-    sensitivity_tone_norm = sensitivity_tone / rgb_sum(sensitivity_tone)
-    dye_tone_norm = dye_tone / rgb_max(dye_tone)
-
     # dye mix factor
     mono = np.dot(inp, sensitivity_tone_norm)
     mix = dye_mix_factor(
         mono,
         log2_min,
         log2_max,
-        sigmoid_points,
+        sigmoid_params,
         max_density
     )
 
@@ -241,53 +452,126 @@ def rgb_color_layer(
     return lerp(dye_tone_norm, white, mix)
 
 
+# exposure_mul is the exposure as a multiplier (2 to the power of stops) and
+# film_layers must be normalized (see normalize_film_layers)
 def rgb_develop(
     inp,
-    exposure,
+    exposure_mul,
+    film_layers,
     log2_min,
     log2_max,
-    sigmoid_points,
+    sigmoid_params: SuperSigmoidParams,
     max_density
 ):
     # exposure
-    inp *= 2.**exposure
+    inp *= exposure_mul
 
     # blue-sensitive layer
     out = rgb_color_layer(
         inp,
-        blue,
-        yellow,
+        film_layers[0][0],
+        film_layers[0][1],
         log2_min,
         log2_max,
-        sigmoid_points,
+        sigmoid_params,
         max_density
     )
 
     # green-sensitive layer
     out *= rgb_color_layer(
         inp,
-        green,
-        magenta,
+        film_layers[1][0],
+        film_layers[1][1],
         log2_min,
         log2_max,
-        sigmoid_points,
+        sigmoid_params,
         max_density
     )
 
     # red-sensitive layer
     out *= rgb_color_layer(
         inp,
-        red,
-        cyan,
+        film_layers[2][0],
+        film_layers[2][1],
         log2_min,
         log2_max,
-        sigmoid_points,
+        sigmoid_params,
         max_density
     )
 
     return out
 
 
+# sensitivity and dye matrices of film layers (normalized, see
+# normalize_film_layers) for rgb_develop_batch. row i of each matrix is the
+# sensitivity/dye tone of layer i.
+def film_layer_mats(layers):
+    sensitivity_mat = np.array([sensitivity for sensitivity, _ in layers])
+    dye_mat = np.array([dye for _, dye in layers])
+
+    sensitivity_mat.flags.writeable = False
+    dye_mat.flags.writeable = False
+
+    return sensitivity_mat, dye_mat
+
+
+# same as rgb_develop, but for (..., 3) arrays (doesn't modify the input).
+# the three layers are fused: one matrix product gives the exposures of all
+# layers, dye_mix_factor runs once on all of them, and the dye colors of the
+# layers are multiplied together. sensitivity_mat and dye_mat come from
+# film_layer_mats. if dye_mix_max_error is given, the dye mix factors are
+# interpolated from a dye_mix_table with that error instead (if there is
+# one, see dye_mix_table).
+# the fusion keeps the operations of every layer in the same order, so the
+# result is bit-identical to developing the layers one by one with array
+# operations. it differs from rgb_develop by rounding only (up to about 1e-15)
+# because NumPy's vectorized power and sigmoid don't round exactly like the
+# scalar ones, which is far below what a LUT can store.
+def rgb_develop_batch(
+    inp,
+    exposure_mul,
+    sensitivity_mat,
+    dye_mat,
+    log2_min,
+    log2_max,
+    sigmoid_params: SuperSigmoidParams,
+    max_density,
+    dye_mix_max_error=None
+):
+    # exposure of every layer, (..., layer)
+    exposure = np.matmul(inp * exposure_mul, sensitivity_mat.T)
+
+    # dye mix factor of every layer, (..., layer, 1)
+    table = None
+    if dye_mix_max_error is not None:
+        table = dye_mix_table(sigmoid_params, max_density, dye_mix_max_error)
+
+    if table is None:
+        mix = dye_mix_factor(
+            exposure,
+            log2_min,
+            log2_max,
+            sigmoid_params,
+            max_density
+        )
+    else:
+        values, slopes, _ = table
+        mix = dye_mix_factor_lookup(
+            exposure,
+            log2_min,
+            log2_max,
+            values,
+            slopes
+        )
+    mix = mix[..., np.newaxis]
+
+    # dye mixing, (..., layer, channel)
+    layers = dye_mat + mix * (1. - dye_mat)
+
+    # combine the blue-, green- and red-sensitive layers
+    return layers[..., 0, :] * layers[..., 1, :] * layers[..., 2, :]
+
+
 def gamut_extension_mat_row(primary_hue, scale, rotate, mul):
     out = hsv_to_rgb(np.array([
         wrap(primary_hue + (rotate / 360.), 0., 1.),
@@ -317,3 +601,23 @@ def gamut_extension_mat(
             1.0 / 3.0, green_scale, green_rot, green_mul),
         gamut_extension_mat_row(2.0 / 3.0, blue_scale, blue_rot, blue_mul)
     ])
+
+
+# same as gamut_extension_mat, but for many matrices at once (bit-compatible).
+# scale, rotate and mul are (..., 3) arrays of the red, green and blue values,
+# the output has the shape (..., 3, 3).
+def gamut_extension_mat_batch(scale, rotate, mul):
+    scale = np.asarray(scale, dtype=np.float64)
+    rotate = np.asarray(rotate, dtype=np.float64)
+    mul = np.asarray(mul, dtype=np.float64)
+
+    primary_hue = np.array([0.0, 1.0 / 3.0, 2.0 / 3.0])
+    out = hsv_to_rgb_batch(np.stack([
+        wrap(primary_hue + (rotate / 360.), 0., 1.),
+        1. / scale,
+        np.ones(scale.shape)
+    ], axis=-1))
+
+    out /= (out[..., 0] + out[..., 1] + out[..., 2])[..., np.newaxis]
+    out *= mul[..., np.newaxis]
+    return out